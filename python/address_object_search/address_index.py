@@ -0,0 +1,106 @@
+"""Index the address objects and groups collected from Panorama.
+
+This module builds lookup tables over the output of `grab_config()` once,
+so that any number of searches can be answered without rescanning every
+address object and address group.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2022 Calvin Remsburg
+"""
+# standard library imports
+from collections import defaultdict, deque
+
+
+# ----------------------------------------------------------------------------
+# Index of address objects and the groups they are nested in
+# ----------------------------------------------------------------------------
+class AddressIndex:
+    """
+    Description: lookup tables built from the `grab_config` tuples.
+    Workflow:
+        1. Map every address object value and name to its object tuples.
+        2. Map every group member name to the groups that contain it, which
+           covers both object → group and group → group relationships.
+    Attributes:
+        - name: objects
+          type: dict, value or name → list of address object tuples
+        - name: parents
+          type: dict, member name → list of address group tuples
+    """
+
+    def __init__(self, address_groups, address_objects):
+        self.objects = defaultdict(list)
+        self.parents = defaultdict(list)
+
+        # an object can be found either by its value or by its name
+        for each in address_objects:
+            self.objects[each[2]].append(each)
+            if each[1] != each[2]:
+                self.objects[each[1]].append(each)
+
+        # each member of a static group points back at the group
+        for group in address_groups:
+            for member in group[3]:
+                self.parents[member].append(group)
+
+    def lookup(self, search):
+        """
+        Description: return the address objects matching a value or name.
+        Return:
+            - name: objects
+              type: list
+        """
+        return self.objects.get(search, [])
+
+    def expand(self, names):
+        """
+        Description: walk up the group hierarchy from a set of member names.
+        Workflow:
+            1. Seed a queue with the names of the matched objects.
+            2. Pop a name, append every group containing it that has not been
+               visited yet, and queue that group's name in turn.
+            3. Stop when the queue is empty; any depth of nesting is covered
+               and every group is reported once.
+        Return:
+            - name: associations
+              type: list
+        """
+        associations = []
+        visited = set()
+        queue = deque(names)
+        seen_names = set(names)
+
+        while queue:
+            name = queue.popleft()
+            for group in self.parents.get(name, ()):
+                key = (group[0], group[1])
+                if key in visited:
+                    continue
+                visited.add(key)
+                associations.append(group)
+                if group[1] not in seen_names:
+                    seen_names.add(group[1])
+                    queue.append(group[1])
+
+        return associations
+
+    def search(self, search):
+        """
+        Description: find all associations of an address object.
+        Return:
+            - name: associations
+              type: list, or None when no address object matched
+        """
+        matches = self.lookup(search)
+        if not matches:
+            return None
+        return self.expand(dict.fromkeys(each[1] for each in matches))
@@ -16,32 +16,76 @@ limitations under the License.
 (c) 2022 Calvin Remsburg
 """
 # standard library imports
+import argparse
+import csv
+import logging
 import os
+import sys
 
-# third party library imports
-import argparse
-import pandas as pd
-from tabulate import tabulate
-from dotenv import load_dotenv
+# local imports
+from address_index import AddressIndex
+from cidr_index import CidrIndex
+from object_analysis import REPORT_HEADERS, ObjectAnalysis, parse_rule_references
+
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.concurrency import DevicePool, map_bounded  # noqa
+from common.hierarchy import get_parents  # noqa
+from common.snapshot import SnapshotStore, changed_locations, latest_change  # noqa
+from common.table import render_table  # noqa
+from common.xpath import entry as entry_xpath  # noqa
 
-# Palo Alto Networks imports
-from panos.panorama import Panorama, DeviceGroup
-from panos.objects import AddressObject, AddressGroup
+# pan-os-python, requests and the HTTP server of `--serve` take longer to
+# import than the rest of the script runs when the snapshot is fresh, so
+# they are only imported by the functions that need them
 
 # ----------------------------------------------------------------------------
 # Look in our .env file on our computer to locate our credientials
 # ----------------------------------------------------------------------------
-load_dotenv(".env")
+if os.path.exists(".env"):
+    from dotenv import load_dotenv
+
+    load_dotenv(".env")
 PANURL = os.environ.get("PANURL", "panorama.lab")
 PANUSER = os.environ.get("PANUSER", "automation")
 PANPASS = os.environ.get("PANPASS", "mysecretpassword")
-pan = Panorama(PANURL, PANUSER, PANPASS)
+_pan = None
+
+# address object types, in the order pan-os-python evaluates them
+ADDRESS_TYPES = ("ip-netmask", "ip-range", "ip-wildcard", "fqdn")
+
+# device groups are stored under the `localhost.localdomain` device entry
+DEVICE_GROUP_XPATH = "/config/devices/entry[@name='localhost.localdomain']/device-group"
+
+
+# ----------------------------------------------------------------------------
+# Function to connect to Panorama on first use
+# ----------------------------------------------------------------------------
+def get_pan():
+    """
+    Description: return the Panorama instance, creating it on first use.
+    Workflow:
+        1. Create the `ApiClient`, which caches the API key between runs
+           and sends requests over pooled connections.
+        2. Keep its Panorama device for the next calls; nothing is sent
+           until the first request.
+    Return:
+        - name: pan
+          type: Panorama
+    """
+    global _pan
+    if _pan is None:
+        from common.client import ApiClient
+        from panos.panorama import Panorama
+
+        _pan = ApiClient(PANURL, PANUSER, PANPASS).device(Panorama)
+    return _pan
 
 
 # ----------------------------------------------------------------------------
 # Function to grab Panorama configuration objects
 # ----------------------------------------------------------------------------
-def grab_config():
+def grab_config(workers=1, retries=3, parser="panos"):
     """
     Description: collect configuration objects from Panorama.
     Workflow:
@@ -51,7 +95,67 @@ def grab_config():
             - Address Objects
         2. Identify all address objects and append them to "address_objects"
         3. Identify all address groups and append them to "address_groups"
-        4. Loop over device groups and perform steps 2 & 3 again.
+        4. Loop over device groups and perform steps 2 & 3 again, fetching up
+           to `workers` device groups at once when `workers` is above one.
+        With `parser` set to "fast", steps 2 and 3 read the XML entries
+        directly instead of building pan-os-python objects.
+    Return:
+        - name: address_groups
+          type: tuple
+        - name: address_objects
+          type: tuple
+    """
+
+    from panos.panorama import DeviceGroup
+
+    # start with the shared configuration objects
+    pan = get_pan()
+    address_groups, address_objects = grab_location(pan, "Shared", parser)
+
+    # pull down list of device groups, their names are all we need
+    device_groups = DeviceGroup.refreshall(pan, name_only=True)
+
+    # fetch the device groups concurrently, each worker on its own connection
+    if workers > 1:
+        pool = DevicePool(pan)
+
+        def grab_device_group(name):
+            dg = DeviceGroup(name)
+            pool.get().add(dg)
+            return grab_location(dg, name, parser)
+
+        results = map_bounded(
+            grab_device_group,
+            [dg.name for dg in device_groups],
+            workers=workers,
+            retries=retries,
+        )
+
+    # otherwise loop over device groups and perform the same actions
+    else:
+        results = (grab_location(dg, dg.name, parser) for dg in device_groups)
+
+    # results come back in device group order either way
+    for dg_address_groups, dg_address_objects in results:
+        address_groups.extend(dg_address_groups)
+        address_objects.extend(dg_address_objects)
+
+    # return our address_groups and address_objects to the main function
+    return address_groups, address_objects
+
+
+# ----------------------------------------------------------------------------
+# Function to grab the configuration objects of a single location
+# ----------------------------------------------------------------------------
+def grab_location(parent, location, parser="panos"):
+    """
+    Description: collect the configuration objects of Shared or a device group.
+    Workflow:
+        1. Identify all address objects of `parent` and append them to
+           "address_objects", tagged with `location`
+        2. Identify all address groups of `parent` and append them to
+           "address_groups", tagged with `location`
+        With `parser` set to "fast", `grab_location_fast` does both steps.
     Return:
         - name: address_groups
           type: tuple
@@ -59,103 +163,421 @@ def grab_config():
           type: tuple
     """
 
+    if parser == "fast":
+        return grab_location_fast(parent, location)
+
+    from panos.objects import AddressObject, AddressGroup
+
     # load Panorama configuration objects
-    pan_address_objects = AddressObject.refreshall(pan)
-    pan_address_groups = AddressGroup.refreshall(pan)
+    pan_address_objects = AddressObject.refreshall(parent)
+    pan_address_groups = AddressGroup.refreshall(parent)
 
     # create empty placeholders
     address_objects = []
     address_groups = []
 
-    # append shared config address objects
+    # append address objects
     for each in pan_address_objects:
-        address_objects.append(("Shared", each.name, each.value, each.type))
+        address_objects.append((location, each.name, each.value, each.type))
 
-    # append shared config address groups
+    # append address groups
     for each in pan_address_groups:
         if each.static_value:
             if not each.description:
                 each.description = ""
             address_groups.append(
-                ("Shared", each.name, each.description, each.static_value)
+                (location, each.name, each.description, each.static_value)
             )
 
-    # pull down list of device groups
-    device_groups = DeviceGroup.refreshall(pan)
-
-    # loop over device groups and perform the same actions
-    for dg in device_groups:
-
-        # start with address objects
-        dg_address_objects = AddressObject.refreshall(dg)
-        for each in dg_address_objects:
-            address_objects.append((dg.name, each.name, each.value, each.type))
-
-        # finish with address groups
-        dg_address_groups = AddressGroup.refreshall(dg)
-        for each in dg_address_groups:
-            if each.static_value:
-                if not each.description:
-                    each.description = ""
-                address_groups.append(
-                    (dg.name, each.name, each.description, each.static_value)
-                )
+    return address_groups, address_objects
+
+
+# ----------------------------------------------------------------------------
+# Function to grab the configuration objects of a location from the raw XML
+# ----------------------------------------------------------------------------
+def grab_location_fast(parent, location):
+    """
+    Description: collect the configuration objects of a location without
+    building pan-os-python objects.
+    Workflow:
+        1. `get` the address objects, then the address groups, of the
+           location, through the device `parent` is attached to.
+        2. Parse both responses with `parse_location`, reading only the
+           fields the search needs, into the tuples of `grab_location`.
+    Return:
+        - name: address_groups
+          type: tuple
+        - name: address_objects
+          type: tuple
+    """
+    xpath = "/config/shared"
+    if location != "Shared":
+        xpath = f"{DEVICE_GROUP_XPATH}/{entry_xpath(location)}"
+    device = parent.nearest_pandevice()
+
+    # create empty placeholders
+    address_objects = []
+    address_groups = []
+
+    # each response holds the list under `result`, as the scope would
+    for container in ("address", "address-group"):
+        response = device.xapi.get(f"{xpath}/{container}")
+        parse_location(
+            response.find("./result"), location, address_groups, address_objects
+        )
+
+    return address_groups, address_objects
+
+
+# ----------------------------------------------------------------------------
+# Function to grab Panorama configuration objects with a single API call
+# ----------------------------------------------------------------------------
+def grab_config_bulk(config_source="candidate"):
+    """
+    Description: collect configuration objects from Panorama in one request.
+    Workflow:
+        1. Pull the entire candidate (`get`) or running (`show`) configuration.
+        2. Parse the shared address objects and groups out of the XML document.
+        3. Loop over every device group in the document and repeat step 2.
+    Return:
+        - name: address_groups
+          type: tuple
+        - name: address_objects
+          type: tuple
+    """
+
+    # a single `get` or `show` request replaces the 2 + 2N refreshall calls
+    pan = get_pan()
+    if config_source == "running":
+        response = pan.xapi.show("/config")
+    else:
+        response = pan.xapi.get("/config")
+    config = response.find("./result/config")
+
+    # create empty placeholders
+    address_objects = []
+    address_groups = []
+
+    # the shared scope lives directly under the root of the configuration
+    parse_location(config.find("./shared"), "Shared", address_groups, address_objects)
+
+    # device groups are stored under the `localhost.localdomain` device entry
+    for dg in config.findall(
+        "./devices/entry[@name='localhost.localdomain']/device-group/entry"
+    ):
+        parse_location(dg, dg.get("name"), address_groups, address_objects)
 
     # return our address_groups and address_objects to the main function
     return address_groups, address_objects
 
 
+# ----------------------------------------------------------------------------
+# Function to parse address objects and groups out of a configuration scope
+# ----------------------------------------------------------------------------
+def parse_location(element, location, address_groups, address_objects):
+    """
+    Description: parse the address objects and groups of a single scope.
+    Workflow:
+        1. Append each `address` entry to "address_objects", taking the value
+           from the first populated type element, as pan-os-python does.
+        2. Append each static `address-group` entry to "address_groups".
+    Return:
+        - None, both lists are updated in place
+    """
+
+    # nothing to do when the scope has no configuration at all
+    if element is None:
+        return
+
+    for entry in element.findall("./address/entry"):
+        for address_type in ADDRESS_TYPES:
+            value = entry.find(address_type)
+            if value is not None:
+                address_objects.append(
+                    (location, entry.get("name"), value.text, address_type)
+                )
+                break
+        else:
+            address_objects.append((location, entry.get("name"), None, None))
+
+    for entry in element.findall("./address-group/entry"):
+        static_value = [member.text for member in entry.findall("./static/member")]
+        if static_value:
+            address_groups.append(
+                (
+                    location,
+                    entry.get("name"),
+                    entry.findtext("description") or "",
+                    static_value,
+                )
+            )
+
+
+# ----------------------------------------------------------------------------
+# Function to grab Panorama configuration objects through the snapshot cache
+# ----------------------------------------------------------------------------
+def grab_config_cached(
+    store,
+    ttl,
+    bulk=False,
+    config_source="candidate",
+    workers=1,
+    retries=3,
+    parser="panos",
+):
+    """
+    Description: collect configuration objects, reusing an on-disk snapshot.
+    Workflow:
+        1. Return the snapshot as is when it is younger than `ttl` seconds.
+        2. Otherwise ask the configuration log which locations changed since
+           the snapshot was taken, and refetch only those locations.
+        3. Fall back to a full `grab_config` (or `grab_config_bulk`) when
+           there is no snapshot yet or the log cannot tell what changed.
+    Return:
+        - name: address_groups
+          type: tuple
+        - name: address_objects
+          type: tuple
+    """
+
+    if store.is_fresh("address", ttl) and store.is_fresh("address-group", ttl):
+        return store.load("address-group"), store.load("address")
+
+    # try an incremental refresh driven by the configuration log
+    pan = get_pan()
+    changed = None
+    watermark = store.watermark("address")
+    if watermark and store.age("address-group") is not None:
+        changed, watermark = changed_locations(pan, watermark)
+
+    if changed is None:
+        # take the watermark first, so changes made while we fetch are not lost
+        watermark = latest_change(pan)
+        if bulk:
+            address_groups, address_objects = grab_config_bulk(config_source)
+        else:
+            address_groups, address_objects = grab_config(workers, retries, parser)
+        store.replace("address-group", address_groups)
+        store.replace("address", address_objects)
+    else:
+        for location in sorted(changed):
+            parent = pan
+            if location != "Shared":
+                from panos.panorama import DeviceGroup
+
+                parent = DeviceGroup(location)
+                pan.add(parent)
+            address_groups, address_objects = grab_location(parent, location, parser)
+            store.save("address-group", location, address_groups)
+            store.save("address", location, address_objects)
+
+    store.mark_synced("address-group", watermark)
+    store.mark_synced("address", watermark)
+    return store.load("address-group"), store.load("address")
+
+
 # ----------------------------------------------------------------------------
 # Function to map associations between address objects and their parent groups
 # ----------------------------------------------------------------------------
-def find_matches(address_groups, address_objects, search):
+def find_matches(address_groups, address_objects, search, index=None):
     """
     Description: Find all associations of an address object.
     Workflow:
-        1. Loop over our address_objects and update `match` when the prefix is matched.
-        2. Use the match's object name to see if it resides in an address_group object.
-        3. Repeat for of the address group name to see if it's nested in another group.
+        1. Build an `AddressIndex` from our configuration objects, unless one
+           was already built by the caller.
+        2. Look up the address objects whose value or name matches `search`.
+        3. Walk the index breadth-first to collect every group the matches
+           are nested in, at any depth and without duplicates.
     Return:
         - name: associations
           type: list
     """
 
-    # create a placeholder for our potential match
-    match = {}
+    # build the lookup tables once; callers with many searches pass their own
+    if index is None:
+        index = AddressIndex(address_groups, address_objects)
 
-    # loop over the address objects, update our match object if value is found
-    for each in address_objects:
-        if search in each:
-            match["source"] = each[0]
-            match["name"] = each[1]
+    return index.search(search)
 
-    # if no match was found, return message to user
-    if "name" in match:
 
-        # create a placeholder for our potential groups
-        associations = []
+# ----------------------------------------------------------------------------
+# Function to find address objects covering or overlapping an IP or subnet
+# ----------------------------------------------------------------------------
+def find_cidr_matches(index, cidr_index, search, mode="covering"):
+    """
+    Description: Find address objects by address space rather than by value.
+    Workflow:
+        1. Ask the `CidrIndex` for the `ip-netmask` and `ip-range` objects that
+           cover (or, in `overlap` mode, share any address with) `search`.
+        2. Walk the `AddressIndex` to collect every group those objects are
+           nested in.
+    Return:
+        - name: matches
+          type: list of address object tuples, or None when nothing matched
+        - name: associations
+          type: list
+    """
+    if mode == "overlap":
+        matches = cidr_index.overlapping(search)
+    else:
+        matches = cidr_index.covering(search)
 
-        # loop over the address groups
-        for each in address_groups:
+    if not matches:
+        return None, []
 
-            # if there is a positive match, then update our associations object
-            if match["name"] in each[3]:
-                associations.append(each)
+    return matches, index.expand(dict.fromkeys(each[1] for each in matches))
 
-        # let's finally loop over our associations object to see if a group is nested
-        for each in associations:
 
-            # loop over our address_groups object again, looking to find a match
-            for group in address_groups:
+# ----------------------------------------------------------------------------
+# Function to grab the address references of security and NAT rules
+# ----------------------------------------------------------------------------
+def grab_rule_references(workers=1, retries=3, bulk=False, config_source="candidate"):
+    """
+    Description: collect the address names every security and NAT rule uses.
+    Workflow:
+        1. `get` the pre- and post-rulebase of Shared and of each device
+           group, fetching up to `workers` device groups at once when
+           `workers` is above one.
+        2. With `bulk`, pull the whole configuration in one request instead,
+           as `grab_config_bulk` does.
+        3. Parse the rules with `parse_rule_references`, reading the XML
+           directly rather than building pan-os-python rule objects.
+    Return:
+        - name: rule_references
+          type: list of (location, rulebase, rule type, rule name, names)
+    """
 
-                # append when we see the name of our address group matched in another address group
-                if each[1] in group[3]:
-                    associations.append(group)
+    pan = get_pan()
+    rule_references = []
+
+    if bulk:
+        if config_source == "running":
+            response = pan.xapi.show("/config")
+        else:
+            response = pan.xapi.get("/config")
+        config = response.find("./result/config")
+        parse_rule_references(config.find("./shared"), "Shared", rule_references)
+        for dg in config.findall(
+            "./devices/entry[@name='localhost.localdomain']/device-group/entry"
+        ):
+            parse_rule_references(dg, dg.get("name"), rule_references)
+        return rule_references
+
+    from panos.panorama import DeviceGroup
+
+    def grab_rules(device, location):
+        xpath = "/config/shared"
+        if location != "Shared":
+            xpath = f"{DEVICE_GROUP_XPATH}/{entry_xpath(location)}"
+        references = []
+        # each response holds the rulebase under `result`, as the scope would
+        for rulebase in ("pre-rulebase", "post-rulebase"):
+            response = device.xapi.get(f"{xpath}/{rulebase}")
+            parse_rule_references(response.find("./result"), location, references)
+        return references
+
+    locations = ["Shared"] + [
+        dg.name for dg in DeviceGroup.refreshall(pan, name_only=True)
+    ]
+    if workers > 1:
+        pool = DevicePool(pan)
+        results = map_bounded(
+            lambda location: grab_rules(pool.get(), location),
+            locations,
+            workers=workers,
+            retries=retries,
+        )
+    else:
+        results = (grab_rules(pan, location) for location in locations)
 
-        return associations
+    for references in results:
+        rule_references.extend(references)
+    return rule_references
 
-    else:
-        return None
+
+# ----------------------------------------------------------------------------
+# Function to report unused, duplicate and shadowed address objects
+# ----------------------------------------------------------------------------
+def analyze(args):
+    """
+    Description: cross-reference address objects with every rule.
+    Workflow:
+        1. Load the address objects and groups as a search would, then the
+           rule references and the device group hierarchy.
+        2. Build an `ObjectAnalysis` and write its findings to `--report`.
+        3. Print how many findings of each kind were written.
+    """
+    address_groups, address_objects = load_config(args)
+    rule_references = grab_rule_references(
+        args.workers, args.retries, args.bulk, args.config_source
+    )
+    analysis = ObjectAnalysis(
+        address_groups, address_objects, rule_references, get_parents(get_pan())
+    )
+    findings = analysis.findings()
+
+    with open(args.report, "w", newline="") as report:
+        writer = csv.writer(report)
+        writer.writerow(REPORT_HEADERS)
+        writer.writerows(findings)
+
+    counts = {kind: 0 for kind in ("unused", "duplicate", "shadowed")}
+    for finding in findings:
+        counts[finding[0]] += 1
+    print(
+        f"Analyzed {len(address_objects)} address objects and "
+        f"{len(address_groups)} address groups against "
+        f"{len(rule_references)} rules"
+    )
+    print(render_table(list(counts.items()), ["Finding", "Count"]))
+    print(f"Findings written to {args.report}")
+
+
+# ----------------------------------------------------------------------------
+# Function to print a list of tuples as a table
+# ----------------------------------------------------------------------------
+def print_table(rows):
+    """
+    Description: print rows to the console as a table, numbering them.
+    """
+    print(render_table(rows))
+
+
+# ----------------------------------------------------------------------------
+# Function to load the configuration objects the way the arguments ask for
+# ----------------------------------------------------------------------------
+def load_config(args, ttl=None):
+    """
+    Description: collect configuration objects with the chosen method.
+    Workflow:
+        1. Use `grab_config_cached` when `--cache` was passed, with `ttl`
+           instead of `--cache-ttl` when given.
+        2. Otherwise use `grab_config_bulk` when `--bulk` was passed, or
+           `grab_config`.
+    Return:
+        - name: address_groups
+          type: tuple
+        - name: address_objects
+          type: tuple
+    """
+    if args.cache:
+        # the snapshot is opened by the calling thread, as SQLite requires
+        store = SnapshotStore(args.cache, PANURL)
+        try:
+            return grab_config_cached(
+                store,
+                args.cache_ttl if ttl is None else ttl,
+                args.bulk,
+                args.config_source,
+                args.workers,
+                args.retries,
+                args.parser,
+            )
+        finally:
+            store.close()
+    if args.bulk:
+        return grab_config_bulk(args.config_source)
+    return grab_config(args.workers, args.retries, args.parser)
 
 
 # ----------------------------------------------------------------------------
@@ -165,32 +587,159 @@ def main():
     """
     Description: Main execution of our script.
     Workflow:
-        1. Retrieve the prefix passed as an argument from the user
-        2. Call the `grab_config` function to retrieve configuration objects
-        3. Pass our prefix and lists objects into `find_matches`
+        1. Retrieve the prefixes passed as arguments from the user
+        2. Call the `grab_config` function to retrieve configuration objects,
+           `grab_config_bulk` when `--bulk` was passed, or `grab_config_cached`
+           when `--cache` was passed
+        3. Build an index of the objects and pass each prefix into `find_matches`
         4. Print result to console
+        With `--serve`, steps 2 and 3 are repeated in the background by a
+        `QueryService` instead, which answers searches over HTTP. With
+        `--analyze`, `analyze` reports unused, duplicate and shadowed
+        objects instead of searching.
     """
     # create instance of argparse, asking for `--prefix` to be passed at run
     parser = argparse.ArgumentParser()
-    parser.add_argument("--prefix", type=str, required=True)
+    parser.add_argument(
+        "--prefix",
+        type=str,
+        action="append",
+        help="value to search for, may be passed multiple times",
+    )
+    parser.add_argument(
+        "--match",
+        choices=("exact", "covering", "overlap"),
+        default="exact",
+        help="match object values exactly, or by the address space they cover",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="pull the whole configuration in a single API call",
+    )
+    parser.add_argument(
+        "--config-source",
+        choices=("candidate", "running"),
+        default="candidate",
+        help="configuration to read when --bulk is used",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="keep a snapshot of the objects in this SQLite file",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=300,
+        metavar="SECONDS",
+        help="use the snapshot without contacting Panorama while it is younger",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of device groups to fetch at once",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retries of a device group after a server error or timeout",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=("panos", "fast"),
+        default="panos",
+        help="build pan-os-python objects, or read the fields from the XML",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="answer searches over HTTP on HOST:PORT or a Unix socket path",
+    )
+    parser.add_argument(
+        "--refresh",
+        type=int,
+        default=3600,
+        metavar="SECONDS",
+        help="with --serve, reload the configuration at least this often",
+    )
+    parser.add_argument(
+        "--poll",
+        type=int,
+        default=60,
+        metavar="SECONDS",
+        help="with --serve, check the configuration log for changes this often",
+    )
+    parser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="report unused, duplicate and shadowed objects instead of searching",
+    )
+    parser.add_argument(
+        "--report",
+        default="address_analysis.csv",
+        metavar="FILE",
+        help="CSV file the findings of --analyze are written to",
+    )
     args = parser.parse_args()
-
-    # inform user that a search is taking place
-    print(f"Searching for instances of {args.prefix}")
+    if not args.prefix and not args.serve and not args.analyze:
+        parser.error("the following arguments are required: --prefix")
+
+    # cross-reference every object with the rules instead of searching
+    if args.analyze:
+        analyze(args)
+        return
+
+    # keep the configuration indexed in memory and answer searches over HTTP
+    if args.serve:
+        from query_service import QueryService, serve
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+        # a snapshot is only reused after checking the log for changes
+        service = QueryService(
+            lambda: load_config(args, ttl=0),
+            lambda: latest_change(get_pan()),
+            args.refresh,
+            args.poll,
+        )
+        serve(service, args.serve)
+        return
 
     # pull in our configuration objects
-    address_groups, address_objects = grab_config()
+    address_groups, address_objects = load_config(args)
 
-    # find all associations of the prefix
-    associations = find_matches(address_groups, address_objects, args.prefix)
+    # index the configuration once and reuse it for every prefix
+    index = AddressIndex(address_groups, address_objects)
+    if args.match != "exact":
+        cidr_index = CidrIndex(address_objects)
 
-    # determine if the search was successful
-    if associations:
-        # create a pandas dataframe and print to the console.
-        df = pd.DataFrame(associations)
-        print(tabulate(df, headers="keys", tablefmt="fancy_outline"))
-    else:
-        print(f"no match was found for {args.prefix}")
+    for prefix in args.prefix:
+        # inform user that a search is taking place
+        print(f"Searching for instances of {prefix}")
+
+        # address space searches report the matching objects as well
+        if args.match != "exact":
+            matches, associations = find_cidr_matches(
+                index, cidr_index, prefix, args.match
+            )
+            if matches:
+                print_table(matches)
+                if associations:
+                    print_table(associations)
+            else:
+                print(f"no match was found for {prefix}")
+            continue
+
+        # find all associations of the prefix
+        associations = find_matches(address_groups, address_objects, prefix, index)
+
+        # determine if the search was successful
+        if associations:
+            print_table(associations)
+        else:
+            print(f"no match was found for {prefix}")
 
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,165 @@
+"""Index the IP address space covered by address objects.
+
+This module answers "which address objects cover or overlap this IP address
+or subnet" without comparing the search against every address object.
+
+Every `ip-netmask` object, and every `ip-range` object split into the CIDR
+blocks that make it up, is stored in a table keyed by prefix length and
+network address. Finding the objects that contain an address is a single
+dictionary lookup per prefix length in use, which makes it a walk down a
+prefix trie. Object start addresses are also kept in a sorted list, so the
+objects that begin inside a subnet can be found with a binary search.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2022 Calvin Remsburg
+"""
+# standard library imports
+import bisect
+import ipaddress
+from collections import defaultdict
+
+
+# ----------------------------------------------------------------------------
+# Function to convert an address object value into an address interval
+# ----------------------------------------------------------------------------
+def parse_interval(value, address_type="ip-netmask"):
+    """
+    Description: convert an address value into its first and last address.
+    Workflow:
+        1. Split `ip-range` values on the dash into two addresses.
+        2. Treat everything else as a host address or a network in CIDR
+           notation, ignoring host bits like PAN-OS does.
+    Return:
+        - name: interval
+          type: tuple of (version, first, last) as integers, or None when
+                the value is not an IP address (FQDNs, wildcards, typos)
+    """
+    try:
+        if address_type == "ip-range" or (address_type is None and "-" in str(value)):
+            first, last = (ipaddress.ip_address(x.strip()) for x in value.split("-"))
+            if first.version != last.version or first > last:
+                return None
+            return first.version, int(first), int(last)
+        network = ipaddress.ip_network(value, strict=False)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+# ----------------------------------------------------------------------------
+# Index of address objects by the address space they cover
+# ----------------------------------------------------------------------------
+class CidrIndex:
+    """
+    Description: prefix and interval tables over `ip-netmask` and `ip-range`
+        address objects collected by `grab_config`.
+    Attributes:
+        - name: prefixes
+          type: dict, (version, prefix length) → {network: [positions]}
+        - name: starts
+          type: dict, version → sorted list of (first, last, position)
+    """
+
+    WIDTH = {4: 32, 6: 128}
+
+    def __init__(self, address_objects):
+        self.objects = []
+        self.prefixes = defaultdict(lambda: defaultdict(list))
+        self.lengths = defaultdict(set)
+        starts = defaultdict(list)
+
+        for each in address_objects:
+            if each[3] not in ("ip-netmask", "ip-range"):
+                continue
+            interval = parse_interval(each[2], each[3])
+            if interval is None:
+                continue
+            version, first, last = interval
+            position = len(self.objects)
+            self.objects.append((first, last, each))
+            starts[version].append((first, last, position))
+
+            # store the object under every CIDR block that makes it up
+            address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+            blocks = ipaddress.summarize_address_range(address(first), address(last))
+            for block in blocks:
+                self.prefixes[(version, block.prefixlen)][
+                    int(block.network_address)
+                ].append(position)
+                self.lengths[version].add(block.prefixlen)
+
+        self.starts = {version: sorted(rows) for version, rows in starts.items()}
+        self.lengths = {
+            version: sorted(lengths) for version, lengths in self.lengths.items()
+        }
+
+    def _stab(self, version, address):
+        """Return the positions of every object containing a single address."""
+        width = self.WIDTH[version]
+        positions = []
+        for length in self.lengths.get(version, ()):
+            network = (address >> (width - length)) << (width - length)
+            positions.extend(self.prefixes[(version, length)].get(network, ()))
+        return positions
+
+    def covering(self, search):
+        """
+        Description: find the objects that fully contain an address or subnet.
+        Workflow:
+            1. Look up every object containing the first address of `search`.
+            2. Keep the ones that also reach its last address.
+            3. Order the result from the most to the least specific object.
+        Return:
+            - name: matches
+              type: list of address object tuples
+        """
+        interval = parse_interval(search, None)
+        if interval is None:
+            return []
+        version, first, last = interval
+        positions = [
+            position
+            for position in set(self._stab(version, first))
+            if self.objects[position][1] >= last
+        ]
+        return self._sorted(positions)
+
+    def overlapping(self, search):
+        """
+        Description: find the objects sharing at least one address with `search`.
+        Workflow:
+            1. Objects starting before `search` overlap it when they contain
+               its first address, which is the same lookup as `covering`.
+            2. Objects starting inside `search` are found by binary search
+               over the sorted start addresses.
+        Return:
+            - name: matches
+              type: list of address object tuples
+        """
+        interval = parse_interval(search, None)
+        if interval is None:
+            return []
+        version, first, last = interval
+        positions = set(self._stab(version, first))
+        starts = self.starts.get(version, [])
+        low = bisect.bisect_left(starts, (first,))
+        high = bisect.bisect_right(starts, (last, float("inf")))
+        positions.update(row[2] for row in starts[low:high])
+        return self._sorted(positions)
+
+    def _sorted(self, positions):
+        """Order matches by the size of the block they cover, smallest first."""
+        rows = sorted(
+            (self.objects[position] for position in positions),
+            key=lambda row: (row[1] - row[0], row[0]),
+        )
+        return [row[2] for row in rows]
@@ -0,0 +1,305 @@
+"""Find unused, duplicate and shadowed address objects.
+
+This module cross-references the output of `grab_config()` with the
+address references of every security and NAT rule, in a single pass over
+hash tables, rather than rescanning the rules for every object:
+
+- unused: objects and groups that no rule reaches, either directly or
+  through the groups they are nested in
+- duplicate: address objects with the same value, in any location
+- shadowed: objects and groups defined again, under the same name, in a
+  device group below the location that first defines them
+
+Names are resolved the way Panorama does: a rule or group of a device group
+refers to the object of that name in the device group itself, else in the
+nearest ancestor device group defining it, else in Shared. Rules and groups
+of Shared or of a parent device group also apply to the device groups below
+it, where an object of the same name overrides theirs, so their names are
+resolved from each of those device groups as well.
+
+Dynamic address groups are not read: an object reached only through the tag
+filter of one is reported as unused, with a detail saying so.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2022 Calvin Remsburg
+"""
+# standard library imports
+import ipaddress
+import os
+import sys
+from collections import defaultdict, deque
+
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.hierarchy import scope_chain  # noqa
+
+# rulebases holding the rules of Shared and of each device group
+RULEBASES = ("pre-rulebase", "post-rulebase")
+
+# rule types whose address fields are cross-referenced
+RULE_TYPES = ("security", "nat")
+
+REPORT_HEADERS = ["Finding", "Location", "Name", "Type", "Value", "Related", "Detail"]
+
+
+# ----------------------------------------------------------------------------
+# Functions to parse rules and normalize values
+# ----------------------------------------------------------------------------
+def parse_rule_references(element, location, rule_references):
+    """
+    Description: collect the address names referenced by the rules of a scope.
+    Workflow:
+        1. Walk the security and NAT rules of both rulebases of `element`,
+           a device group entry, the shared scope, or the `result` of a
+           `get` of either.
+        2. Read the source and destination members of each rule, and for
+           NAT rules the translated addresses as well.
+    Return:
+        - None, "rule_references" is extended in place with tuples of
+          (location, rulebase, rule type, rule name, address names)
+    """
+
+    # nothing to do when the scope has no configuration at all
+    if element is None:
+        return
+
+    for rulebase in RULEBASES:
+        for rule_type in RULE_TYPES:
+            for entry in element.findall(f"./{rulebase}/{rule_type}/rules/entry"):
+                names = [
+                    member.text
+                    for field in ("source", "destination")
+                    for member in entry.findall(f"./{field}/member")
+                ]
+                # static translations hold a single address, dynamic ones a list
+                for translated in entry.iter("translated-address"):
+                    members = translated.findall("./member")
+                    if members:
+                        names.extend(member.text for member in members)
+                    elif translated.text and translated.text.strip():
+                        names.append(translated.text.strip())
+                rule_references.append(
+                    (location, rulebase, rule_type, entry.get("name"), names)
+                )
+
+
+def normalize_value(value, address_type):
+    """
+    Description: reduce an address value to the form duplicates share.
+    Workflow:
+        1. Give `ip-netmask` values their prefix length, so that `10.0.0.1`
+           and `10.0.0.1/32` compare equal.
+        2. Lowercase `fqdn` values, which are not case sensitive.
+    Return:
+        - name: value
+          type: str
+    """
+    if value is None:
+        return None
+    if address_type == "ip-netmask":
+        try:
+            return ipaddress.ip_interface(value.strip()).with_prefixlen
+        except ValueError:
+            return value.strip()
+    if address_type == "fqdn":
+        return value.strip().lower().rstrip(".")
+    return value.strip()
+
+
+# ----------------------------------------------------------------------------
+# Cross-reference of address objects, groups and rules
+# ----------------------------------------------------------------------------
+class ObjectAnalysis:
+    """
+    Description: hash indexes over the objects, groups and rule references.
+    Workflow:
+        1. Key every address object and group by (location, name).
+        2. Resolve the members of every group and the addresses of every
+           rule to those keys, following the device group hierarchy.
+        3. Walk breadth-first from the keys rules refer to, through group
+           membership, to mark everything in use.
+    Attributes:
+        - name: defined
+          type: dict, (location, name) → address object or group tuple
+        - name: members
+          type: dict, group key → keys of its resolved members
+        - name: descendants
+          type: dict, location → the locations inheriting from it, itself
+          included
+        - name: used
+          type: set, keys reached from a security or NAT rule
+        - name: in_groups
+          type: set, keys that are a member of any group
+    """
+
+    def __init__(self, address_groups, address_objects, rule_references, parents):
+        self.parents = parents
+        self.chains = {}
+        self.defined = {}
+        self.groups = set()
+        for each in address_objects:
+            self.defined[(each[0], each[1])] = each
+        for each in address_groups:
+            self.defined[(each[0], each[1])] = each
+            self.groups.add((each[0], each[1]))
+
+        locations = {"Shared", *parents, *parents.values()}
+        locations.update(location for location, _ in self.defined)
+        locations.update(reference[0] for reference in rule_references)
+        self.descendants = defaultdict(list)
+        for location in sorted(locations):
+            for scope in self.chain(location):
+                self.descendants[scope].append(location)
+
+        # every group member is resolved from the location of its group
+        self.members = {}
+        for each in address_groups:
+            self.members[(each[0], each[1])] = sorted(
+                {key for member in each[3] for key in self.resolve_all(each[0], member)}
+            )
+        self.in_groups = {key for keys in self.members.values() for key in keys}
+
+        # names that resolve to nothing are regions, EDLs, literals or `any`
+        referenced = set()
+        for location, _, _, _, names in rule_references:
+            for name in names:
+                referenced.update(self.resolve_all(location, name))
+
+        self.used = set(referenced)
+        queue = deque(referenced)
+        while queue:
+            for member in self.members.get(queue.popleft(), ()):
+                if member not in self.used:
+                    self.used.add(member)
+                    queue.append(member)
+
+    def chain(self, location):
+        """
+        Description: return the locations a name is looked up in, nearest first.
+        """
+        chain = self.chains.get(location)
+        if chain is None:
+            chain = self.chains[location] = scope_chain(location, self.parents)
+        return chain
+
+    def resolve(self, location, name):
+        """
+        Description: return the key of the object or group `name` refers to.
+        """
+        for scope in self.chain(location):
+            if (scope, name) in self.defined:
+                return (scope, name)
+        return None
+
+    def resolve_all(self, location, name):
+        """
+        Description: return the keys `name` refers to in `location` and in
+        every device group inheriting from it.
+        """
+        keys = set()
+        for scope in self.descendants.get(location, [location]):
+            key = self.resolve(scope, name)
+            if key is not None:
+                keys.add(key)
+        return keys
+
+    def describe(self, key):
+        """
+        Description: return the type and value of an object or group.
+        """
+        each = self.defined[key]
+        if key in self.groups:
+            return "address-group", ", ".join(each[3])
+        return each[3], each[2]
+
+    # ------------------------------------------------------------------------
+    # Findings
+    # ------------------------------------------------------------------------
+    def unused(self):
+        """
+        Description: list the objects and groups no rule reaches.
+        Return:
+            - name: findings
+              type: list of report rows
+        """
+        findings = []
+        for key in self.defined:
+            if key in self.used:
+                continue
+            if key in self.in_groups:
+                detail = "only in unused groups"
+            else:
+                detail = "not referenced"
+            if key not in self.groups:
+                detail += ", dynamic group filters not checked"
+            findings.append(["unused", *key, *self.describe(key), "", detail])
+        return findings
+
+    def duplicates(self):
+        """
+        Description: list the address objects sharing their value with others.
+        Return:
+            - name: findings
+              type: list of report rows
+        """
+        by_value = defaultdict(list)
+        for key, each in self.defined.items():
+            if key not in self.groups and each[2] is not None:
+                by_value[(each[3], normalize_value(each[2], each[3]))].append(key)
+
+        findings = []
+        for keys in by_value.values():
+            if len(keys) < 2:
+                continue
+            for key in keys:
+                related = "; ".join(f"{o[0]}/{o[1]}" for o in keys if o != key)
+                findings.append(
+                    [
+                        "duplicate",
+                        *key,
+                        *self.describe(key),
+                        related,
+                        f"{len(keys)} objects",
+                    ]
+                )
+        return findings
+
+    def shadowed(self):
+        """
+        Description: list the objects and groups hiding one of the same name.
+        Return:
+            - name: findings
+              type: list of report rows
+        """
+        findings = []
+        for key in self.defined:
+            location, name = key
+            for scope in self.chain(location)[1:]:
+                if (scope, name) not in self.defined:
+                    continue
+                kind, value = self.describe(key)
+                other = self.describe((scope, name))
+                if (kind, value) == other:
+                    detail = "same value"
+                else:
+                    detail = f"{scope} has {other[0]} {other[1]}"
+                findings.append(
+                    ["shadowed", location, name, kind, value, f"{scope}/{name}", detail]
+                )
+                break
+        return findings
+
+    def findings(self):
+        """
+        Description: return every finding, unused first.
+        """
+        return self.unused() + self.duplicates() + self.shadowed()
@@ -0,0 +1,345 @@
+"""Answer address object searches from an index kept warm in memory.
+
+Every run of `address_object_search.py` pays for a Python start, a login
+and a pull of the configuration before the first search. This module keeps
+the configuration indexed in a long-running process instead, and answers
+searches over HTTP, on a TCP port or a Unix socket, in a few milliseconds.
+
+The index is rebuilt in the background when the configuration log of
+Panorama shows a change, and at least every `refresh` seconds. Searches
+keep being answered from the previous index while a new one is built.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2022 Calvin Remsburg
+"""
+# standard library imports
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# local imports
+from address_index import AddressIndex
+from cidr_index import CidrIndex
+
+MATCH_MODES = ("exact", "covering", "overlap")
+
+
+# ----------------------------------------------------------------------------
+# Functions to describe search results as JSON
+# ----------------------------------------------------------------------------
+def object_record(each):
+    """
+    Description: turn an address object tuple into a dictionary.
+    """
+    return {"location": each[0], "name": each[1], "value": each[2], "type": each[3]}
+
+
+def group_record(each):
+    """
+    Description: turn an address group tuple into a dictionary.
+    """
+    return {
+        "location": each[0],
+        "name": each[1],
+        "description": each[2],
+        "members": list(each[3]),
+    }
+
+
+# ----------------------------------------------------------------------------
+# Indexes of one version of the configuration
+# ----------------------------------------------------------------------------
+class ConfigIndex:
+    """
+    Description: the `AddressIndex` and `CidrIndex` of one configuration.
+    Attributes:
+        - name: loaded
+          type: float, epoch time the configuration was read
+        - name: watermark
+          type: str, newest configuration log entry when it was read
+    """
+
+    def __init__(self, address_groups, address_objects, watermark=None):
+        self.index = AddressIndex(address_groups, address_objects)
+        self.cidr_index = CidrIndex(address_objects)
+        self.groups = len(address_groups)
+        self.objects = len(address_objects)
+        self.loaded = time.time()
+        self.watermark = watermark
+
+    def search(self, search, match="exact"):
+        """
+        Description: find the objects matching `search` and their groups.
+        Workflow:
+            1. Look `search` up by value or name, or by the address space it
+               covers or overlaps, depending on `match`.
+            2. Walk the `AddressIndex` to collect every group the matches are
+               nested in.
+        Return:
+            - name: matches
+              type: list of address object tuples
+            - name: associations
+              type: list of address group tuples
+        """
+        if match == "covering":
+            matches = self.cidr_index.covering(search)
+        elif match == "overlap":
+            matches = self.cidr_index.overlapping(search)
+        else:
+            matches = self.index.lookup(search)
+        if not matches:
+            return [], []
+        return matches, self.index.expand(dict.fromkeys(each[1] for each in matches))
+
+
+# ----------------------------------------------------------------------------
+# Service keeping the index up to date
+# ----------------------------------------------------------------------------
+class QueryService:
+    """
+    Description: hold the current `ConfigIndex` and rebuild it when needed.
+    Workflow:
+        1. `start` loads the configuration once, then starts a thread that
+           checks the configuration log every `poll` seconds.
+        2. The thread rebuilds the index when the newest log entry changed,
+           when `refresh` seconds went by, or when `request_refresh` was
+           called, and swaps it in once it is complete.
+    Arguments:
+        - name: load
+          type: callable returning the address groups and address objects
+        - name: watermark
+          type: callable returning the newest configuration log entry, or
+                None when the log cannot be read
+        - name: refresh
+          type: int, seconds after which the index is rebuilt in any case
+        - name: poll
+          type: int, seconds between two checks of the configuration log
+    """
+
+    def __init__(self, load, watermark, refresh=3600, poll=60):
+        self.load = load
+        self.watermark = watermark
+        self.refresh = refresh
+        self.poll = poll
+        self.current = None
+        self.refreshes = 0
+        self.requested = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Description: build the first index and start refreshing it.
+        """
+        self.reload()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Description: stop the refresh thread.
+        """
+        self.stopping.set()
+        self.requested.set()
+
+    def reload(self, watermark=None):
+        """
+        Description: read the configuration and swap in a new index.
+        """
+        # take the watermark first, so changes made while we fetch are not lost
+        if watermark is None:
+            watermark = self.watermark()
+        started = time.monotonic()
+        address_groups, address_objects = self.load()
+        self.current = ConfigIndex(address_groups, address_objects, watermark)
+        self.refreshes += 1
+        logging.info(
+            f"Indexed {len(address_objects)} address objects and "
+            f"{len(address_groups)} address groups in "
+            f"{time.monotonic() - started:.1f}s"
+        )
+
+    def request_refresh(self):
+        """
+        Description: rebuild the index as soon as possible.
+        """
+        self.requested.set()
+
+    def run(self):
+        """
+        Description: refresh loop, run by the background thread.
+        """
+        while not self.stopping.is_set():
+            requested = self.requested.wait(self.poll)
+            self.requested.clear()
+            if self.stopping.is_set():
+                break
+            try:
+                watermark = self.watermark()
+                changed = watermark is not None and watermark != self.current.watermark
+                expired = time.time() - self.current.loaded >= self.refresh
+                if requested or changed or expired:
+                    self.reload(watermark)
+            except Exception as e:
+                # keep answering from the current index, and retry later
+                logging.error(f"Unable to refresh the index: {e}")
+
+    def status(self):
+        """
+        Description: describe the current index.
+        """
+        current = self.current
+        return {
+            "address_objects": current.objects,
+            "address_groups": current.groups,
+            "loaded": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(current.loaded)),
+            "age_seconds": round(time.time() - current.loaded, 1),
+            "watermark": current.watermark,
+            "refreshes": self.refreshes,
+        }
+
+    def search(self, prefixes, match="exact"):
+        """
+        Description: answer a search request.
+        Return:
+            - name: results
+              type: list of dict, one per prefix, with the matching objects
+                    and the groups they are nested in
+        """
+        current = self.current
+        results = []
+        for prefix in prefixes:
+            matches, associations = current.search(prefix, match)
+            results.append(
+                {
+                    "prefix": prefix,
+                    "matches": [object_record(each) for each in matches],
+                    "associations": [group_record(each) for each in associations],
+                }
+            )
+        return results
+
+
+# ----------------------------------------------------------------------------
+# HTTP front end
+# ----------------------------------------------------------------------------
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Description: translate HTTP requests into calls to the `QueryService`.
+    Endpoints:
+        - GET /search?prefix=VALUE[&prefix=VALUE...][&match=MODE]
+        - GET /status
+        - POST /refresh
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == "/status":
+            self.reply(200, service.status())
+        elif url.path == "/search":
+            query = parse_qs(url.query)
+            prefixes = query.get("prefix")
+            match = query.get("match", ["exact"])[-1]
+            if not prefixes or match not in MATCH_MODES:
+                modes = "|".join(MATCH_MODES)
+                self.reply(400, {"error": f"prefix required, match one of {modes}"})
+                return
+            started = time.perf_counter()
+            results = service.search(prefixes, match)
+            took = round((time.perf_counter() - started) * 1000, 3)
+            self.reply(200, {"results": results, "took_ms": took})
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        # drain any body, so the connection can be kept alive
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlparse(self.path).path == "/refresh":
+            self.server.service.request_refresh()
+            self.reply(202, {"refresh": "requested"})
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    """
+    Description: HTTP server listening on a Unix socket.
+    """
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer would look up a hostname for the socket path
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+# ----------------------------------------------------------------------------
+# Function to serve searches
+# ----------------------------------------------------------------------------
+def serve(service, address):
+    """
+    Description: answer searches until interrupted.
+    Workflow:
+        1. Listen on `address`, either `HOST:PORT` or the path of a Unix
+           socket, which is replaced when it already exists.
+        2. Start the service, which builds the first index, and serve
+           requests until Ctrl-C or SIGTERM.
+    """
+    if ":" in address and "/" not in address:
+        host, port = address.rsplit(":", 1)
+        server = ThreadingHTTPServer((host, int(port)), QueryHandler)
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixHTTPServer(address, QueryHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    # stop cleanly when a service manager stops us, as on Ctrl-C
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    service.start()
+    logging.info(f"Answering searches on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if server.address_family == socket.AF_UNIX:
+            os.unlink(address)
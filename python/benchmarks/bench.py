@@ -0,0 +1,428 @@
+"""Benchmark the search, export and push paths against a mock Panorama.
+
+Every benchmark runs the functions of a script against the mock Panorama of
+`mock_panorama`, serving a synthetic configuration of the chosen scales. For
+each benchmark and scale, the results record:
+
+- wall_seconds: the time the measured functions took
+- api_calls: the number of requests the mock Panorama received, the
+  ``show jobs`` polls aside
+- bytes: the bytes the mock Panorama received and sent, the ``show jobs``
+  polls aside
+- peak_rss_mb: the peak resident memory of the process running the
+  benchmark, its setup included
+
+Each benchmark runs in its own process, so that the peak memory of one does
+not hide the next one, and the best of `--repeat` runs is kept. Results are
+saved as JSON; given the results of an earlier run with `--baseline`, the
+run fails when a metric regressed by more than `--threshold`.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+# third party library imports
+import requests
+import urllib3
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# make the shared helpers in `python/common` and the mock Panorama importable
+sys.path.insert(0, PYTHON_DIR)
+sys.path.insert(0, os.path.join(PYTHON_DIR, "mock_panorama"))
+from common.client import ApiClient  # noqa
+from generator import generate_config  # noqa
+from server import MockPanorama, serve  # noqa
+
+# the mock Panorama serves a throwaway self-signed certificate
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+TIMESTAMP = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+OUTPUT_FILE = f"results/benchmark_{TIMESTAMP}.json"
+
+PAN_USER = "bench"
+PAN_PASS = "bench"
+
+# ----------------------------------------------------------------------------
+# Sizes of the synthetic configurations
+# ----------------------------------------------------------------------------
+SCALES = {
+    "small": {
+        "device_groups": 10,
+        "addresses": 1000,
+        "address_groups": 100,
+        "rules": 500,
+    },
+    "medium": {
+        "device_groups": 50,
+        "addresses": 20000,
+        "address_groups": 2000,
+        "rules": 5000,
+    },
+    "large": {
+        "device_groups": 200,
+        "addresses": 100000,
+        "address_groups": 10000,
+        "rules": 25000,
+    },
+}
+
+METRICS = ("wall_seconds", "api_calls", "bytes", "peak_rss_mb")
+
+# differences below these are noise, whatever the threshold; the firewalls of
+# `push` share the mock, so a commit may find the change committed by another
+# and get the shorter "no changes" answer instead of a job
+NOISE = {"wall_seconds": 0.05, "api_calls": 0, "bytes": 4096, "peak_rss_mb": 5.0}
+
+
+# ----------------------------------------------------------------------------
+# Benchmarks, each a setup returning the measured function
+# ----------------------------------------------------------------------------
+def import_script(directory: str, module: str):
+    """Import a script, which may import modules of its own directory."""
+    sys.path.insert(0, os.path.join(PYTHON_DIR, directory))
+    return importlib.import_module(module)
+
+
+def bench_grab_config(args: argparse.Namespace) -> Callable:
+    search = import_script("address_object_search", "address_object_search")
+    return lambda: search.grab_config(workers=args.workers, parser=args.parser)
+
+
+def bench_find_matches(args: argparse.Namespace) -> Callable:
+    search = import_script("address_object_search", "address_object_search")
+    address_groups, address_objects = search.grab_config(8, parser=args.parser)
+    # a spread of values, as many as `--searches`
+    step = max(1, len(address_objects) // args.searches)
+    values = [each[2] for each in address_objects[::step][: args.searches]]
+
+    def find_matches():
+        # one index for every search, as main does
+        index = search.AddressIndex(address_groups, address_objects)
+        for value in values:
+            search.find_matches(address_groups, address_objects, value, index)
+
+    return find_matches
+
+
+def bench_get_security_rules_and_profiles(args: argparse.Namespace) -> Callable:
+    export = import_script("rules_export", "panorama_rules_export")
+    pan = export.get_pan()
+    return lambda: export.get_security_rules_and_profiles(pan, args.parser)
+
+
+def bench_save_to_csv(args: argparse.Namespace) -> Callable:
+    export = import_script("rules_export", "panorama_rules_export")
+    rows = export.get_device_group_rules(
+        export.get_pan(), 8, full=True, parser=args.parser
+    )
+    filename = os.path.join(tempfile.mkdtemp(), "rules.csv")
+    return lambda: export.save_to_csv(rows, filename, export.FULL_HEADER)
+
+
+def bench_push(args: argparse.Namespace) -> Callable:
+    sip = import_script("sip-alg-disable", "sip")
+    concurrency = importlib.import_module("common.concurrency")
+    # every firewall of the fleet is the mock; the change is forced, as the
+    # firewalls share one configuration and would otherwise be compliant
+    inventory = [os.environ["PANURL"]] * args.fleet
+    # make the change once beforehand, so that every firewall reads the same
+    # configuration, whichever order the workers run in
+    ApiClient(os.environ["PANURL"], PAN_USER, PAN_PASS).request(
+        {"type": "config", "action": "set", "xpath": sip.XPATH, "element": sip.PAYLOAD}
+    )
+
+    def push():
+        results = concurrency.map_bounded(
+            lambda hostname: sip.apply_change(hostname, force=True),
+            inventory,
+            workers=args.workers,
+            retries=0,
+        )
+        results = concurrency.map_bounded(
+            sip.wait_for_commit, results, workers=args.workers, retries=0
+        )
+        failed = [result["Error"] for result in results if not result["Success"]]
+        if failed:
+            raise RuntimeError(f"push failed: {failed[0]}")
+
+    return push
+
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], Callable]] = {
+    "grab_config": bench_grab_config,
+    "find_matches": bench_find_matches,
+    "get_security_rules_and_profiles": bench_get_security_rules_and_profiles,
+    "save_to_csv": bench_save_to_csv,
+    "push": bench_push,
+}
+
+
+# ----------------------------------------------------------------------------
+# Function to run one benchmark, in the child process
+# ----------------------------------------------------------------------------
+def run_child(args: argparse.Namespace) -> dict:
+    """
+    Run the benchmark named by `--child` and measure it.
+
+    The counters of the mock Panorama are reset once the setup is done, so
+    that only the requests of the measured function are counted. ``show
+    jobs`` requests are left out: their number depends on how many times
+    the jobs were polled before they finished, which varies from run to run.
+    """
+    stats_url = f"https://{os.environ['PANURL']}/stats"
+    measured = BENCHMARKS[args.child](args)
+
+    requests.get(stats_url, params={"reset": 1}, verify=False)
+    started = time.perf_counter()
+    measured()
+    wall_seconds = time.perf_counter() - started
+    stats = requests.get(stats_url, params={"reset": 1}, verify=False).json()
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "api_calls": stats["requests"] - stats["job_requests"],
+        "bytes": stats["bytes_in"] + stats["bytes_out"] - stats["job_bytes"],
+        "peak_rss_mb": round(peak_rss / divisor, 1),
+    }
+
+
+# ----------------------------------------------------------------------------
+# Functions to run the benchmarks, in the parent process
+# ----------------------------------------------------------------------------
+def start_mock(scale: str, args: argparse.Namespace) -> Tuple[object, str]:
+    """
+    Serve a configuration of the given scale on a free local port.
+
+    Returns:
+        The server, to shut it down, and its ``host:port``.
+    """
+    config = generate_config(**SCALES[scale], seed=args.seed)
+    device = MockPanorama(
+        config, latency=args.latency, commit_seconds=args.commit_seconds
+    )
+    server = serve(device, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"127.0.0.1:{server.server_address[1]}"
+
+
+def run_benchmark(name: str, url: str, key_cache: str, args) -> dict:
+    """Run a benchmark `--repeat` times, each in a new process, keeping the best."""
+    env = dict(
+        os.environ,
+        PANURL=url,
+        PANUSER=PAN_USER,
+        PANPASS=PAN_PASS,
+        PAN_KEY_CACHE=key_cache,
+        PYTHONWARNINGS="ignore",
+    )
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        name,
+        "--workers",
+        str(args.workers),
+        "--searches",
+        str(args.searches),
+        "--fleet",
+        str(args.fleet),
+        "--parser",
+        args.parser,
+    ]
+    runs = []
+    for _ in range(args.repeat):
+        # scripts write their output relative to the working directory
+        child = subprocess.run(
+            command, env=env, cwd=tempfile.mkdtemp(), capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            raise RuntimeError(f"{name} failed:\n{child.stderr}")
+        runs.append(json.loads(child.stdout.splitlines()[-1]))
+    return {metric: min(run[metric] for run in runs) for metric in METRICS}
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[str]:
+    """
+    Compare results with those of an earlier run.
+
+    Returns:
+        A description of every metric that regressed by more than
+        `threshold`, a fraction of the baseline value.
+    """
+    previous = {(each["benchmark"], each["scale"]): each for each in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["benchmark"], result["scale"]))
+        if before is None:
+            continue
+        for metric in METRICS:
+            limit = before[metric] * (1 + threshold)
+            if (
+                result[metric] > limit
+                and result[metric] - before[metric] > NOISE[metric]
+            ):
+                regressions.append(
+                    f"{result['benchmark']} ({result['scale']}): {metric} "
+                    f"{before[metric]} -> {result[metric]}"
+                )
+    return regressions
+
+
+def print_results(results: List[dict]) -> None:
+    """Print the results as a table."""
+    columns = ["benchmark", "scale"] + list(METRICS)
+    rows = [columns] + [[str(result[c]) for c in columns] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+# ----------------------------------------------------------------------------
+# Main execution of our script
+# ----------------------------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--benchmark",
+        choices=list(BENCHMARKS),
+        action="append",
+        help="benchmark to run, may be passed multiple times, all by default",
+    )
+    parser.add_argument(
+        "--scale",
+        choices=list(SCALES),
+        action="append",
+        help="configuration size, may be passed multiple times, small by default",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs of each benchmark, the best kept"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="workers of grab_config and push"
+    )
+    parser.add_argument(
+        "--searches", type=int, default=100, help="searches run by find_matches"
+    )
+    parser.add_argument(
+        "--fleet", type=int, default=20, help="firewalls the change is pushed to"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.01,
+        metavar="SECONDS",
+        help="delay the mock Panorama adds to every request",
+    )
+    parser.add_argument(
+        "--commit-seconds",
+        type=float,
+        default=1.0,
+        help="time a commit takes on the mock Panorama",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=("panos", "fast"),
+        default="panos",
+        help="parser of the search and export benchmarks",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        "-o",
+        default=OUTPUT_FILE,
+        metavar="FILE",
+        help="JSON file receiving the results",
+    )
+    parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        help="results of an earlier run to compare with",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="regression tolerated against --baseline, as a fraction",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    key_cache = os.path.join(tempfile.mkdtemp(), "api_keys.json")
+    results = []
+    for scale in args.scale or ["small"]:
+        server, url = start_mock(scale, args)
+        try:
+            # generate the API key once, rather than in the first benchmark
+            ApiClient(url, PAN_USER, PAN_PASS, key_cache=key_cache).api_key
+            for name in args.benchmark or list(BENCHMARKS):
+                print(f"Running {name} ({scale})", file=sys.stderr)
+                result = {"benchmark": name, "scale": scale}
+                result.update(run_benchmark(name, url, key_cache, args))
+                results.append(result)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    print_results(results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as output:
+        json.dump(
+            {
+                "timestamp": TIMESTAMP,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "options": {
+                    name: getattr(args, name)
+                    for name in ("repeat", "workers", "searches", "fleet", "parser")
+                    + ("latency", "commit_seconds", "seed")
+                },
+                "results": results,
+            },
+            output,
+            indent=2,
+        )
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            previous = json.load(baseline)["results"]
+        regressions = compare(results, previous, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Commit the changes queued by the scripts of this repository in batches.
+
+Scripts given `--queue` do not commit their changes themselves: they add
+them to a commit queue shared between them. This script watches the queue
+and, for every device whose oldest queued change has waited `--window`
+seconds, applies every change queued for it, commits once, pushes once per
+device group, and records the outcome of every change in the queue.
+
+Every device is reached with the credentials of `PANUSER` and `PANPASS`.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import argparse
+import logging
+import os
+import sys
+from collections import Counter
+from typing import List, Optional
+
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.commit_queue import COMMIT_QUEUE, STATUS_HEADER  # noqa
+from common.commit_queue import CommitQueue, CommitScheduler  # noqa
+from common.commit_scope import add_scope_argument, scope_from_args  # noqa
+from common.table import render_table  # noqa
+
+# ----------------------------------------------------------------------------
+# Load environment variables from .env file
+# ----------------------------------------------------------------------------
+if os.path.exists(".env"):
+    from dotenv import load_dotenv
+
+    load_dotenv(".env")
+PANUSER = os.environ.get("PANUSER", "automation")
+PANPASS = os.environ.get("PANPASS", "mysecretpassword")
+
+
+# ----------------------------------------------------------------------------
+# Function to connect to a device
+# ----------------------------------------------------------------------------
+def connect(hostname: str, device_type: str):
+    """
+    Create a connection to the device changes were queued for.
+
+    Args:
+        hostname: The hostname of the device, as queued.
+        device_type: ``panorama`` or ``firewall``.
+
+    Returns:
+        A Panorama or Firewall instance.
+    """
+    from common.client import ApiClient
+
+    if device_type == "panorama":
+        from panos.panorama import Panorama as device_class
+    else:
+        from panos.firewall import Firewall as device_class
+    return ApiClient(hostname, PANUSER, PANPASS).device(device_class)
+
+
+# ----------------------------------------------------------------------------
+# Main execution of our script
+# ----------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--queue",
+        default=COMMIT_QUEUE,
+        metavar="FILE",
+        help="commit queue the scripts add their changes to",
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=60,
+        metavar="SECONDS",
+        help="time changes are left to accumulate before they are committed",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=5,
+        metavar="SECONDS",
+        help="time between checks of the queue",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="commit the changes that are due, then exit",
+    )
+    parser.add_argument(
+        "--flush",
+        action="store_true",
+        help="commit every queued change now, then exit",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=500,
+        help="most operations sent in one multi-config request",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="number of devices committed at once",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retries of a job status request after a server error or timeout",
+    )
+    add_scope_argument(parser, "admin")
+    parser.add_argument(
+        "--commit-timeout",
+        type=float,
+        default=1800,
+        metavar="SECONDS",
+        help="time the commit and the pushes may each take",
+    )
+    parser.add_argument(
+        "--status",
+        nargs="*",
+        type=int,
+        metavar="ID",
+        help="show the status of these changes, or of the latest ones, and exit",
+    )
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="queue again the changes left applying by a stopped scheduler, and exit",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    queue = CommitQueue(args.queue)
+    if args.status is not None:
+        print(render_table(queue.status(args.status or None), STATUS_HEADER))
+        return 0
+    if args.requeue:
+        requeued = queue.requeue()
+        logging.info(
+            f"Requeued {len(requeued)} changes"
+            + (f": {', '.join(map(str, requeued))}" if requeued else "")
+        )
+        return 0
+
+    scheduler = CommitScheduler(
+        queue,
+        connect,
+        window=args.window,
+        batch=args.batch,
+        timeout=args.commit_timeout,
+        scope=scope_from_args(parser, args, PANUSER),
+        workers=args.workers,
+        retries=args.retries,
+    )
+    if not (args.once or args.flush):
+        logging.info(f"Watching {args.queue}, committing every {args.window}s")
+        try:
+            scheduler.run(args.poll)
+        except KeyboardInterrupt:
+            return 0
+
+    outcomes = scheduler.run_once(flush=args.flush)
+    counts = Counter(outcome["status"] for outcome in outcomes)
+    logging.info(
+        f"{len(outcomes)} changes handled: "
+        + (", ".join(f"{count} {status}" for status, count in counts.items()) or "none")
+    )
+    return 1 if counts["failed"] else 0
+
+
+# ----------------------------------------------------------------------------
+# Execute main function
+# ----------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
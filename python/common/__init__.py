@@ -0,0 +1,18 @@
+"""Helpers shared by the example scripts in this repository.
+
+The scripts live in their own directories and are executed from there, so
+each one adds the `python` directory to `sys.path` before importing from
+this package.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
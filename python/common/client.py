@@ -0,0 +1,554 @@
+"""Shared connection layer for the XML API.
+
+pan-os-python logs in with a username and password on every run to
+generate an API key, and pan-python opens a new HTTPS connection, TLS
+handshake included, for every request. This module provides `ApiClient`,
+which the scripts use instead to:
+
+- cache API keys between runs in a file only readable by the current user,
+  generating a new key only when there is none or it stopped working
+- send every request over a pooled keep-alive `requests.Session`
+- retry requests refused with a 502, 503 or 504, or whose connection failed
+- optionally cap the rate of requests sent to a device
+- call timing hooks after every request
+- time requests and the parsing of their responses, when enabled with the
+  environment variables of `common.instrument`
+- stream large responses, see `ApiClient.stream`, with the same pooling,
+  rate limit, hooks and instrumentation
+
+`ApiClient.device` returns a regular pan-os-python `Panorama` or `Firewall`
+whose requests go through the client, so the rest of a script is unchanged.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import json
+import logging
+import os
+import stat
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from typing import IO, Callable, Dict, Iterator, List, Optional
+
+# third party library imports
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pan.xapi import PanXapi, PanXapiError
+from panos.base import PanDevice
+
+# local imports
+from common.instrument import Instrumentation, from_environment
+
+
+# ----------------------------------------------------------------------------
+# Default location of the API key cache
+# ----------------------------------------------------------------------------
+KEY_CACHE = os.environ.get(
+    "PAN_KEY_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "pan-scripts", "api_keys.json"),
+)
+
+# Called after every request with the request type, seconds and HTTP status
+TimingHook = Callable[[str, float, Optional[int]], None]
+
+
+# ----------------------------------------------------------------------------
+# API key cache
+# ----------------------------------------------------------------------------
+class KeyCache:
+    """
+    API keys kept in a JSON file, keyed by user, device and port.
+
+    The file and its directory are created readable by the current user
+    only, and a file readable by anyone else is ignored. Writes replace the
+    file atomically and are serialized between threads.
+
+    Args:
+        path: Location of the cache file.
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self, path: str = KEY_CACHE) -> None:
+        self.path = path
+
+    def read(self) -> Dict[str, str]:
+        """Return every cached key, or nothing when the file is unusable."""
+        try:
+            mode = os.stat(self.path).st_mode
+        except FileNotFoundError:
+            return {}
+        if mode & (stat.S_IRWXG | stat.S_IRWXO):
+            logging.warning(
+                f"Ignoring {self.path}, it must only be accessible by its owner"
+            )
+            return {}
+        try:
+            with open(self.path) as cachefile:
+                return json.load(cachefile)
+        except ValueError:
+            return {}
+
+    def get(self, name: str) -> Optional[str]:
+        """Return the cached key of `name`, or None."""
+        return self.read().get(name)
+
+    def set(self, name: str, api_key: Optional[str]) -> None:
+        """Cache the key of `name`, or forget it when `api_key` is None."""
+        with self.lock:
+            keys = self.read()
+            if api_key is None:
+                keys.pop(name, None)
+            else:
+                keys[name] = api_key
+            os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            descriptor = os.open(
+                temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+            )
+            os.fchmod(descriptor, 0o600)
+            with os.fdopen(descriptor, "w") as cachefile:
+                json.dump(keys, cachefile)
+            os.replace(temporary, self.path)
+
+
+# ----------------------------------------------------------------------------
+# Rate limiter
+# ----------------------------------------------------------------------------
+class RateLimiter:
+    """
+    Token bucket capping the number of requests per second.
+
+    Args:
+        rate: Requests per second allowed on average.
+        burst: Requests that may be sent at once after a quiet period.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+# ----------------------------------------------------------------------------
+# Response adapter for pan-python
+# ----------------------------------------------------------------------------
+class PooledResponse:
+    """Expose a `requests` response the way pan-python reads a urllib one."""
+
+    def __init__(self, response: requests.Response) -> None:
+        self.response = response
+
+    def read(self) -> bytes:
+        return self.response.content
+
+    def getheader(self, name: str, default=None):
+        return self.response.headers.get(name, default)
+
+    def info(self):
+        return self.response.headers
+
+
+# ----------------------------------------------------------------------------
+# pan-os-python XML API wrapper sending its requests through a client
+# ----------------------------------------------------------------------------
+class PooledXapi(PanDevice.XapiWrapper):
+    """
+    The XML API wrapper of pan-os-python, sending requests through a client.
+
+    Failures are reported the way pan-python reports them, so pan-os-python
+    turns them into the same exceptions.
+    """
+
+    def __init__(self, *args, client: "ApiClient", **kwargs) -> None:
+        self.client = client
+        super().__init__(*args, **kwargs)
+
+    def _PanXapi__api_request(self, query: dict):
+        try:
+            response = self.client.send(query)
+            # A cached key is no longer accepted, renew it and try again
+            if response.status_code == 403 and self.client.refresh_api_key(query):
+                self.api_key = query["key"] = self.client.api_key
+                if self.pan_device is not None:
+                    self.pan_device._api_key = self.api_key
+                response = self.client.send(query)
+        except requests.Timeout:
+            self.status_detail = "URLError: reason: timed out"
+            return False
+        except requests.RequestException as e:
+            self.status_detail = f"URLError: reason: {e}"
+            return False
+
+        if response.status_code >= 400:
+            self.status_detail = (
+                f"URLError: code: {response.status_code} reason: {response.reason}"
+            )
+            return False
+        return PooledResponse(response)
+
+    def _PanXapi__set_xml_response(self, message_body: bytes) -> bool:
+        if self.client.instrumentation is None:
+            return PanXapi._PanXapi__set_xml_response(self, message_body)
+        started = time.monotonic()
+        try:
+            return PanXapi._PanXapi__set_xml_response(self, message_body)
+        finally:
+            self.client.instrumentation.record_parse(time.monotonic() - started)
+
+
+# ----------------------------------------------------------------------------
+# Function to create a pooled session
+# ----------------------------------------------------------------------------
+def pooled_session(
+    pool_size: int, retries: int, backoff: float, status_retries: int
+) -> requests.Session:
+    """
+    Create a session keeping connections open, and retrying failed requests.
+
+    Args:
+        pool_size: Number of connections kept open.
+        retries: Retries of a request whose connection could not be
+            established.
+        backoff: Delay before the first retry, in seconds, doubling on every
+            retry.
+        status_retries: Retries of a request refused with a 502, 503 or 504.
+            The request is sent again, whatever its method.
+
+    Returns:
+        The session, certificates left unverified.
+    """
+    session = requests.Session()
+    session.verify = False
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=status_retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,
+            backoff_factor=backoff,
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+# ----------------------------------------------------------------------------
+# API client
+# ----------------------------------------------------------------------------
+class ApiClient:
+    """
+    Pooled, rate limited connection to the XML API of one device.
+
+    A client is safe to share between threads, while each thread needs a
+    device of its own, see `device`.
+
+    Args:
+        hostname: Hostname or IP address of the firewall or Panorama,
+            optionally followed by ``:port``.
+        username: User to generate an API key for, when none is cached.
+        password: Password of `username`.
+        api_key: API key to use instead of a cached or generated one.
+        port: Port of the XML API.
+        key_cache: Location of the API key cache, or None to disable it.
+        retries: Retries of a request refused with a 502, 503 or 504, or
+            whose connection could not be established. Commits and pushes
+            are only retried when the connection failed, as one refused
+            with a 502 may have started a job, see `common.jobs.start_job`.
+        backoff: Delay before the first retry, in seconds, doubling on every
+            retry.
+        rate: Maximum number of requests per second, or None for no limit.
+        timeout: Seconds to wait for a response.
+        pool_size: Number of connections kept open, at least the number of
+            threads sharing the client.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        api_key: Optional[str] = None,
+        port: int = 443,
+        key_cache: Optional[str] = KEY_CACHE,
+        retries: int = 3,
+        backoff: float = 0.5,
+        rate: Optional[float] = None,
+        timeout: Optional[float] = None,
+        pool_size: int = 16,
+    ) -> None:
+        if hostname.count(":") == 1:
+            hostname, port = hostname.split(":")
+            port = int(port)
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.port = port
+        self.url = f"https://{hostname}:{port}/api/"
+        self.timeout = timeout
+        self.cache = KeyCache(key_cache) if key_cache else None
+        self.cache_name = f"{username}@{hostname}:{port}"
+        self.limiter = RateLimiter(rate, burst=max(1, int(rate))) if rate else None
+        self.hooks: List[TimingHook] = []
+        self.instrumentation: Optional[Instrumentation] = from_environment()
+        self.lock = threading.Lock()
+        self._api_key = api_key
+        self._fixed_key = api_key is not None
+
+        self.session = pooled_session(pool_size, retries, backoff, retries)
+        # a commit is never sent twice, only its connection is retried
+        self.commit_session = pooled_session(1, retries, backoff, 0)
+
+    @property
+    def api_key(self) -> str:
+        """The API key, read from the cache or generated on first use."""
+        with self.lock:
+            if self._api_key is None and self.cache is not None:
+                self._api_key = self.cache.get(self.cache_name)
+            if self._api_key is None:
+                self._api_key = self.keygen()
+            return self._api_key
+
+    def keygen(self) -> str:
+        """Generate an API key for the user, and cache it."""
+        if self.username is None or self.password is None:
+            raise PanXapiError("api_key or username and password required")
+        logging.debug(f"Generating an API key for {self.cache_name}")
+        root = self.check(
+            self.send(
+                {"type": "keygen", "user": self.username, "password": self.password}
+            )
+        )
+        api_key = root.findtext("./result/key")
+        if not api_key:
+            raise PanXapiError("keygen(): key element not found")
+        if self.cache is not None:
+            self.cache.set(self.cache_name, api_key)
+        return api_key
+
+    def refresh_api_key(self, query: dict) -> bool:
+        """
+        Replace a rejected API key with a new one, if that can help.
+
+        Args:
+            query: The rejected request.
+
+        Returns:
+            True when a new key was generated for the request to be retried.
+        """
+        if self._fixed_key or query.get("type") == "keygen":
+            return False
+        if self.username is None or self.password is None:
+            return False
+        with self.lock:
+            if query.get("key") == self._api_key:
+                logging.info(f"API key of {self.cache_name} rejected, renewing it")
+                self._api_key = self.keygen()
+        return True
+
+    def send(self, params: dict, stream: bool = False) -> requests.Response:
+        """
+        Send one request to the XML API, as a POST over the pooled session.
+
+        Args:
+            params: The query parameters, such as ``type`` and ``action``.
+            stream: Return once the headers are received, leaving the body
+                to be read by the caller, who then reports the request with
+                `record`.
+
+        Returns:
+            The HTTP response, whatever its status.
+        """
+        if self.limiter is not None:
+            self.limiter.acquire()
+        started = time.monotonic()
+        response = None
+        try:
+            session = self.session
+            if params.get("type") == "commit":
+                session = self.commit_session
+            # verify is passed along, REQUESTS_CA_BUNDLE would override the session
+            response = session.post(
+                self.url,
+                data=params,
+                timeout=self.timeout,
+                verify=self.session.verify,
+                stream=stream,
+            )
+            return response
+        finally:
+            if response is None or not stream:
+                size = len(response.content) if response is not None else 0
+                self.record(params, time.monotonic() - started, response, size)
+
+    def record(
+        self,
+        params: dict,
+        seconds: float,
+        response: Optional[requests.Response],
+        size: int,
+    ) -> None:
+        """Report a request to the hooks and the instrumentation."""
+        status = response.status_code if response is not None else None
+        request_type = "/".join(
+            params[name] for name in ("type", "action") if name in params
+        )
+        for hook in self.hooks:
+            hook(request_type, seconds, status)
+        if self.instrumentation is not None:
+            self.instrumentation.record_request(params, seconds, status, size)
+
+    def check(self, response: requests.Response) -> ET.Element:
+        """Parse a response, raising `PanXapiError` when it did not succeed."""
+        if response.status_code >= 400 and not response.content.startswith(b"<"):
+            raise PanXapiError(
+                f"URLError: code: {response.status_code} reason: {response.reason}"
+            )
+        started = time.monotonic()
+        root = ET.fromstring(response.content)
+        if self.instrumentation is not None:
+            self.instrumentation.record_parse(time.monotonic() - started)
+        if root.get("status") != "success":
+            message = " ".join(root.itertext()).strip()
+            raise PanXapiError(message or "XML API request failed")
+        return root
+
+    def request(self, params: dict) -> ET.Element:
+        """
+        Send an authenticated request to the XML API.
+
+        Args:
+            params: The query parameters, without the API key.
+
+        Returns:
+            The ``response`` element of a successful request.
+        """
+        query = dict(params, key=self.api_key)
+        response = self.send(query)
+        if response.status_code == 403 and self.refresh_api_key(query):
+            response = self.send(dict(params, key=self.api_key))
+        return self.check(response)
+
+    @contextmanager
+    def stream(self, params: dict) -> Iterator[IO[bytes]]:
+        """
+        Send an authenticated request, reading its response as it arrives.
+
+        The request is reported to the hooks and the instrumentation when
+        the block exits, so its time covers reading, and parsing, the body.
+
+        Args:
+            params: The query parameters, without the API key.
+
+        Yields:
+            The body of the response, a binary file-like object.
+
+        Raises:
+            PanXapiError: When the request failed with an HTTP error.
+        """
+        query = dict(params, key=self.api_key)
+        started = time.monotonic()
+        response = self.send(query, stream=True)
+        if response.status_code == 403 and self.refresh_api_key(query):
+            self.record(query, time.monotonic() - started, response, 0)
+            response.close()
+            query = dict(params, key=self.api_key)
+            started = time.monotonic()
+            response = self.send(query, stream=True)
+        try:
+            if response.status_code >= 400:
+                # an error body is small, read it whole for its message
+                self.check(response)
+                raise PanXapiError(
+                    f"URLError: code: {response.status_code} reason: {response.reason}"
+                )
+            response.raw.decode_content = True
+            yield response.raw
+        finally:
+            self.record(
+                query, time.monotonic() - started, response, response.raw.tell()
+            )
+            response.close()
+
+    def add_hook(self, hook: TimingHook) -> None:
+        """
+        Call a function after every request.
+
+        Args:
+            hook: Called with the request type, for example ``config/get``,
+                the seconds the request took, and the HTTP status, None when
+                no response was received.
+        """
+        self.hooks.append(hook)
+
+    def device(self, device_class=None):
+        """
+        Create a pan-os-python device sending its requests through the client.
+
+        pan-os-python devices are not thread-safe, so every thread should
+        create its own.
+
+        Args:
+            device_class: ``Panorama`` or ``Firewall``, defaults to
+                ``Panorama``.
+
+        Returns:
+            An instance of `device_class`, whose API key is only looked up
+            when the first request is sent.
+        """
+        if device_class is None:
+            from panos.panorama import Panorama as device_class
+
+        device = device_class(
+            self.hostname,
+            self.username,
+            self.password,
+            api_key=self._api_key if self._fixed_key else None,
+            port=self.port,
+        )
+        device.api_client = self
+        device._retrieve_api_key = lambda: self.api_key
+        device.generate_xapi = lambda: PooledXapi(
+            api_key=device.api_key,
+            hostname=self.hostname,
+            port=self.port,
+            timeout=self.timeout,
+            pan_device=device,
+            client=self,
+        )
+        return device
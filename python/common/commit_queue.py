@@ -0,0 +1,698 @@
+"""Queue configuration changes and commit them together.
+
+Every script committing its own changes, and pushing them to each device
+group on its own, serializes the change window: a commit on Panorama takes
+minutes whether it carries one change or a thousand. With this module the
+scripts enqueue their changes in a SQLite database shared between them,
+and `CommitScheduler` applies every change queued for a device within a
+window of time, then commits once and pushes once per device group.
+
+A change is a list of operations, see `common.multiconfig`, applied
+together or not at all. Its status moves from ``queued`` to ``applying``
+once a scheduler claims it, back to ``queued`` when that scheduler stopped
+without recording an outcome, see `CommitQueue.requeue`, then to one of:
+
+- ``failed``: the change could not be applied, or its commit or one of its
+  pushes failed; the detail tells which
+- ``committed``: the change was committed, and it had nothing to push
+- ``pushed``: the change was committed and pushed to every device group and
+  template it named
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+from typing import Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+# local imports
+from common.commit_scope import CommitScope
+from common.concurrency import map_bounded
+from common.jobs import JobWatcher, start_job
+from common.multiconfig import chunk_changes, send_multi_config
+
+
+# ----------------------------------------------------------------------------
+# Database layout
+# ----------------------------------------------------------------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hostname TEXT NOT NULL,
+    device_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    operations TEXT NOT NULL,
+    device_groups TEXT NOT NULL,
+    templates TEXT NOT NULL,
+    queued_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    batch INTEGER,
+    claimed_at REAL,
+    commit_job TEXT,
+    push_jobs TEXT,
+    detail TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS changes_status ON changes (status, hostname);
+"""
+# columns added since the first layout, with their type
+ADDED_COLUMNS = {"claimed_at": "REAL"}
+
+# queue shared by the scripts of the current user
+COMMIT_QUEUE = os.environ.get(
+    "PAN_COMMIT_QUEUE",
+    os.path.join(os.path.expanduser("~"), ".cache", "pan-scripts", "commit_queue.db"),
+)
+
+# device types a change can be queued for
+DEVICE_TYPES = ("panorama", "firewall")
+
+STATUS_HEADER = [
+    "Id",
+    "Hostname",
+    "Source",
+    "Status",
+    "Batch",
+    "CommitJob",
+    "PushJobs",
+    "QueuedAt",
+    "Detail",
+]
+
+
+class Change(NamedTuple):
+    """A queued change, as claimed by a scheduler."""
+
+    id: int
+    hostname: str
+    device_type: str
+    source: str
+    operations: List[Tuple]
+    device_groups: List[str]
+    templates: List[str]
+
+
+# ----------------------------------------------------------------------------
+# Commit queue
+# ----------------------------------------------------------------------------
+class CommitQueue:
+    """
+    SQLite-backed queue of configuration changes, shared between processes.
+
+    The queue can be used from several threads; its requests are serialized
+    on a single connection.
+
+    Args:
+        path: Location of the SQLite database file, created if needed.
+    """
+
+    def __init__(self, path: str = COMMIT_QUEUE) -> None:
+        os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.connection.executescript(SCHEMA)
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(changes)")
+        }
+        for column, kind in ADDED_COLUMNS.items():
+            if column not in columns:
+                self.connection.execute(
+                    f"ALTER TABLE changes ADD COLUMN {column} {kind}"
+                )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run statements in a transaction holding the write lock of the file.
+
+        ``BEGIN IMMEDIATE`` takes the lock up front, so that two schedulers
+        cannot claim the same changes.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def enqueue(
+        self,
+        hostname: str,
+        changes: Iterable[Sequence[Tuple]],
+        device_groups: Sequence[str] = (),
+        templates: Sequence[str] = (),
+        source: str = "",
+        device_type: str = "panorama",
+    ) -> List[int]:
+        """
+        Queue changes for a device.
+
+        Args:
+            hostname: The device the changes are for, as given to `ApiClient`.
+            changes: Lists of operations, one list per change.
+            device_groups: Device groups to push the changes to, each in a
+                push of its own, templates included when `templates` is set.
+            templates: Templates the changes touch. They are pushed on their
+                own when no device group is given.
+            source: Name of the script queueing the changes.
+            device_type: ``panorama`` or ``firewall``.
+
+        Returns:
+            The ids of the changes, in order.
+        """
+        if device_type not in DEVICE_TYPES:
+            raise ValueError(f"Unknown device type {device_type}")
+        now = time.time()
+        ids = []
+        with self.transaction() as connection:
+            for operations in changes:
+                cursor = connection.execute(
+                    "INSERT INTO changes (hostname, device_type, source, operations,"
+                    " device_groups, templates, queued_at, status)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, 'queued')",
+                    (
+                        hostname,
+                        device_type,
+                        source,
+                        json.dumps([list(operation) for operation in operations]),
+                        json.dumps(list(device_groups)),
+                        json.dumps(list(templates)),
+                        now,
+                    ),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def due(self, window: float) -> List[Tuple[str, str]]:
+        """
+        List the devices whose oldest queued change has waited `window` seconds.
+
+        Args:
+            window: Seconds changes are left to accumulate.
+
+        Returns:
+            The (hostname, device type) of each device, oldest change first.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT hostname, device_type, MIN(queued_at) FROM changes"
+                " WHERE status = 'queued' GROUP BY hostname, device_type"
+                " ORDER BY MIN(queued_at)"
+            ).fetchall()
+        now = time.time()
+        return [
+            (hostname, kind)
+            for hostname, kind, oldest in rows
+            if now - oldest >= window
+        ]
+
+    def claim(self, hostname: str, device_type: str) -> Tuple[int, List[Change]]:
+        """
+        Take every change queued for a device, to apply them as one batch.
+
+        Args:
+            hostname: The device.
+            device_type: ``panorama`` or ``firewall``.
+
+        Returns:
+            The number of the batch and its changes, oldest first. The list
+            is empty when another scheduler claimed the changes first.
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, hostname, device_type, source, operations,"
+                " device_groups, templates FROM changes"
+                " WHERE status = 'queued' AND hostname = ? AND device_type = ?"
+                " ORDER BY id",
+                (hostname, device_type),
+            ).fetchall()
+            batch = connection.execute(
+                "SELECT COALESCE(MAX(batch), 0) + 1 FROM changes"
+            ).fetchone()[0]
+            connection.executemany(
+                "UPDATE changes SET status = 'applying', batch = ?, claimed_at = ?"
+                " WHERE id = ?",
+                [(batch, now, row[0]) for row in rows],
+            )
+        changes = [
+            Change(
+                row[0],
+                row[1],
+                row[2],
+                row[3],
+                [tuple(operation) for operation in json.loads(row[4])],
+                json.loads(row[5]),
+                json.loads(row[6]),
+            )
+            for row in rows
+        ]
+        return batch, changes
+
+    def requeue(self, older_than: float = 0.0) -> List[int]:
+        """
+        Queue again the changes of batches whose scheduler never finished.
+
+        A scheduler stopped during a batch leaves its changes ``applying``.
+        Once requeued, they are claimed by the next batch of their device;
+        the changes that were already applied are then applied again.
+
+        Args:
+            older_than: Seconds since the batch was claimed. Every change
+                still ``applying`` is requeued when 0.
+
+        Returns:
+            The ids of the changes requeued.
+        """
+        with self.transaction() as connection:
+            ids = [
+                row[0]
+                for row in connection.execute(
+                    "SELECT id FROM changes WHERE status = 'applying'"
+                    " AND COALESCE(claimed_at, 0) <= ? ORDER BY id",
+                    (time.time() - older_than,),
+                )
+            ]
+            # the batch is kept, so that its number is never handed out again
+            connection.executemany(
+                "UPDATE changes SET status = 'queued', claimed_at = NULL WHERE id = ?",
+                [(change_id,) for change_id in ids],
+            )
+        return ids
+
+    def record(self, outcomes: Iterable[dict]) -> None:
+        """
+        Store the outcome of changes.
+
+        An outcome is dropped when its change was requeued and claimed by
+        another batch in the meantime.
+
+        Args:
+            outcomes: Dictionaries with the ``id`` and ``batch`` of a change,
+                and its ``status``, ``commit_job``, ``push_jobs`` and
+                ``detail``.
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            connection.executemany(
+                "UPDATE changes SET status = ?, commit_job = ?, push_jobs = ?,"
+                " detail = ?, finished_at = ? WHERE id = ? AND batch = ?",
+                [
+                    (
+                        outcome["status"],
+                        outcome.get("commit_job"),
+                        ", ".join(outcome.get("push_jobs") or []),
+                        outcome.get("detail", ""),
+                        now,
+                        outcome["id"],
+                        outcome["batch"],
+                    )
+                    for outcome in outcomes
+                ],
+            )
+
+    def status(
+        self, ids: Optional[Iterable[int]] = None, limit: int = 50
+    ) -> List[list]:
+        """
+        Report the status of changes.
+
+        Args:
+            ids: The changes to report, the latest `limit` changes when
+                omitted.
+            limit: Number of changes reported when `ids` is omitted.
+
+        Returns:
+            A row per change, see `STATUS_HEADER`, oldest first.
+        """
+        query = (
+            "SELECT id, hostname, source, status, batch, commit_job, push_jobs,"
+            " queued_at, detail FROM changes"
+        )
+        with self.lock:
+            if ids is None:
+                rows = self.connection.execute(
+                    f"{query} ORDER BY id DESC LIMIT ?", (limit,)
+                ).fetchall()[::-1]
+            else:
+                ids = list(ids)
+                marks = ", ".join("?" * len(ids))
+                rows = self.connection.execute(
+                    f"{query} WHERE id IN ({marks}) ORDER BY id", ids
+                ).fetchall()
+        return [
+            [
+                *row[:7],
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[7])),
+                row[8],
+            ]
+            for row in rows
+        ]
+
+
+# ----------------------------------------------------------------------------
+# Function to build the push of a device group or template
+# ----------------------------------------------------------------------------
+def push_command(
+    device_group: Optional[str] = None,
+    template: Optional[str] = None,
+    include_template: bool = False,
+) -> str:
+    """
+    Build the ``commit-all`` pushing a device group or a template.
+
+    Args:
+        device_group: The device group to push.
+        template: The template to push, when no device group is given.
+        include_template: Push the templates of the devices of
+            `device_group` along with it.
+
+    Returns:
+        The ``commit-all`` command.
+    """
+    if device_group is None:
+        return (
+            "<commit-all><template>"
+            f"<name>{escape(template)}</name>"
+            "</template></commit-all>"
+        )
+    include = "yes" if include_template else "no"
+    return (
+        "<commit-all><shared-policy><device-group>"
+        f"<entry name={quoteattr(device_group)}/></device-group>"
+        f"<include-template>{include}</include-template>"
+        "</shared-policy></commit-all>"
+    )
+
+
+# ----------------------------------------------------------------------------
+# Commit scheduler
+# ----------------------------------------------------------------------------
+class CommitScheduler:
+    """
+    Apply queued changes in batches, with one commit and one push each.
+
+    For every device whose oldest queued change has waited `window`
+    seconds, the scheduler claims every change queued for it and:
+
+    1. applies them with ``multi-config`` requests of up to `batch`
+       operations; when a request fails, its changes are sent again one by
+       one, so that a bad change only fails itself
+    2. commits once, limited to `scope`
+    3. on Panorama, pushes once to every device group the changes named,
+       and once to every template named by changes without a device group
+    4. waits for the commit and the pushes, and records the outcome of
+       every change in the queue
+
+    Commits and pushes are sent once, see `start_job`. Changes claimed by a
+    scheduler that stopped without recording their outcome are queued again
+    once their batch is older than three times `timeout`, the time it may
+    take to apply, commit and push it.
+
+    Args:
+        queue: The `CommitQueue`.
+        connect: Called with a hostname and device type, returns a
+            pan-os-python device created by an `ApiClient`.
+        window: Seconds changes are left to accumulate before a batch.
+        batch: Most operations per ``multi-config`` request.
+        timeout: Seconds the commit, and then the pushes, may take.
+        scope: The part of the candidate configuration each commit applies,
+            the whole of it by default.
+        workers: Number of devices handled at once.
+        retries: Retries of the requests checking jobs after a server
+            error or a timeout.
+    """
+
+    def __init__(
+        self,
+        queue: CommitQueue,
+        connect: Callable[[str, str], object],
+        window: float = 60.0,
+        batch: int = 500,
+        timeout: float = 1800.0,
+        scope: CommitScope = CommitScope(),
+        workers: int = 8,
+        retries: int = 3,
+    ) -> None:
+        self.queue = queue
+        self.connect = connect
+        self.window = window
+        self.batch = batch
+        self.timeout = timeout
+        self.scope = scope
+        self.workers = workers
+        self.retries = retries
+
+    def run_once(self, flush: bool = False) -> List[dict]:
+        """
+        Handle every device with changes due.
+
+        Args:
+            flush: Handle every queued change, however recent.
+
+        Returns:
+            The outcome of every change handled, see `CommitQueue.record`.
+        """
+        requeued = self.queue.requeue(3 * self.timeout)
+        if requeued:
+            logging.warning(
+                f"Requeued {len(requeued)} changes left applying by a stopped "
+                f"scheduler: {', '.join(map(str, requeued))}"
+            )
+        batches = [
+            self.queue.claim(hostname, device_type)
+            for hostname, device_type in self.queue.due(0 if flush else self.window)
+        ]
+        batches = [(number, changes) for number, changes in batches if changes]
+        if not batches:
+            return []
+
+        results = map_bounded(
+            lambda claimed: self.handle(*claimed),
+            batches,
+            workers=self.workers,
+            retries=0,
+        )
+        outcomes = [outcome for result in results for outcome in result]
+        self.queue.record(outcomes)
+        return outcomes
+
+    def run(self, poll: float = 5.0) -> None:
+        """
+        Handle changes as they become due, until interrupted.
+
+        Args:
+            poll: Seconds between checks of the queue.
+        """
+        while True:
+            self.run_once()
+            time.sleep(poll)
+
+    def handle(self, number: int, changes: List[Change]) -> List[dict]:
+        """
+        Apply, commit and push a batch of changes of one device.
+
+        Args:
+            number: The number of the batch.
+            changes: The changes, all for the same device.
+
+        Returns:
+            The outcome of every change. Errors are recorded in the
+            outcomes rather than raised.
+        """
+        hostname, device_type = changes[0].hostname, changes[0].device_type
+        outcomes = {
+            change.id: {"id": change.id, "batch": number, "status": "failed"}
+            for change in changes
+        }
+        try:
+            # a scope the device cannot commit fails before anything is applied
+            self.scope.check(device_type)
+            device = self.connect(hostname, device_type)
+            applied = self.apply(device, changes, outcomes)
+            if applied:
+                self.commit_and_push(device, number, applied, outcomes)
+        except Exception as e:
+            logging.error(f"{hostname}: batch {number} failed: {e}")
+            for outcome in outcomes.values():
+                if outcome["status"] == "failed" and not outcome.get("detail"):
+                    outcome["detail"] = str(e)
+        return list(outcomes.values())
+
+    def apply(
+        self, device, changes: List[Change], outcomes: Dict[int, dict]
+    ) -> List[Change]:
+        """
+        Apply the changes of a batch, isolating those that fail.
+
+        Returns:
+            The changes that were applied.
+        """
+        client = device.api_client
+        applied = []
+        for chunk in chunk_changes(
+            [change.operations for change in changes], self.batch
+        ):
+            attempts = [[changes[position] for position in chunk]]
+            while attempts:
+                group = attempts.pop(0)
+                try:
+                    send_multi_config(
+                        client, [op for change in group for op in change.operations]
+                    )
+                except Exception as e:
+                    if len(group) > 1:
+                        logging.warning(
+                            f"{device.hostname}: {len(group)} changes rejected"
+                            f" together ({e}), applying them one by one"
+                        )
+                        attempts = [[change] for change in group] + attempts
+                    else:
+                        logging.error(f"{device.hostname}: change {group[0].id}: {e}")
+                        outcomes[group[0].id]["detail"] = f"not applied: {e}"
+                else:
+                    applied.extend(group)
+
+        # changes without operations have nothing to apply
+        applied.extend(change for change in changes if not change.operations)
+        logging.info(
+            f"{device.hostname}: applied {len(applied)} of {len(changes)} changes"
+        )
+        return applied
+
+    def commit_and_push(
+        self, device, number: int, changes: List[Change], outcomes: Dict[int, dict]
+    ) -> None:
+        """Commit the applied changes once, then push each target once."""
+        sources = Counter(change.source or "unknown" for change in changes)
+        description = f"Batch {number}: " + ", ".join(
+            f"{count} from {source}" for source, count in sources.items()
+        )
+        watcher = JobWatcher(device, timeout=self.timeout, retries=self.retries)
+
+        command = self.scope.command(changes[0].device_type, description)
+        job_id = start_job(
+            device, lambda: device.commit(cmd=command), "Commit", self.retries
+        )
+        detail = ""
+        if job_id is None:
+            logging.info(f"{device.hostname}: batch {number} had nothing to commit")
+            detail = "nothing to commit, the configuration already matched"
+        else:
+            logging.info(
+                f"{device.hostname}: batch {number} commit job {job_id}, "
+                f"{self.scope.describe()}"
+            )
+            try:
+                watcher.wait([job_id])
+            except Exception as e:
+                for change in changes:
+                    outcomes[change.id].update(commit_job=job_id, detail=f"commit: {e}")
+                return
+
+        pushes = self.push(device, watcher, changes)
+        for change in changes:
+            outcome = outcomes[change.id]
+            outcome.update(commit_job=job_id, push_jobs=[], detail=detail)
+            errors = []
+            for name, push_id, result in pushes:
+                if change not in result["changes"]:
+                    continue
+                if push_id is not None:
+                    outcome["push_jobs"].append(push_id)
+                error = result.get("error")
+                if error is None:
+                    error = result["future"].exception()
+                if error is not None:
+                    errors.append(f"push to {name}: {error}")
+            if errors:
+                outcome["detail"] = "; ".join(errors)
+            else:
+                outcome["status"] = "pushed" if outcome["push_jobs"] else "committed"
+
+    def push(self, device, watcher: JobWatcher, changes: List[Change]) -> List[Tuple]:
+        """
+        Push the committed changes, once per device group or template.
+
+        Device groups are pushed with their templates when a change naming
+        them also named templates. Templates named by changes without a
+        device group are pushed on their own. Firewalls have nothing to push.
+
+        Returns:
+            A (name, job id, result) tuple per push, once every push is
+            done. The result holds the ``changes`` pushed, and either the
+            ``future`` of the job or the ``error`` that kept it from
+            starting.
+        """
+        targets: Dict[Tuple, List[Change]] = {}
+        with_templates = set()
+        for change in changes:
+            if change.device_type != "panorama":
+                continue
+            for device_group in change.device_groups:
+                targets.setdefault((device_group, None), []).append(change)
+                if change.templates:
+                    with_templates.add(device_group)
+            if not change.device_groups:
+                for template in change.templates:
+                    targets.setdefault((None, template), []).append(change)
+
+        def send_push(command: str) -> Optional[str]:
+            response = device.xapi.commit(cmd=command, action="all")
+            return response.findtext("./result/job")
+
+        pushes = []
+        for (device_group, template), members in targets.items():
+            name = device_group or f"template {template}"
+            result: dict = {"changes": members}
+            push_id = None
+            command = push_command(
+                device_group, template, device_group in with_templates
+            )
+            try:
+                push_id = start_job(
+                    device, lambda: send_push(command), "CommitAll", self.retries
+                )
+                if push_id is None:
+                    raise ValueError("no job was started")
+                result["future"] = watcher.watch(push_id)
+                logging.info(f"{device.hostname}: push to {name} job {push_id}")
+            except Exception as e:
+                logging.error(f"{device.hostname}: push to {name} failed: {e}")
+                result["error"] = e
+            pushes.append((name, push_id, result))
+
+        if watcher.pending():
+            try:
+                watcher.wait()
+            except Exception:
+                # the outcome of each push is read from its future instead
+                pass
+        return pushes
@@ -0,0 +1,237 @@
+"""Limit commits to part of the candidate configuration.
+
+A full commit applies every pending change of every administrator, which
+takes longest on a large Panorama and commits the unfinished edits of
+other teams along with ours. A partial commit is limited to the changes of
+some administrators, to some device groups and templates, or leaves whole
+types of configuration out.
+
+The scripts accept the scope of their commit through `--commit-scope`,
+given once per term:
+
+- ``full``: commit everything, no other term allowed
+- ``admin`` or ``admin=NAME,...``: the changes of the user running the
+  script, or of the administrators named
+- ``device-group=NAME,...``, ``template=NAME,...`` and
+  ``template-stack=NAME,...``: the changes to these locations, on Panorama
+- ``exclude=TYPE,...``: leave out ``device-and-network``, ``shared-object``
+  or, on a firewall, ``policy-and-objects`` changes
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import argparse
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+
+# ----------------------------------------------------------------------------
+# Terms of a scope
+# ----------------------------------------------------------------------------
+# terms naming locations, with the keyword of `PanoramaCommit` they fill
+LOCATION_TERMS = {
+    "device-group": "device_groups",
+    "template": "templates",
+    "template-stack": "template_stacks",
+}
+
+# configuration types a commit can leave out, with the keyword of the commit
+EXCLUSIONS = {
+    "device-and-network": "exclude_device_and_network",
+    "shared-object": "exclude_shared_objects",
+    "policy-and-objects": "exclude_policy_and_objects",
+}
+# configuration types only a firewall commit can leave out
+FIREWALL_EXCLUSIONS = ("policy-and-objects",)
+
+
+class CommitScope(NamedTuple):
+    """
+    The part of the candidate configuration a commit applies.
+
+    Every field left empty does not limit the commit, so the default scope
+    is a full commit.
+    """
+
+    admins: Tuple[str, ...] = ()
+    device_groups: Tuple[str, ...] = ()
+    templates: Tuple[str, ...] = ()
+    template_stacks: Tuple[str, ...] = ()
+    excluded: Tuple[str, ...] = ()
+
+    def is_partial(self) -> bool:
+        """Tell whether the scope limits the commit in any way."""
+        return any(self)
+
+    def describe(self) -> str:
+        """Describe the scope in log messages."""
+        if not self.is_partial():
+            return "full commit"
+        parts = []
+        if self.admins:
+            parts.append(f"admin {', '.join(self.admins)}")
+        for term, field in LOCATION_TERMS.items():
+            if getattr(self, field):
+                parts.append(f"{term} {', '.join(getattr(self, field))}")
+        if self.excluded:
+            parts.append(f"excluding {', '.join(self.excluded)}")
+        return "partial commit of " + "; ".join(parts)
+
+    def check(self, device_type: str) -> None:
+        """
+        Make sure a device supports the scope.
+
+        Args:
+            device_type: ``panorama`` or ``firewall``.
+
+        Raises:
+            ValueError: When the scope names locations on a firewall, or
+                leaves out a type of configuration the device cannot.
+        """
+        if device_type == "firewall" and (
+            self.device_groups or self.templates or self.template_stacks
+        ):
+            raise ValueError("a firewall commit cannot be limited to locations")
+        for excluded in self.excluded:
+            if device_type != "firewall" and excluded in FIREWALL_EXCLUSIONS:
+                raise ValueError(f"a {device_type} commit cannot exclude {excluded}")
+
+    def command(self, device_type: str, description: Optional[str] = None):
+        """
+        Build the commit of a device, limited to the scope.
+
+        Args:
+            device_type: ``panorama`` or ``firewall``.
+            description: Description of the commit.
+
+        Returns:
+            A ``PanoramaCommit`` or ``FirewallCommit``, for the ``cmd`` of
+            ``commit()``.
+
+        Raises:
+            ValueError: See `check`.
+        """
+        self.check(device_type)
+        exclusions = {EXCLUSIONS[excluded]: True for excluded in self.excluded}
+        if device_type == "panorama":
+            from panos.panorama import PanoramaCommit
+
+            return PanoramaCommit(
+                description,
+                list(self.admins) or None,
+                device_groups=list(self.device_groups) or None,
+                templates=list(self.templates) or None,
+                template_stacks=list(self.template_stacks) or None,
+                **exclusions,
+            )
+        from panos.firewall import FirewallCommit
+
+        return FirewallCommit(description, list(self.admins) or None, **exclusions)
+
+
+# ----------------------------------------------------------------------------
+# Functions to read the scope from the command line
+# ----------------------------------------------------------------------------
+def parse_scope(terms: Iterable[str], user: Optional[str] = None) -> CommitScope:
+    """
+    Build a scope from `--commit-scope` terms.
+
+    Args:
+        terms: The terms, see the description of this module.
+        user: The administrator ``admin`` without names stands for.
+
+    Returns:
+        The scope.
+
+    Raises:
+        ValueError: When a term is unknown, lacks names, or ``full`` is
+            combined with other terms.
+    """
+    terms = list(terms)
+    fields: Dict[str, Tuple[str, ...]] = {}
+    for term in terms:
+        kind, _, value = term.partition("=")
+        kind = kind.strip().lower()
+        names = tuple(name.strip() for name in value.split(",") if name.strip())
+        if kind == "full":
+            if len(terms) > 1:
+                raise ValueError("full cannot be combined with other scopes")
+            continue
+        if kind == "admin":
+            if not names and not user:
+                raise ValueError("admin needs the names of administrators")
+            field = "admins"
+            names = names or (user,)
+        elif kind in LOCATION_TERMS:
+            field = LOCATION_TERMS[kind]
+        elif kind == "exclude":
+            unknown = [name for name in names if name not in EXCLUSIONS]
+            if unknown:
+                raise ValueError(
+                    f"cannot exclude {', '.join(unknown)}, "
+                    f"only {', '.join(EXCLUSIONS)}"
+                )
+            field = "excluded"
+        else:
+            raise ValueError(f"unknown commit scope {term}")
+        if not names:
+            raise ValueError(f"{kind} needs one or more names, as in {kind}=NAME")
+        fields[field] = tuple(dict.fromkeys(fields.get(field, ()) + names))
+    return CommitScope(**fields)
+
+
+def add_scope_argument(parser: argparse.ArgumentParser, default: str) -> None:
+    """
+    Add the `--commit-scope` option to a parser.
+
+    Args:
+        parser: The parser of a script.
+        default: The scope used when the option is not given.
+    """
+    parser.add_argument(
+        "--commit-scope",
+        action="append",
+        metavar="SCOPE",
+        help=(
+            "limit the commit: full, admin[=NAME,...], device-group=NAME,..., "
+            "template=NAME,..., template-stack=NAME,... or exclude=TYPE,...; "
+            f"repeat to combine, {default} by default"
+        ),
+    )
+    parser.set_defaults(commit_scope_default=default)
+
+
+def scope_from_args(
+    parser: argparse.ArgumentParser,
+    args: argparse.Namespace,
+    user: Optional[str],
+    device_types: Sequence[str] = (),
+) -> CommitScope:
+    """
+    Read the scope given with `--commit-scope`, exiting on an invalid one.
+
+    Args:
+        parser: The parser the option was added to with `add_scope_argument`.
+        args: The parsed arguments.
+        user: The administrator ``admin`` without names stands for.
+        device_types: The device types the scope must apply to.
+
+    Returns:
+        The scope.
+    """
+    try:
+        scope = parse_scope(args.commit_scope or [args.commit_scope_default], user)
+        for device_type in device_types:
+            scope.check(device_type)
+    except ValueError as e:
+        parser.error(f"--commit-scope: {e}")
+    return scope
@@ -0,0 +1,182 @@
+"""Bounded concurrency and retries for XML API calls.
+
+The scripts in this repository spend most of their time waiting on the
+network, one request after another. This module runs independent requests
+on a bounded pool of worker threads, retries the ones that fail with a
+server error or a timeout, and returns the results in the order the work
+was submitted.
+
+pan-os-python keeps the state of the last response on the connection
+object, so a connection must never be shared between threads.
+`DevicePool` hands each worker thread its own connection instead.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import logging
+import random
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List
+
+
+# ----------------------------------------------------------------------------
+# Errors worth another attempt
+# ----------------------------------------------------------------------------
+# pan.xapi reports HTTP errors as "URLError: code: 503 reason: ..."
+SERVER_ERROR = re.compile(r"\bcode: 5\d\d\b")
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Decide whether a failed request is worth retrying.
+
+    Server errors (HTTP 5xx), timeouts and dropped connections are transient
+    on a busy management plane. Anything else, such as invalid credentials or
+    a malformed xpath, will fail the same way again.
+
+    Args:
+        error: The exception raised by the request.
+
+    Returns:
+        True when the request should be retried.
+    """
+    if isinstance(error, (socket.timeout, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in ("PanConnectionTimeout", "Timeout", "ConnectionError"):
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", 0) >= 500:
+        return True
+    message = str(error)
+    return bool(SERVER_ERROR.search(message)) or message.endswith("timed out")
+
+
+# ----------------------------------------------------------------------------
+# Function to call a function, retrying with exponential backoff
+# ----------------------------------------------------------------------------
+def call_with_retry(
+    func: Callable,
+    *args: Any,
+    retries: int = 3,
+    backoff: float = 1.0,
+    max_backoff: float = 30.0,
+    **kwargs: Any,
+) -> Any:
+    """
+    Call a function, retrying transient failures with exponential backoff.
+
+    Args:
+        func: The function to call.
+        *args: Positional arguments for `func`.
+        retries: Number of retries after the first attempt.
+        backoff: Delay before the first retry, in seconds. The delay doubles
+            on every retry, with up to 10% jitter so that workers that
+            failed together do not retry together.
+        max_backoff: Upper bound of the delay, in seconds.
+        **kwargs: Keyword arguments for `func`.
+
+    Returns:
+        Whatever `func` returns.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = min(backoff * 2**attempt, max_backoff)
+            delay += random.uniform(0, delay / 10)
+            attempt += 1
+            logging.warning(
+                f"Attempt {attempt} of {func.__name__} failed ({e}), "
+                f"retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+# ----------------------------------------------------------------------------
+# Function to map a function over items with a bounded pool of threads
+# ----------------------------------------------------------------------------
+def map_bounded(
+    func: Callable,
+    items: Iterable,
+    workers: int = 8,
+    retries: int = 3,
+    backoff: float = 1.0,
+) -> List[Any]:
+    """
+    Apply a function to every item on a bounded pool of worker threads.
+
+    Args:
+        func: The function to call with each item.
+        items: The items to process.
+        workers: Maximum number of requests in flight at once.
+        retries: Number of retries of each item, see `call_with_retry`.
+        backoff: Delay before the first retry, in seconds.
+
+    Returns:
+        The results, in the same order as `items` regardless of the order in
+        which the requests completed. The first exception that exhausted its
+        retries is raised once every submitted item has finished.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(
+                call_with_retry, func, item, retries=retries, backoff=backoff
+            )
+            for item in items
+        ]
+        return [future.result() for future in futures]
+
+
+# ----------------------------------------------------------------------------
+# One connection to a device per worker thread
+# ----------------------------------------------------------------------------
+class DevicePool:
+    """
+    Hand each worker thread its own connection to a device.
+
+    The connections are copies of `device` sharing its API key, which is
+    retrieved once up front instead of once per thread. Devices created by
+    an `ApiClient` are copied through the client, so their requests keep
+    sharing its pooled connections.
+
+    Args:
+        device: A pan-os-python Panorama or Firewall instance.
+    """
+
+    def __init__(self, device) -> None:
+        self.device = device
+        self.api_key = device.api_key
+        self.client = getattr(device, "api_client", None)
+        self.local = threading.local()
+
+    def get(self):
+        """
+        Return the connection of the calling thread, creating it if needed.
+
+        Returns:
+            A Panorama or Firewall instance of the same class as `device`.
+        """
+        if not hasattr(self.local, "device") and self.client is not None:
+            self.local.device = self.client.device(type(self.device))
+        elif not hasattr(self.local, "device"):
+            self.local.device = type(self.device)(
+                self.device.hostname, api_key=self.api_key, port=self.device.port
+            )
+        return self.local.device
@@ -0,0 +1,96 @@
+"""Device group hierarchy of Panorama.
+
+Device groups can be nested. A rule or group of a device group refers to the
+object of a given name defined in the device group itself, else in the
+nearest ancestor device group defining it, else in Shared. Shared and
+ancestor pre-rules are evaluated before the rules of a device group, and
+their post-rules after.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import logging
+from collections import deque
+from typing import Dict, List
+
+
+# ----------------------------------------------------------------------------
+# Function to parse the device group hierarchy
+# ----------------------------------------------------------------------------
+def parse_hierarchy(element) -> Dict[str, str]:
+    """
+    Read the output of ``show dg-hierarchy``.
+
+    Args:
+        element: The ``dg-hierarchy`` element of the response, or None.
+
+    Returns:
+        A dictionary mapping each device group to its parent, ``Shared`` for
+        top level device groups.
+    """
+    parents: Dict[str, str] = {}
+    if element is None:
+        return parents
+
+    queue = deque((dg, "Shared") for dg in element.findall("./dg"))
+    while queue:
+        dg, parent = queue.popleft()
+        parents[dg.get("name")] = parent
+        queue.extend((child, dg.get("name")) for child in dg.findall("./dg"))
+    return parents
+
+
+# ----------------------------------------------------------------------------
+# Function to retrieve the device group hierarchy
+# ----------------------------------------------------------------------------
+def get_parents(pan) -> Dict[str, str]:
+    """
+    Ask Panorama for the parent of each device group.
+
+    Args:
+        pan: An instance of Panorama.
+
+    Returns:
+        The result of `parse_hierarchy`. It is empty, which puts every device
+        group directly below Shared, when the command fails.
+    """
+    try:
+        response = pan.op("show dg-hierarchy")
+    except Exception as e:
+        logging.warning(f"Unable to read the device group hierarchy: {e}")
+        return {}
+    return parse_hierarchy(response.find("./result/dg-hierarchy"))
+
+
+# ----------------------------------------------------------------------------
+# Function to list the locations a device group inherits from
+# ----------------------------------------------------------------------------
+def scope_chain(location: str, parents: Dict[str, str]) -> List[str]:
+    """
+    List a location and the locations it inherits from, nearest first.
+
+    Args:
+        location: ``Shared`` or the name of a device group.
+        parents: The result of `parse_hierarchy`. Device groups missing from
+            it are taken to sit directly below Shared.
+
+    Returns:
+        The location, its ancestor device groups and ``Shared`` last.
+    """
+    chain = [location]
+    # guard against loops, should the hierarchy be inconsistent
+    while chain[-1] != "Shared" and len(chain) <= len(parents) + 1:
+        chain.append(parents.get(chain[-1], "Shared"))
+    if chain[-1] != "Shared":
+        chain.append("Shared")
+    return chain
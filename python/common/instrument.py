@@ -0,0 +1,252 @@
+"""Opt-in instrumentation of XML API requests.
+
+When a script is slow, the time can go to the network and Panorama
+generating the response, to parsing the XML, or to pan-os-python building
+its objects and the script itself. `Instrumentation` records, for every
+request an `ApiClient` sends:
+
+- the request: its type and xpath, or its op command
+- the seconds until the whole response was received
+- the size of the response
+- the seconds spent parsing it into an ElementTree
+
+Requests are aggregated by request, with the names of entries in xpaths
+replaced by ``*`` so that the device groups of a loop add up together. The
+summary compares the totals with the run time of the script; what is left
+is the time pan-os-python and the script spent on their own.
+
+Instrumentation is enabled by environment variables, so that it works with
+every script using `ApiClient` without changing them:
+
+- ``PAN_INSTRUMENT=1`` prints a summary table when the script exits
+- ``PAN_INSTRUMENT_TEXTFILE=FILE`` writes the metrics to FILE, in the
+  Prometheus text format, when the script exits
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import atexit
+import os
+import re
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, TextIO, Tuple
+
+METRICS = (
+    ("requests", "pan_api_requests_total", "XML API requests sent."),
+    ("errors", "pan_api_request_errors_total", "XML API requests that failed."),
+    ("seconds", "pan_api_request_seconds_total", "Seconds until responses ended."),
+    ("bytes", "pan_api_response_bytes_total", "Bytes of the responses."),
+    ("parse", "pan_api_parse_seconds_total", "Seconds spent parsing responses."),
+)
+
+_instrumentation = None
+_instrumentation_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------------
+# Function to name a request
+# ----------------------------------------------------------------------------
+def describe(params: dict) -> str:
+    """
+    Describe a request, in a way that requests doing the same work share.
+
+    Args:
+        params: The query parameters of the request.
+
+    Returns:
+        The xpath of a ``config`` request, with entry names replaced by
+        ``*``, the command of an ``op`` request, for example ``show jobs
+        id``, or nothing for other requests.
+    """
+    if params.get("xpath"):
+        return re.sub(r"@name=(['\"]).*?\1", "@name=*", params["xpath"])
+    if params.get("cmd"):
+        try:
+            command = ET.fromstring(params["cmd"])
+        except ET.ParseError:
+            return params["cmd"]
+        return " ".join(element.tag for element in command.iter())
+    return ""
+
+
+# ----------------------------------------------------------------------------
+# Instrumentation
+# ----------------------------------------------------------------------------
+class Instrumentation:
+    """
+    Aggregate the timings of the requests of every client attached to it.
+
+    Args:
+        summary: Print the summary table when the process exits.
+        textfile: Write the metrics to this file, in the Prometheus text
+            format, when the process exits.
+    """
+
+    def __init__(self, summary: bool = True, textfile: Optional[str] = None) -> None:
+        self.summary = summary
+        self.textfile = textfile
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.totals: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def attach(self, client) -> None:
+        """Record the requests of an `ApiClient`."""
+        client.instrumentation = self
+
+    def record_request(
+        self, params: dict, seconds: float, status: Optional[int], size: int
+    ) -> None:
+        """
+        Record a request, once its response was received.
+
+        Args:
+            params: The query parameters of the request.
+            seconds: Seconds from sending the request to the end of the
+                response.
+            status: The HTTP status, None when no response was received.
+            size: Bytes of the response.
+        """
+        request_type = "/".join(
+            params[name] for name in ("type", "action") if name in params
+        )
+        key = (request_type, describe(params))
+        with self.lock:
+            totals = self.totals.setdefault(key, {name: 0 for name, _, _ in METRICS})
+            totals["requests"] += 1
+            totals["errors"] += status is None or status >= 400
+            totals["seconds"] += seconds
+            totals["bytes"] += size
+        # the response is parsed next, by the same thread
+        self.local.totals = totals
+
+    def record_parse(self, seconds: float) -> None:
+        """Record the time spent parsing the last response of this thread."""
+        totals = getattr(self.local, "totals", None)
+        if totals is not None:
+            with self.lock:
+                totals["parse"] += seconds
+
+    # ------------------------------------------------------------------------
+    # Reports
+    # ------------------------------------------------------------------------
+    def report(self, output: TextIO = sys.stderr) -> None:
+        """Print the totals of every request, the slowest first."""
+        with self.lock:
+            rows = sorted(
+                self.totals.items(), key=lambda item: item[1]["seconds"], reverse=True
+            )
+            elapsed = time.monotonic() - self.started
+            header = ["Request", "Target", "Calls", "Errors", "Seconds", "KB", "Parse"]
+            lines = [header] + [
+                [
+                    request_type,
+                    target,
+                    str(totals["requests"]),
+                    str(totals["errors"]),
+                    f"{totals['seconds']:.3f}",
+                    f"{totals['bytes'] / 1024:.1f}",
+                    f"{totals['parse']:.3f}",
+                ]
+                for (request_type, target), totals in rows
+            ]
+            network = sum(totals["seconds"] for _, totals in rows)
+            parse = sum(totals["parse"] for _, totals in rows)
+            requests = sum(totals["requests"] for _, totals in rows)
+
+        widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+        print("\nXML API requests:", file=output)
+        for line in lines:
+            print("  ".join(v.ljust(w) for v, w in zip(line, widths)), file=output)
+        # requests sent by several threads at once overlap, so the sums may
+        # exceed the run time
+        print(
+            f"{requests} requests in {elapsed:.3f}s: {network:.3f}s waiting for "
+            f"responses, {parse:.3f}s parsing them, "
+            f"{max(0.0, elapsed - network - parse):.3f}s elsewhere "
+            "(pan-os-python objects and the script)",
+            file=output,
+        )
+
+    def write_textfile(self, filename: str) -> None:
+        """
+        Write the totals in the Prometheus text format.
+
+        The file is replaced atomically, so that a collector reading it, such
+        as the textfile collector of the node exporter, never sees half of it.
+        """
+        script = os.path.basename(sys.argv[0]) or "python"
+        lines: List[str] = []
+        with self.lock:
+            for name, metric, description in METRICS:
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} counter")
+                for (request_type, target), totals in sorted(self.totals.items()):
+                    labels = ",".join(
+                        f'{label}="{escape(value)}"'
+                        for label, value in (
+                            ("script", script),
+                            ("type", request_type),
+                            ("target", target),
+                        )
+                    )
+                    lines.append(f"{metric}{{{labels}}} {totals[name]}")
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{filename}.{os.getpid()}.tmp"
+        with open(temporary, "w") as textfile:
+            textfile.write("\n".join(lines) + "\n")
+        os.replace(temporary, filename)
+
+    def close(self) -> None:
+        """Write the reports that were asked for."""
+        if self.summary and self.totals:
+            self.report()
+        if self.textfile:
+            self.write_textfile(self.textfile)
+
+
+def escape(value: str) -> str:
+    """Escape a label value of the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ----------------------------------------------------------------------------
+# Function to get the instrumentation asked for by the environment
+# ----------------------------------------------------------------------------
+def from_environment() -> Optional[Instrumentation]:
+    """
+    Return the instrumentation of the process, if the environment asks for it.
+
+    The instrumentation is created on first use and reports once, when the
+    process exits. It is shared by every client, so that the reports cover
+    every request of the script.
+
+    Returns:
+        The instrumentation, or None when neither ``PAN_INSTRUMENT`` nor
+        ``PAN_INSTRUMENT_TEXTFILE`` is set.
+    """
+    global _instrumentation
+    summary = os.environ.get("PAN_INSTRUMENT", "").lower() in ("1", "true", "yes")
+    textfile = os.environ.get("PAN_INSTRUMENT_TEXTFILE")
+    if not summary and not textfile:
+        return None
+    with _instrumentation_lock:
+        if _instrumentation is None:
+            _instrumentation = Instrumentation(summary, textfile)
+            atexit.register(_instrumentation.close)
+        return _instrumentation
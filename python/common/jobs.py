@@ -0,0 +1,325 @@
+"""Wait for PAN-OS jobs such as commits and pushes to finish.
+
+Commits, commit-alls and content installs run as jobs that have to be
+polled until they finish. Polling each job on its own, at a fixed interval,
+costs one request per job per interval and either reacts late or hammers
+the management plane. `JobWatcher` instead polls every job it watches with
+a single ``show jobs all`` request, backs off while nothing is moving, and
+resolves a future for each job once it finishes, fails or times out.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import logging
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional
+
+# local imports
+from common.concurrency import call_with_retry
+
+
+# ----------------------------------------------------------------------------
+# Exceptions
+# ----------------------------------------------------------------------------
+class JobFailed(Exception):
+    """
+    Raised when a job finished with a result other than OK.
+
+    Args:
+        job: The job, as returned by `parse_job`.
+    """
+
+    def __init__(self, job: dict) -> None:
+        details = "; ".join(job["details"]) or "no details"
+        super().__init__(
+            f"Job {job['id']} ({job.get('type', 'unknown')}) finished with "
+            f"result {job.get('result')}: {details}"
+        )
+        self.job = job
+
+
+class JobTimeout(TimeoutError):
+    """Raised when a job did not finish within the time it was given."""
+
+
+# ----------------------------------------------------------------------------
+# Function to turn a job element into a dictionary
+# ----------------------------------------------------------------------------
+def parse_job(element) -> dict:
+    """
+    Convert a ``job`` element of a ``show jobs`` response to a dictionary.
+
+    Args:
+        element: The ``job`` element.
+
+    Returns:
+        A dictionary holding the text of every leaf element of the job, for
+        example ``id``, ``type``, ``status``, ``result`` and ``progress``,
+        plus ``details``, the lines of the job details, and ``devices``, the
+        leaf elements of each device a commit-all was pushed to.
+    """
+    job = {
+        child.tag: (child.text or "").strip() for child in element if len(child) == 0
+    }
+    job["details"] = [
+        " ".join(line.itertext()).strip() for line in element.iterfind("./details/line")
+    ]
+    job["devices"] = [
+        {child.tag: (child.text or "").strip() for child in entry if len(child) == 0}
+        for entry in element.iterfind("./devices/entry")
+    ]
+    return job
+
+
+# ----------------------------------------------------------------------------
+# Functions to list jobs and to start one
+# ----------------------------------------------------------------------------
+def list_jobs(device, retries: int = 3) -> Dict[str, dict]:
+    """
+    Fetch the jobs of a device with a single ``show jobs all`` request.
+
+    Args:
+        device: A pan-os-python Panorama or Firewall instance.
+        retries: Number of retries of a failed request.
+
+    Returns:
+        The jobs, see `parse_job`, by id.
+    """
+    response = call_with_retry(device.op, "show jobs all", retries=retries)
+    jobs = {}
+    for element in response.iterfind("./result/job"):
+        job = parse_job(element)
+        jobs[job.get("id")] = job
+    return jobs
+
+
+def start_job(device, start: Callable[[], object], job_type: str, retries: int = 3):
+    """
+    Send a request starting a job, such as a commit, exactly once.
+
+    A commit whose response was lost, to a timeout for instance, may still
+    have started, so sending it again could start a second one. Instead,
+    when the request fails, the jobs of the device are checked for a job
+    of `job_type` that was not there before it was sent.
+
+    Args:
+        device: A pan-os-python Panorama or Firewall instance.
+        start: Sends the request and returns the id of the job, or None
+            when no job was needed.
+        job_type: The type of the job, as ``show jobs`` reports it, for
+            example ``Commit`` or ``CommitAll``.
+        retries: Number of retries of the ``show jobs`` requests.
+
+    Returns:
+        The result of `start`, or the id of the job found after it failed.
+
+    Raises:
+        Exception: The error of `start`, when no job started.
+    """
+    known = set(list_jobs(device, retries))
+    try:
+        return start()
+    except Exception as e:
+        user = getattr(device, "api_username", None)
+        try:
+            jobs = list_jobs(device, retries)
+        except Exception:
+            jobs = {}
+        started = [
+            job_id
+            for job_id, job in jobs.items()
+            if job_id not in known
+            and job.get("type") == job_type
+            and (not user or job.get("user", user) == user)
+        ]
+        if not started:
+            raise
+        job_id = max(started, key=int)
+        logging.warning(
+            f"{device.hostname}: {job_type} request failed ({e}), "
+            f"but it started job {job_id}"
+        )
+        return job_id
+
+
+# ----------------------------------------------------------------------------
+# Job watcher
+# ----------------------------------------------------------------------------
+class JobWatcher:
+    """
+    Track any number of jobs on one device with batched polling.
+
+    Jobs are registered with `watch`, which returns a future, and `wait`
+    polls until the jobs are done. Each round issues a single ``show jobs
+    all`` request, whatever the number of jobs. The delay between rounds
+    starts at `interval` and doubles, up to `max_interval`, for every round
+    in which no job made progress.
+
+    Args:
+        device: A pan-os-python Panorama or Firewall instance.
+        interval: Initial delay between polls, in seconds.
+        max_interval: Upper bound of the delay between polls, in seconds.
+        timeout: Seconds a job may take, counted from the moment it is
+            watched, before it is given up on.
+        retries: Number of retries of a failed poll, see `call_with_retry`.
+    """
+
+    def __init__(
+        self,
+        device,
+        interval: float = 1.0,
+        max_interval: float = 30.0,
+        timeout: float = 1800.0,
+        retries: int = 3,
+    ) -> None:
+        self.device = device
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.retries = retries
+        self.futures: Dict[str, Future] = {}
+        self.deadlines: Dict[str, float] = {}
+        self.progress: Dict[str, str] = {}
+
+    def watch(
+        self,
+        job_id,
+        callback: Optional[Callable[[Future], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> Future:
+        """
+        Start tracking a job.
+
+        Args:
+            job_id: The id of the job, as returned by ``commit``.
+            callback: Called with the future once the job is done.
+            timeout: Overrides the timeout of the watcher for this job.
+
+        Returns:
+            A future resolving to the job, see `parse_job`. A job that does
+            not finish with result OK raises `JobFailed`, and one that takes
+            too long raises `JobTimeout`.
+        """
+        job_id = str(job_id)
+        if job_id not in self.futures:
+            self.futures[job_id] = Future()
+            self.deadlines[job_id] = time.monotonic() + (timeout or self.timeout)
+        if callback is not None:
+            self.futures[job_id].add_done_callback(callback)
+        return self.futures[job_id]
+
+    def pending(self) -> List[str]:
+        """Return the ids of the watched jobs that are not done yet."""
+        return [job_id for job_id, f in self.futures.items() if not f.done()]
+
+    def poll(self) -> bool:
+        """
+        Check every pending job once, resolving the futures of those done.
+
+        Returns:
+            True when at least one pending job made progress or finished.
+        """
+        pending = self.pending()
+        if not pending:
+            return False
+
+        jobs = list_jobs(self.device, self.retries)
+
+        # Old jobs roll off the list, look those up one by one
+        for job_id in pending:
+            if job_id not in jobs:
+                response = call_with_retry(
+                    self.device.op, f'show jobs id "{job_id}"', retries=self.retries
+                )
+                element = response.find("./result/job")
+                if element is not None:
+                    jobs[job_id] = parse_job(element)
+
+        moved = False
+        now = time.monotonic()
+        for job_id in pending:
+            job = jobs.get(job_id)
+            if job is not None and job.get("status") == "FIN":
+                moved = True
+                self.resolve(job_id, job)
+            elif now >= self.deadlines[job_id]:
+                self.futures[job_id].set_exception(
+                    JobTimeout(f"Job {job_id} did not finish in time")
+                )
+            elif job is not None and job.get("progress") != self.progress.get(job_id):
+                moved = True
+                self.progress[job_id] = job.get("progress")
+                logging.info(f"{self.name(job_id, job)} at {job['progress']}%")
+        return moved
+
+    def name(self, job_id: str, job: dict) -> str:
+        """Describe a job in log messages, with the device it runs on."""
+        return f"{self.device.hostname}: job {job_id} ({job.get('type')})"
+
+    def resolve(self, job_id: str, job: dict) -> None:
+        """Resolve the future of a finished job with its result."""
+        if job.get("result") == "OK":
+            logging.info(f"{self.name(job_id, job)} finished OK")
+            self.futures[job_id].set_result(job)
+        else:
+            logging.error(f"{self.name(job_id, job)} failed")
+            self.futures[job_id].set_exception(JobFailed(job))
+
+    def wait(self, job_ids: Optional[Iterable] = None) -> List[dict]:
+        """
+        Poll until jobs are done.
+
+        Args:
+            job_ids: The jobs to wait for, watched first if needed. Every
+                watched job when omitted.
+
+        Returns:
+            The jobs, in the order of `job_ids`. The first `JobFailed` or
+            `JobTimeout` is raised once every job is done, so one failed job
+            does not hide the outcome of the others.
+        """
+        if job_ids is None:
+            job_ids = list(self.futures)
+        futures = [self.watch(job_id) for job_id in job_ids]
+
+        delay = self.interval
+        while not all(future.done() for future in futures):
+            if self.poll():
+                delay = self.interval
+            else:
+                delay = min(delay * 2, self.max_interval)
+            if all(future.done() for future in futures):
+                break
+            next_deadline = min(self.deadlines[job_id] for job_id in self.pending())
+            time.sleep(max(0.0, min(delay, next_deadline - time.monotonic())))
+
+        return [future.result() for future in futures]
+
+
+# ----------------------------------------------------------------------------
+# Function to wait for jobs without managing a watcher
+# ----------------------------------------------------------------------------
+def wait_for_jobs(device, job_ids: Iterable, timeout: float = 1800.0) -> List[dict]:
+    """
+    Wait for one or more jobs to finish, polling them together.
+
+    Args:
+        device: A pan-os-python Panorama or Firewall instance.
+        job_ids: The ids of the jobs.
+        timeout: Seconds each job may take.
+
+    Returns:
+        The jobs, see `JobWatcher.wait`.
+    """
+    return JobWatcher(device, timeout=timeout).wait(job_ids)
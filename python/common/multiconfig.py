@@ -0,0 +1,165 @@
+"""Apply many configuration changes with few ``multi-config`` requests.
+
+A ``multi-config`` request carries any number of ``set``, ``edit``,
+``delete`` and ``rename`` operations, and with ``strict-transactional``
+the device applies all of them or none. Sending changes this way costs one
+round trip per batch instead of one per operation.
+
+Operations are (action, xpath, value) tuples, where the value is the
+element of a ``set`` or ``edit``, the new name of a ``rename``, and unused
+by a ``delete``. Operations come in lists, one list per change, and the
+operations of a change always travel in the same request.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import logging
+from typing import List, Sequence, Tuple
+from xml.sax.saxutils import quoteattr
+
+
+# ----------------------------------------------------------------------------
+# Exceptions
+# ----------------------------------------------------------------------------
+class BatchFailed(Exception):
+    """
+    Raised when a ``multi-config`` request of `apply_operations` failed.
+
+    Args:
+        error: The error of the request.
+        batch: The number of the failed request, counting from 1.
+        batches: The positions of the changes of every request, see
+            `chunk_changes`. The requests before `batch` were applied, the
+            later ones were not sent.
+    """
+
+    def __init__(self, error: Exception, batch: int, batches: List[List[int]]):
+        super().__init__(f"request {batch} of {len(batches)} failed: {error}")
+        self.error = error
+        self.batch = batch
+        self.batches = batches
+
+    @property
+    def applied(self) -> List[int]:
+        """The positions of the changes applied by the earlier requests."""
+        return [
+            position for chunk in self.batches[: self.batch - 1] for position in chunk
+        ]
+
+
+# ----------------------------------------------------------------------------
+# Function to build the element of a multi-config request
+# ----------------------------------------------------------------------------
+def multi_config_element(operations: Sequence[Tuple]) -> str:
+    """
+    Build the ``multi-configure-request`` of a batch of operations.
+
+    Args:
+        operations: The (action, xpath, value) tuples.
+
+    Returns:
+        The element, serialized.
+    """
+    requests = []
+    for number, (action, xpath, value) in enumerate(operations, start=1):
+        attributes = f"id={quoteattr(str(number))} xpath={quoteattr(xpath)}"
+        if action == "rename":
+            requests.append(f"<rename {attributes} newname={quoteattr(value)}/>")
+        elif action == "delete":
+            requests.append(f"<delete {attributes}/>")
+        elif action == "edit":
+            requests.append(f"<edit {attributes}>{value}</edit>")
+        else:
+            requests.append(f"<set {attributes}>{value}</set>")
+    return f"<multi-configure-request>{''.join(requests)}</multi-configure-request>"
+
+
+# ----------------------------------------------------------------------------
+# Functions to send multi-config requests
+# ----------------------------------------------------------------------------
+def chunk_changes(changes: Sequence[Sequence[Tuple]], batch: int) -> List[List[int]]:
+    """
+    Split changes into batches of at most `batch` operations.
+
+    Args:
+        changes: Lists of operations, one list per change.
+        batch: Most operations per batch, unless a single change has more.
+
+    Returns:
+        The positions of the changes of each batch. Changes without
+        operations are left out.
+    """
+    chunks: List[List[int]] = []
+    size = 0
+    for position, operations in enumerate(changes):
+        if not operations:
+            continue
+        if not chunks or size + len(operations) > batch:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(position)
+        size += len(operations)
+    return chunks
+
+
+def send_multi_config(client, operations: Sequence[Tuple]) -> None:
+    """
+    Apply operations in a single, strictly transactional, request.
+
+    Args:
+        client: The `ApiClient` of the device.
+        operations: The (action, xpath, value) tuples.
+
+    Raises:
+        PanXapiError: When the request failed, in which case none of the
+            operations were applied.
+    """
+    client.request(
+        {
+            "type": "config",
+            "action": "multi-config",
+            "strict-transactional": "yes",
+            "element": multi_config_element(operations),
+        }
+    )
+
+
+def apply_operations(
+    client, changes: Sequence[Sequence[Tuple]], batch: int = 500
+) -> int:
+    """
+    Apply changes with as few ``multi-config`` requests as possible.
+
+    Args:
+        client: The `ApiClient` of the device.
+        changes: Lists of operations, one list per change.
+        batch: Most operations per request, unless a single change has more.
+
+    Returns:
+        The number of requests sent.
+
+    Raises:
+        BatchFailed: When a request failed; the earlier requests stay
+            applied, the later ones are not sent.
+    """
+    chunks = chunk_changes(changes, batch)
+    for number, chunk in enumerate(chunks, start=1):
+        operations = [
+            operation for position in chunk for operation in changes[position]
+        ]
+        try:
+            send_multi_config(client, operations)
+        except Exception as e:
+            raise BatchFailed(e, number, chunks) from e
+        logging.info(f"Applied {len(operations)} operations")
+    return len(chunks)
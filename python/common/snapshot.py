@@ -0,0 +1,293 @@
+"""On-disk snapshot of Panorama configuration objects.
+
+Fetching every object from Panorama on each run is slow and puts load on
+its management plane. This module keeps the records collected by the
+scripts in a SQLite database, keyed by Panorama, location (``Shared`` or a
+device group name) and object type, so that repeat runs can be answered
+locally.
+
+A snapshot younger than its TTL is used as is. Once it is older, the
+configuration log on Panorama is asked which locations were changed since
+the last refresh, and only those locations are fetched again.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+# ----------------------------------------------------------------------------
+# Database layout
+# ----------------------------------------------------------------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hostname TEXT NOT NULL,
+    location TEXT NOT NULL,
+    object_type TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (hostname, location, object_type)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    hostname TEXT NOT NULL,
+    object_type TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    watermark TEXT,
+    PRIMARY KEY (hostname, object_type)
+);
+"""
+
+
+# ----------------------------------------------------------------------------
+# Snapshot store
+# ----------------------------------------------------------------------------
+class SnapshotStore:
+    """
+    SQLite-backed store of configuration records for one Panorama.
+
+    Args:
+        path: Location of the SQLite database file.
+        hostname: Panorama the records belong to, so one file can hold the
+            snapshots of several Panoramas.
+    """
+
+    def __init__(self, path: str, hostname: str) -> None:
+        self.path = path
+        self.hostname = hostname
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self.connection.close()
+
+    def age(self, object_type: str) -> Optional[float]:
+        """
+        Return the number of seconds since an object type was last synced.
+
+        Args:
+            object_type: Name of the object type, for example ``address``.
+
+        Returns:
+            The age in seconds, or None when the object type was never synced.
+        """
+        row = self.connection.execute(
+            "SELECT synced_at FROM snapshots WHERE hostname = ? AND object_type = ?",
+            (self.hostname, object_type),
+        ).fetchone()
+        return None if row is None else time.time() - row[0]
+
+    def is_fresh(self, object_type: str, ttl: float) -> bool:
+        """
+        Check whether the snapshot of an object type is younger than its TTL.
+
+        Args:
+            object_type: Name of the object type.
+            ttl: Maximum age, in seconds, of a snapshot that may be used as is.
+
+        Returns:
+            True when the snapshot can be used without contacting Panorama.
+        """
+        age = self.age(object_type)
+        return age is not None and age < ttl
+
+    def watermark(self, object_type: str) -> Optional[str]:
+        """
+        Return the newest configuration log time covered by the snapshot.
+
+        Args:
+            object_type: Name of the object type.
+
+        Returns:
+            The ``receive_time`` of the newest configuration change seen when
+            the snapshot was taken, or None when it is unknown.
+        """
+        row = self.connection.execute(
+            "SELECT watermark FROM snapshots WHERE hostname = ? AND object_type = ?",
+            (self.hostname, object_type),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def load(self, object_type: str) -> List[Tuple]:
+        """
+        Load the records of an object type, ordered by location.
+
+        Args:
+            object_type: Name of the object type.
+
+        Returns:
+            A list of tuples, in the order the locations were saved.
+        """
+        rows = self.connection.execute(
+            "SELECT payload FROM objects WHERE hostname = ? AND object_type = ? "
+            "ORDER BY position",
+            (self.hostname, object_type),
+        )
+        return [tuple(record) for (payload,) in rows for record in json.loads(payload)]
+
+    def save(self, object_type: str, location: str, records: Iterable[Tuple]) -> None:
+        """
+        Replace the records of an object type in a single location.
+
+        Locations keep the position they were first saved at, new locations
+        are placed after all existing ones.
+
+        Args:
+            object_type: Name of the object type.
+            location: ``Shared`` or the name of a device group.
+            records: The records to store, each one a JSON serializable tuple.
+        """
+        row = self.connection.execute(
+            "SELECT position FROM objects "
+            "WHERE hostname = ? AND object_type = ? AND location = ?",
+            (self.hostname, object_type, location),
+        ).fetchone()
+        if row is None:
+            row = self.connection.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM objects "
+                "WHERE hostname = ? AND object_type = ?",
+                (self.hostname, object_type),
+            ).fetchone()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?)",
+            (self.hostname, location, object_type, row[0], json.dumps(list(records))),
+        )
+
+    def replace(self, object_type: str, records: Iterable[Tuple]) -> None:
+        """
+        Replace every record of an object type, grouped by their first field.
+
+        Args:
+            object_type: Name of the object type.
+            records: Tuples whose first field is the location they belong to.
+        """
+        self.connection.execute(
+            "DELETE FROM objects WHERE hostname = ? AND object_type = ?",
+            (self.hostname, object_type),
+        )
+        grouped: Dict[str, List[Tuple]] = {}
+        for record in records:
+            grouped.setdefault(record[0], []).append(record)
+        for location, location_records in grouped.items():
+            self.save(object_type, location, location_records)
+
+    def mark_synced(self, object_type: str, watermark: Optional[str]) -> None:
+        """
+        Record that an object type is now in sync with Panorama.
+
+        Args:
+            object_type: Name of the object type.
+            watermark: The newest configuration log time covered.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+            (self.hostname, object_type, time.time(), watermark),
+        )
+        self.connection.commit()
+
+
+# ----------------------------------------------------------------------------
+# Function to query the configuration log on Panorama
+# ----------------------------------------------------------------------------
+def query_config_log(pan, since: Optional[str] = None, nlogs: int = 5000) -> list:
+    """
+    Retrieve configuration log entries from Panorama.
+
+    Args:
+        pan: An instance of Panorama.
+        since: Only return entries received at or after this time, in the
+            ``YYYY/MM/DD HH:MM:SS`` format used by PAN-OS.
+        nlogs: Maximum number of entries to return.
+
+    Returns:
+        A list of ``entry`` elements, newest first.
+    """
+    log_filter = f"(receive_time geq '{since}')" if since else None
+    response = pan.xapi.log(log_type="config", nlogs=nlogs, filter=log_filter)
+    return response.findall("./result/log/logs/entry")
+
+
+# ----------------------------------------------------------------------------
+# Function to find the newest configuration change on Panorama
+# ----------------------------------------------------------------------------
+def latest_change(pan) -> Optional[str]:
+    """
+    Return the time of the newest configuration change on Panorama.
+
+    This is recorded as the watermark of a full refresh, so that the next
+    incremental refresh knows where to continue from. The time comes from
+    Panorama's own clock, which makes it immune to clock skew.
+
+    Args:
+        pan: An instance of Panorama.
+
+    Returns:
+        The ``receive_time`` of the newest log entry, or None when the log
+        is empty or could not be read.
+    """
+    try:
+        entries = query_config_log(pan, nlogs=1)
+    except Exception as e:
+        logging.warning(f"Unable to read the configuration log: {e}")
+        return None
+    return entries[0].findtext("receive_time") if entries else None
+
+
+# ----------------------------------------------------------------------------
+# Function to find the locations changed since a point in time
+# ----------------------------------------------------------------------------
+def changed_locations(pan, since: str) -> Tuple[Optional[Set[str]], Optional[str]]:
+    """
+    Find the locations with configuration changes since a point in time.
+
+    The ``path`` of a configuration log entry is the CLI path of the change,
+    for example ``device-group  Branch  address  web01``. The first two words
+    identify the device group, while changes to the shared scope start with
+    ``shared``.
+
+    Args:
+        pan: An instance of Panorama.
+        since: The watermark of the previous refresh.
+
+    Returns:
+        A tuple of the changed locations and the new watermark. The set of
+        locations is None when the log could not be read, or when it holds
+        more entries than were returned, in which case a full refresh is
+        required.
+    """
+    nlogs = 5000
+    try:
+        entries = query_config_log(pan, since=since, nlogs=nlogs)
+    except Exception as e:
+        logging.warning(f"Unable to read the configuration log: {e}")
+        return None, None
+    if len(entries) >= nlogs:
+        return None, None
+
+    locations = set()
+    watermark = since
+    for entry in entries:
+        received = entry.findtext("receive_time")
+        if received and received > watermark:
+            watermark = received
+        words = (entry.findtext("path") or "").split()
+        if words[:1] == ["shared"]:
+            locations.add("Shared")
+        elif words[:1] == ["device-group"] and len(words) > 1:
+            locations.add(words[1])
+
+    return locations, watermark
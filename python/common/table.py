@@ -0,0 +1,97 @@
+"""Render rows as a text table, with the standard library only.
+
+The scripts used to build a pandas DataFrame and hand it to tabulate just
+to print a few rows, which made pandas the bulk of their start-up time.
+`render_table` draws the same ``fancy_outline`` table directly: a numbered
+index column, the column positions as headers, numbers aligned on their
+decimal point and everything else aligned left.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+from typing import Any, List, Optional, Sequence
+
+
+# ----------------------------------------------------------------------------
+# Helpers to format cells
+# ----------------------------------------------------------------------------
+def is_number(value: Any) -> bool:
+    """Tell whether a cell holds a number, which is aligned right."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def cell(value: Any) -> str:
+    """Format a cell, leaving missing values empty."""
+    return "" if value is None else str(value)
+
+
+# ----------------------------------------------------------------------------
+# Function to render a table
+# ----------------------------------------------------------------------------
+def render_table(
+    rows: Sequence[Sequence[Any]], headers: Optional[Sequence[str]] = None
+) -> str:
+    """
+    Render rows as a table drawn with box-drawing characters.
+
+    Args:
+        rows: The rows, each a sequence of cells. Shorter rows are padded
+            with empty cells.
+        headers: The column headers, the column positions by default.
+
+    Returns:
+        The table, without a trailing newline.
+    """
+    width = max((len(row) for row in rows), default=0)
+    if headers is None:
+        headers = [str(position) for position in range(width)]
+    # the index column comes first, with an empty header
+    columns: List[List[Any]] = [list(range(len(rows)))] + [
+        [row[i] if i < len(row) else None for row in rows] for i in range(width)
+    ]
+    titles = [""] + [str(header) for header in headers]
+
+    right = [
+        all(is_number(value) for value in column if value is not None)
+        and any(value is not None for value in column)
+        for column in columns
+    ]
+    texts = [[cell(value) for value in column] for column in columns]
+    for position, column in enumerate(texts):
+        if right[position]:
+            # pad the fractional parts, so that decimal points line up
+            fractions = [len(text) - len(text.split(".")[0]) for text in column]
+            texts[position] = [
+                text + " " * (max(fractions) - fraction) if text else text
+                for text, fraction in zip(column, fractions)
+            ]
+    # headers keep a margin of two characters, as tabulate does
+    widths = [
+        max([len(title) + 2] + [len(text) for text in column])
+        for title, column in zip(titles, texts)
+    ]
+
+    def line(values: Sequence[str]) -> str:
+        cells = [
+            value.rjust(size) if align else value.ljust(size)
+            for value, size, align in zip(values, widths, right)
+        ]
+        return "│ " + " │ ".join(cells) + " │"
+
+    def rule(left: str, fill: str, middle: str, end: str) -> str:
+        return left + middle.join(fill * (size + 2) for size in widths) + end
+
+    lines = [rule("╒", "═", "╤", "╕"), line(titles), rule("╞", "═", "╪", "╡")]
+    lines += [line([column[i] for column in texts]) for i in range(len(rows))]
+    lines.append(rule("╘", "═", "╧", "╛"))
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+"""Check whether a configuration change would change anything.
+
+A ``set`` merges an element into the configuration at an xpath, and a
+commit then applies the candidate configuration. Both are wasted when the
+configuration already holds the element, which is the case on most runs of
+a script rolling out a fixed change. This module compares the desired
+element with the configuration returned by a ``get`` of the same xpath, so
+that the write and the commit can be skipped.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import xml.etree.ElementTree as ET
+from typing import Union
+
+
+# ----------------------------------------------------------------------------
+# Function to compare two configuration elements
+# ----------------------------------------------------------------------------
+def is_subset(desired: ET.Element, actual: ET.Element) -> bool:
+    """
+    Check whether merging one element into another would leave it unchanged.
+
+    This follows the merge done by a ``set``: the order of children does not
+    matter, and children of `actual` missing from `desired` are kept.
+
+    Args:
+        desired: The element that would be set.
+        actual: The element currently in the configuration.
+
+    Returns:
+        True when every attribute, text and child of `desired` is already
+        present in `actual`.
+    """
+    if desired.tag != actual.tag:
+        return False
+    for name, value in desired.attrib.items():
+        if actual.get(name) != value:
+            return False
+    text = (desired.text or "").strip()
+    if text and text != (actual.text or "").strip():
+        return False
+    return all(
+        any(is_subset(child, candidate) for candidate in actual.iterfind(child.tag))
+        for child in desired
+    )
+
+
+# ----------------------------------------------------------------------------
+# Function to check a set against the current configuration
+# ----------------------------------------------------------------------------
+def is_compliant(response: ET.Element, element: Union[str, ET.Element]) -> bool:
+    """
+    Check whether a ``set`` of an element at an xpath would change anything.
+
+    Args:
+        response: The ``response`` element of a ``get`` of the xpath, for
+            example the return value of ``device.xapi.get(xpath)``.
+        element: The element that would be passed to the ``set``, either
+            parsed or as a string. The string may hold several elements,
+            such as a list of entries.
+
+    Returns:
+        True when the configuration already holds the element, in which case
+        the ``set`` and the commit following it can be skipped.
+    """
+    if isinstance(element, str):
+        desired = list(ET.fromstring(f"<root>{element}</root>"))
+    else:
+        desired = [element]
+
+    # The result holds the node at the end of the xpath, if it exists
+    current = response.find("./result/*")
+    if current is None:
+        return False
+    return all(
+        any(is_subset(child, candidate) for candidate in current.iterfind(child.tag))
+        for child in desired
+    )
@@ -0,0 +1,86 @@
+"""Stream configuration entries out of an XML API response.
+
+pan-os-python reads a whole response into memory, parses it into an
+ElementTree and then builds an object for every entry. For large rulebases
+this holds several copies of the data at once. This module parses the
+response incrementally while it is being downloaded, hands out one
+``entry`` element at a time and discards it once the caller moves on, so
+memory use stays flat regardless of the size of the response. Requests go
+through an `ApiClient`, like any other.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import xml.etree.ElementTree as ET
+from typing import IO, Iterator
+
+# third party library imports
+from pan.xapi import PanXapiError
+
+
+# ----------------------------------------------------------------------------
+# Function to stream entries out of an XML document
+# ----------------------------------------------------------------------------
+def iter_entries(source: IO[bytes], depth: int = 4) -> Iterator[ET.Element]:
+    """
+    Parse an XML API response incrementally, yielding its entries.
+
+    Args:
+        source: A binary file-like object holding the response.
+        depth: Nesting level of the entries to yield. A ``get`` of a list of
+            entries returns ``response/result/<container>/entry``, which puts
+            the entries at level 4.
+
+    Yields:
+        Each ``entry`` element at `depth`, fully parsed. The element is
+        removed from the document once the caller asks for the next one, so
+        it must not be kept around.
+    """
+    stack = []
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(element)
+            continue
+
+        stack.pop()
+        if not stack and element.get("status") == "error":
+            message = " ".join(element.itertext()).strip()
+            raise PanXapiError(message or "XML API request failed")
+        if len(stack) == depth - 1 and element.tag == "entry":
+            yield element
+            stack[-1].remove(element)
+
+
+# ----------------------------------------------------------------------------
+# Function to stream the entries of a configuration xpath
+# ----------------------------------------------------------------------------
+def iter_config_entries(
+    client, xpath: str, action: str = "get"
+) -> Iterator[ET.Element]:
+    """
+    Stream the entries below a configuration xpath.
+
+    Args:
+        client: The `ApiClient` of the firewall or Panorama, whose pooled
+            connections, rate limit, hooks and instrumentation the request
+            goes through.
+        xpath: Xpath of the list of entries, for example
+            ``/config/shared/pre-rulebase/security/rules``.
+        action: ``get`` for the candidate configuration, ``show`` for the
+            running configuration.
+
+    Yields:
+        Each ``entry`` element below `xpath`, see `iter_entries`.
+    """
+    with client.stream({"type": "config", "action": action, "xpath": xpath}) as body:
+        yield from iter_entries(body)
@@ -0,0 +1,75 @@
+"""Build xpaths from configuration names.
+
+Names of device groups, templates, rules or peers come from the
+configuration or from spec files, and may hold quotes. Put into an xpath as
+``entry[@name='{name}']``, a name with a single quote breaks the request,
+or selects another entry than intended. `entry` quotes the name as an XPath
+string literal instead, and `find_entry` looks an entry up in an element
+already fetched, where ElementTree offers no way to quote it at all.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+
+# ----------------------------------------------------------------------------
+# Functions to build xpaths
+# ----------------------------------------------------------------------------
+def literal(value: str) -> str:
+    """
+    Quote a string as an XPath 1.0 literal.
+
+    XPath has no escape character: a string is quoted with single quotes,
+    or with double quotes when it holds a single quote, and one holding both
+    is built with ``concat()``.
+
+    Args:
+        value: The string to quote.
+
+    Returns:
+        The literal, quotes included.
+    """
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    separator = ', "\'", '
+    parts = separator.join(f"'{part}'" for part in value.split("'"))
+    return f"concat({parts})"
+
+
+def entry(name: str) -> str:
+    """Return the xpath step selecting the entry with the given name."""
+    return f"entry[@name={literal(name)}]"
+
+
+# ----------------------------------------------------------------------------
+# Function to find an entry in a fetched element
+# ----------------------------------------------------------------------------
+def find_entry(element: ET.Element, name: str) -> Optional[ET.Element]:
+    """
+    Find the ``entry`` child of an element with the given name.
+
+    Args:
+        element: The element holding the entries.
+        name: The name of the entry.
+
+    Returns:
+        The entry, or None when the element has none of that name.
+    """
+    for child in element.iterfind("entry"):
+        if child.get("name") == name:
+            return child
+    return None
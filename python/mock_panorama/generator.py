@@ -0,0 +1,253 @@
+"""Generate synthetic Panorama configurations.
+
+The configuration has the layout of a real Panorama: shared objects and
+rules, and device groups each holding their own address objects, address
+groups and pre and post security rules. Objects are spread evenly across
+Shared and the device groups, groups reference objects visible from their
+location, and rules reference those objects and groups, so that searches
+and exports do the same work they would on a real configuration.
+
+The output only depends on the arguments, so every run with the same
+arguments produces the same configuration.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import argparse
+import ipaddress
+import random
+import xml.etree.ElementTree as ET
+from typing import List
+
+APPLICATIONS = ("ssl", "web-browsing", "dns", "ssh", "ntp", "smtp", "ldap", "any")
+SERVICES = ("application-default", "service-http", "service-https", "any")
+ZONES = ("trust", "untrust", "dmz", "guest")
+PROFILE_GROUPS = ("default", "strict", "outbound")
+
+
+# ----------------------------------------------------------------------------
+# Helpers to build configuration elements
+# ----------------------------------------------------------------------------
+def members(parent: ET.Element, tag: str, values: List[str]) -> ET.Element:
+    """Add an element holding a list of members."""
+    element = ET.SubElement(parent, tag)
+    for value in values:
+        ET.SubElement(element, "member").text = value
+    return element
+
+
+def split(total: int, parts: int) -> List[int]:
+    """Split a number as evenly as possible."""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def address_value(rng: random.Random, number: int):
+    """
+    Return the type and value of the address object numbered `number`.
+
+    Every object gets its own block of 64 addresses in 10.0.0.0/8, so that
+    values repeat only after about 260,000 objects.
+    """
+    base = ipaddress.IPv4Address("10.0.0.0") + number * 64 % 2**24
+    kind = rng.random()
+    if kind < 0.7:
+        prefix = rng.choice((32, 32, 32, 30, 28, 26))
+        address = base + rng.randint(1, 62) if prefix == 32 else base
+        return "ip-netmask", f"{address}/{prefix}"
+    if kind < 0.85:
+        first = base + rng.randint(1, 30)
+        return "ip-range", f"{first}-{first + rng.randint(1, 30)}"
+    return "fqdn", f"host{number}.example.com"
+
+
+# ----------------------------------------------------------------------------
+# Function to fill one location with objects and rules
+# ----------------------------------------------------------------------------
+def populate(
+    rng: random.Random,
+    location: ET.Element,
+    prefix: str,
+    addresses: int,
+    address_groups: int,
+    rules: int,
+    first_address: int,
+    visible: List[str],
+) -> List[str]:
+    """
+    Add address objects, address groups and security rules to a location.
+
+    Args:
+        rng: The random generator driving the choices.
+        location: The ``shared`` element or the entry of a device group.
+        prefix: Prefix of the names of the objects, unique per location.
+        addresses: Number of address objects to add.
+        address_groups: Number of address groups to add.
+        rules: Number of security rules to add, split between the pre and
+            post rulebases.
+        first_address: Number of the first address object, so that values
+            do not repeat across locations.
+        visible: Names of the objects and groups of Shared, which the
+            objects and rules of a device group may reference.
+
+    Returns:
+        The names of the objects and groups added.
+    """
+    names = []
+    container = ET.SubElement(location, "address")
+    for number in range(addresses):
+        name = f"{prefix}-addr-{number}"
+        entry = ET.SubElement(container, "entry", name=name)
+        address_type, value = address_value(rng, first_address + number)
+        ET.SubElement(entry, address_type).text = value
+        names.append(name)
+
+    container = ET.SubElement(location, "address-group")
+    for number in range(address_groups):
+        name = f"{prefix}-group-{number}"
+        entry = ET.SubElement(container, "entry", name=name)
+        candidates = names + visible
+        if candidates:
+            size = min(len(candidates), rng.randint(2, 10))
+            members(entry, "static", rng.sample(candidates, size))
+        else:
+            ET.SubElement(entry, "dynamic")
+            ET.SubElement(entry[0], "filter").text = "'synthetic'"
+        names.append(name)
+
+    candidates = names + visible
+    for rulebase, count in zip(("pre-rulebase", "post-rulebase"), split(rules, 2)):
+        container = ET.SubElement(
+            ET.SubElement(ET.SubElement(location, rulebase), "security"), "rules"
+        )
+        for number in range(count):
+            entry = ET.SubElement(
+                container, "entry", name=f"{prefix}-{rulebase[:-9]}-rule-{number}"
+            )
+            members(entry, "from", [rng.choice(ZONES)])
+            members(entry, "to", [rng.choice(ZONES)])
+            for field in ("source", "destination"):
+                if candidates and rng.random() < 0.8:
+                    size = min(len(candidates), rng.randint(1, 4))
+                    members(entry, field, rng.sample(candidates, size))
+                else:
+                    members(entry, field, ["any"])
+            members(entry, "source-user", ["any"])
+            members(entry, "category", ["any"])
+            members(entry, "application", [rng.choice(APPLICATIONS)])
+            members(entry, "service", [rng.choice(SERVICES)])
+            ET.SubElement(entry, "action").text = rng.choice(("allow", "deny"))
+            if rng.random() < 0.6:
+                members(
+                    ET.SubElement(entry, "profile-setting"),
+                    "group",
+                    [rng.choice(PROFILE_GROUPS)],
+                )
+            ET.SubElement(entry, "description").text = f"synthetic rule {number}"
+    return names
+
+
+# ----------------------------------------------------------------------------
+# Function to generate a whole configuration
+# ----------------------------------------------------------------------------
+def generate_config(
+    device_groups: int = 10,
+    addresses: int = 1000,
+    address_groups: int = 100,
+    rules: int = 500,
+    seed: int = 0,
+) -> ET.Element:
+    """
+    Generate a synthetic Panorama configuration.
+
+    Objects, groups and rules are split evenly between Shared and every
+    device group.
+
+    Args:
+        device_groups: Number of device groups.
+        addresses: Total number of address objects.
+        address_groups: Total number of address groups.
+        rules: Total number of security rules.
+        seed: Seed of the random generator.
+
+    Returns:
+        The ``config`` element.
+    """
+    rng = random.Random(seed)
+    config = ET.Element("config")
+    shared = ET.SubElement(config, "shared")
+    device = ET.SubElement(
+        ET.SubElement(config, "devices"), "entry", name="localhost.localdomain"
+    )
+    groups = ET.SubElement(device, "device-group")
+
+    # an empty exclusion list, for ssl_decrypt_exception/app.py
+    template = ET.SubElement(ET.SubElement(device, "template"), "entry", name="Network")
+    ssl_decrypt = ET.SubElement(
+        ET.SubElement(ET.SubElement(template, "config"), "shared"), "ssl-decrypt"
+    )
+    ET.SubElement(ssl_decrypt, "ssl-exclude-cert")
+
+    locations = device_groups + 1
+    shares = zip(
+        split(addresses, locations),
+        split(address_groups, locations),
+        split(rules, locations),
+    )
+    first_address = 0
+    visible: List[str] = []
+    for number, (address_count, group_count, rule_count) in enumerate(shares):
+        if number == 0:
+            location, prefix = shared, "shared"
+        else:
+            prefix = f"dg-{number:04d}"
+            location = ET.SubElement(groups, "entry", name=prefix)
+        names = populate(
+            rng,
+            location,
+            prefix,
+            address_count,
+            group_count,
+            rule_count,
+            first_address,
+            visible,
+        )
+        if number == 0:
+            # device groups reference a sample of the shared objects
+            visible = rng.sample(names, min(len(names), 100))
+        first_address += address_count
+    return config
+
+
+# ----------------------------------------------------------------------------
+# Main execution of our script
+# ----------------------------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--device-groups", type=int, default=10)
+    parser.add_argument("--addresses", type=int, default=1000)
+    parser.add_argument("--address-groups", type=int, default=100)
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", "-o", default="config.xml", help="file to write the configuration"
+    )
+    args = parser.parse_args()
+
+    config = generate_config(
+        args.device_groups, args.addresses, args.address_groups, args.rules, args.seed
+    )
+    ET.ElementTree(config).write(args.output, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
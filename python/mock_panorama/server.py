@@ -0,0 +1,729 @@
+"""A stand-in for the XML API of Panorama, for offline tests and benchmarks.
+
+The server answers the requests the scripts in this repository send, from a
+configuration held in memory:
+
+- ``keygen``, returning a fixed API key, which every other request must use
+- ``config`` requests (``get``, ``show``, ``set``, ``edit``, ``delete``,
+  ``rename`` and ``multi-config``) on the configuration, addressed by xpath
+- ``op`` commands: ``show system info``, ``show jobs``, and
+  ``show rule-hit-count`` with synthetic hit counts
+- ``commit`` and commit-all, started as jobs that finish after a while
+- ``log`` queries of the configuration log, which records every change
+
+The configuration is read from a file or generated by `generator.py`. Every
+request can be delayed to mimic a busy management plane, and the number of
+requests and bytes exchanged is available at ``/stats``.
+
+The candidate and running configurations are one and the same, and xpaths
+are limited to the ``tag`` and ``tag[@name='value']`` steps the scripts
+use.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# local imports
+from generator import generate_config
+
+STEP = re.compile(r"""^([\w\-.:]+)(?:\[@name=(['"])(.*)\2\])?$""")
+RECEIVE_TIME = re.compile(r"receive_time\s+geq\s+'([^']+)'")
+
+
+# ----------------------------------------------------------------------------
+# Helpers to build responses
+# ----------------------------------------------------------------------------
+def success(*children: ET.Element, **attributes: str) -> ET.Element:
+    """Build a successful response holding `children` in its result."""
+    response = ET.Element("response", status="success", **attributes)
+    result = ET.SubElement(response, "result")
+    result.extend(children)
+    return response
+
+
+def error(message: str, code: str = "17") -> ET.Element:
+    """Build an error response."""
+    response = ET.Element("response", status="error", code=code)
+    line = ET.SubElement(ET.SubElement(response, "msg"), "line")
+    line.text = message
+    return response
+
+
+def leaf(parent: ET.Element, tag: str, text) -> ET.Element:
+    """Add an element holding text."""
+    element = ET.SubElement(parent, tag)
+    element.text = str(text)
+    return element
+
+
+def split_xpath(xpath: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Split an absolute xpath into (tag, name) steps.
+
+    Slashes within quotes, as in ``entry[@name='10.0.0.0/8']``, do not
+    separate steps.
+
+    A final ``@name`` step, which selects the names of entries only, is
+    returned as ("@name", None).
+
+    Raises:
+        ValueError: When a step is not of the ``tag`` or
+            ``tag[@name='value']`` form.
+    """
+    steps, current, quote = [], "", None
+    for character in xpath:
+        if quote:
+            quote = None if character == quote else quote
+        elif character in "'\"":
+            quote = character
+        elif character == "/":
+            if current:
+                steps.append(current)
+            current = ""
+            continue
+        current += character
+    if current:
+        steps.append(current)
+
+    parsed = []
+    for step in steps:
+        if step == "@name" and step is steps[-1]:
+            parsed.append(("@name", None))
+            continue
+        match = STEP.match(step)
+        if match is None:
+            raise ValueError(f"Unsupported xpath step: {step}")
+        parsed.append((match.group(1), match.group(3)))
+    return parsed
+
+
+# ----------------------------------------------------------------------------
+# The mock device
+# ----------------------------------------------------------------------------
+class MockPanorama:
+    """
+    Answer XML API requests from an in-memory configuration.
+
+    Args:
+        config: The ``config`` element.
+        api_key: The key returned by ``keygen`` and required by every other
+            request.
+        latency: Seconds every request is delayed by.
+        jitter: Up to this many seconds are added to `latency` at random.
+        commit_seconds: Seconds a commit job takes to finish.
+        commit_fail_rate: Share of commit jobs finishing with result FAIL.
+        seed: Seed of the random generator used for jitter and failures.
+    """
+
+    def __init__(
+        self,
+        config: ET.Element,
+        api_key: str = "mock-api-key",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        commit_seconds: float = 5.0,
+        commit_fail_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.root = ET.Element("root")
+        self.root.append(config)
+        self.api_key = api_key
+        self.latency = latency
+        self.jitter = jitter
+        self.commit_seconds = commit_seconds
+        self.commit_fail_rate = commit_fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.jobs: Dict[int, dict] = {}
+        self.logs: List[dict] = []
+        self.dirty = False
+        self.reset_stats()
+
+    # ------------------------------------------------------------------------
+    # Statistics
+    # ------------------------------------------------------------------------
+    def reset_stats(self) -> dict:
+        """Reset the request counters, returning their previous values."""
+        with self.lock:
+            previous = getattr(self, "stats", {})
+            self.stats = {
+                "requests": 0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "types": {},
+                "job_requests": 0,
+                "job_bytes": 0,
+            }
+            return previous
+
+    def count(self, request_type: str, bytes_in: int, bytes_out: int) -> None:
+        """
+        Record one request.
+
+        ``show jobs`` requests, typed ``op/jobs``, are also counted apart:
+        how many a script sends depends on how long its jobs take.
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_in"] += bytes_in
+            self.stats["bytes_out"] += bytes_out
+            types = self.stats["types"]
+            types[request_type] = types.get(request_type, 0) + 1
+            if request_type == "op/jobs":
+                self.stats["job_requests"] += 1
+                self.stats["job_bytes"] += bytes_in + bytes_out
+
+    # ------------------------------------------------------------------------
+    # Request dispatch
+    # ------------------------------------------------------------------------
+    def handle(self, params: Dict[str, str]) -> Tuple[int, bytes]:
+        """
+        Answer one XML API request.
+
+        Args:
+            params: The query parameters, with the API key as ``key``.
+
+        Returns:
+            The HTTP status and the serialized ``response`` element.
+        """
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        request_type = params.get("type")
+        if request_type == "keygen":
+            key = ET.Element("key")
+            key.text = self.api_key
+            return 200, ET.tostring(success(key), encoding="utf-8")
+        if params.get("key") != self.api_key:
+            return 403, ET.tostring(error("Invalid credentials.", "403"), "utf-8")
+
+        handlers = {
+            "config": self.config,
+            "op": self.op,
+            "commit": self.commit,
+            "log": self.log,
+        }
+        if request_type not in handlers:
+            response = error(f"Unsupported request type: {request_type}")
+            return 400, ET.tostring(response, encoding="utf-8")
+        # the response may hold parts of the configuration, so it is
+        # serialized before another request can change them
+        with self.lock:
+            try:
+                response = handlers[request_type](params)
+            except (ValueError, ET.ParseError) as e:
+                response = error(str(e))
+            return 200, ET.tostring(response, encoding="utf-8")
+
+    # ------------------------------------------------------------------------
+    # Configuration
+    # ------------------------------------------------------------------------
+    def find(self, xpath: str) -> List[ET.Element]:
+        """Return the elements an xpath points to."""
+        nodes = [self.root]
+        for tag, name in split_xpath(xpath):
+            if tag == "@name":
+                # only the names of the entries, as with a name_only refresh
+                return [ET.Element(node.tag, name=node.get("name")) for node in nodes]
+            nodes = [
+                child
+                for node in nodes
+                for child in node.iterfind(tag)
+                if name is None or child.get("name") == name
+            ]
+        return nodes
+
+    def ensure(self, steps: List[Tuple[str, Optional[str]]]) -> ET.Element:
+        """Return the element of an xpath, creating the missing elements."""
+        node = self.root
+        for tag, name in steps:
+            for child in node.iterfind(tag):
+                if name is None or child.get("name") == name:
+                    node = child
+                    break
+            else:
+                node = ET.SubElement(node, tag, {"name": name} if name else {})
+        return node
+
+    def merge(self, target: ET.Element, element: ET.Element) -> None:
+        """Merge an element into the configuration, the way ``set`` does."""
+        target.attrib.update(element.attrib)
+        if element.text and element.text.strip():
+            target.text = element.text
+        for child in element:
+            if child.tag == "member":
+                current = [m for m in target.iterfind("member") if m.text == child.text]
+            elif child.get("name") is not None:
+                current = [
+                    c
+                    for c in target.iterfind(child.tag)
+                    if c.get("name") == child.get("name")
+                ]
+            else:
+                current = list(target.iterfind(child.tag))
+            if current:
+                self.merge(current[0], child)
+            else:
+                target.append(copy.deepcopy(child))
+
+    def config(self, params: Dict[str, str]) -> ET.Element:
+        """Answer a ``type=config`` request."""
+        action = params.get("action")
+        xpath = params.get("xpath", "")
+        if action in ("get", "show"):
+            nodes = self.find(xpath)
+            if not nodes and action == "show":
+                return error("No such node", code="7")
+            count = str(len(nodes))
+            return success(*nodes, **{"total-count": count, "count": count})
+
+        if action == "multi-config":
+            return self.multi_config(params)
+        if action == "set":
+            target = self.ensure(split_xpath(xpath))
+            element = ET.fromstring(f"<root>{params.get('element', '')}</root>")
+            self.merge(target, element)
+        elif action == "edit":
+            steps = split_xpath(xpath)
+            parent = self.ensure(steps[:-1])
+            element = ET.fromstring(params.get("element", ""))
+            current = self.find(xpath)
+            for position, child in enumerate(list(parent)):
+                if child in current:
+                    parent.remove(child)
+                    parent.insert(position, element)
+                    break
+            else:
+                parent.append(element)
+        elif action == "delete":
+            steps = split_xpath(xpath)
+            for parent in self.find("/" + "/".join(self.format(steps[:-1]))):
+                for child in list(parent):
+                    tag, name = steps[-1]
+                    if child.tag == tag and (name is None or child.get("name") == name):
+                        parent.remove(child)
+        elif action == "rename":
+            nodes = self.find(xpath)
+            if not nodes:
+                raise ValueError(f"No such node: {xpath}")
+            newname = params.get("newname", "")
+            parent = self.find("/" + "/".join(self.format(split_xpath(xpath)[:-1])))
+            if any(child.get("name") == newname for child in parent[0]):
+                raise ValueError(f"{newname} already exists")
+            nodes[0].set("name", newname)
+        else:
+            raise ValueError(f"Unsupported config action: {action}")
+
+        self.dirty = True
+        self.record_change(action, xpath)
+        return ET.Element("response", status="success", code="20")
+
+    def multi_config(self, params: Dict[str, str]) -> ET.Element:
+        """Apply the requests of a ``multi-config``, all of them or none."""
+        saved = copy.deepcopy(self.root)
+        dirty, logs = self.dirty, len(self.logs)
+        responses = []
+        for request in ET.fromstring(params.get("element", "")):
+            sub_params = {
+                "action": request.tag,
+                "xpath": request.get("xpath", ""),
+                "newname": request.get("newname", ""),
+                "element": "".join(ET.tostring(c, encoding="unicode") for c in request),
+            }
+            try:
+                self.config(sub_params)
+            except ValueError as e:
+                self.root, self.dirty = saved, dirty
+                del self.logs[logs:]
+                return error(f"request {request.get('id')}: {e}")
+            responses.append(
+                ET.Element("response", id=request.get("id", ""), status="success")
+            )
+        return success(*responses)
+
+    @staticmethod
+    def format(steps: List[Tuple[str, Optional[str]]]) -> List[str]:
+        """Turn xpath steps back into strings."""
+        return [
+            f"{tag}[@name={quote}{name}{quote}]" if name else tag
+            for tag, name in steps
+            for quote in ['"' if name and "'" in name else "'"]
+        ]
+
+    def record_change(self, action: str, xpath: str) -> None:
+        """Add an entry to the configuration log, with its CLI style path."""
+        words = []
+        for tag, name in split_xpath(xpath)[1:]:
+            if tag == "entry" and name == "localhost.localdomain":
+                continue
+            words.append(name if tag == "entry" else tag)
+        if words[:1] == ["devices"]:
+            words = words[1:]
+        self.logs.append(
+            {
+                "receive_time": time.strftime("%Y/%m/%d %H:%M:%S"),
+                "cmd": action,
+                "admin": "admin",
+                "path": " ".join(words),
+            }
+        )
+
+    # ------------------------------------------------------------------------
+    # Operational commands
+    # ------------------------------------------------------------------------
+    def op(self, params: Dict[str, str]) -> ET.Element:
+        """Answer a ``type=op`` request."""
+        cmd = ET.fromstring(params.get("cmd", "<show/>"))
+        if cmd.find("./system/info") is not None:
+            system = ET.Element("system")
+            leaf(system, "hostname", "mock-panorama")
+            leaf(system, "model", "Panorama")
+            leaf(system, "serial", "000000000000")
+            leaf(system, "sw-version", "10.2.0")
+            leaf(system, "multi-vsys", "off")
+            return success(system)
+        if cmd.find("./jobs/all") is not None:
+            return success(*(self.job_element(job) for job in self.jobs.values()))
+        if cmd.find("./jobs/id") is not None:
+            job_id = int(cmd.findtext("./jobs/id").strip().strip('"'))
+            if job_id not in self.jobs:
+                return error(f"job {job_id} not found")
+            return success(self.job_element(self.jobs[job_id]))
+        if cmd.find("./rule-hit-count") is not None:
+            return success(self.hit_counts(cmd))
+        if cmd.find("./dg-hierarchy") is not None:
+            return success(self.dg_hierarchy())
+        return success()
+
+    def dg_hierarchy(self) -> ET.Element:
+        """Nest the device groups under the parents set in the readonly config."""
+        parents = {
+            entry.get("name"): entry.findtext("parent-dg")
+            for entry in self.find(
+                "/config/readonly/devices/entry[@name='localhost.localdomain']"
+                "/device-group/entry"
+            )
+        }
+        names = [
+            entry.get("name")
+            for entry in self.find(
+                "/config/devices/entry[@name='localhost.localdomain']"
+                "/device-group/entry"
+            )
+        ]
+        result = ET.Element("dg-hierarchy")
+        elements = {name: ET.Element("dg", name=name) for name in names}
+        for name in names:
+            parent = elements.get(parents.get(name), result)
+            parent.append(elements[name])
+        return result
+
+    def hit_counts(self, cmd: ET.Element) -> ET.Element:
+        """Build synthetic hit counts for the rules of a device group."""
+        location = cmd.find("./rule-hit-count/device-group/entry")
+        group = location.get("name")
+        rulebase = location[0].tag
+        result = ET.Element("rule-hit-count")
+        entry = ET.SubElement(
+            ET.SubElement(result, "device-group"), "entry", name=group
+        )
+        rulebase_entry = ET.SubElement(
+            ET.SubElement(entry, "rule-base"), "entry", name="security"
+        )
+        rules = ET.SubElement(rulebase_entry, "rules")
+        xpath = (
+            "/config/devices/entry[@name='localhost.localdomain']/device-group"
+            f"/entry[@name='{group}']/{rulebase}/security/rules/entry"
+        )
+        for rule in self.find(xpath):
+            digest = hashlib.sha256(f"{group}/{rule.get('name')}".encode()).digest()
+            hits = int.from_bytes(digest[:3], "big")
+            counts = ET.SubElement(rules, "entry", name=rule.get("name"))
+            leaf(counts, "hit-count", hits)
+            leaf(counts, "last-hit-timestamp", 1672531200 + hits if hits else 0)
+        return result
+
+    # ------------------------------------------------------------------------
+    # Commits and jobs
+    # ------------------------------------------------------------------------
+    def commit(self, params: Dict[str, str]) -> ET.Element:
+        """Start a commit or commit-all job."""
+        commit_all = params.get("action") == "all"
+        if not commit_all and not self.dirty:
+            response = ET.Element("response", status="success", code="19")
+            leaf(response, "msg", "There are no changes to commit.")
+            return response
+        self.dirty = self.dirty and commit_all
+
+        devices = []
+        if commit_all:
+            cmd = ET.fromstring(params.get("cmd", "<commit-all/>"))
+            for group in cmd.iterfind(".//device-group/entry"):
+                devices += [f"{group.get('name')}-fw-{n}" for n in (1, 2)]
+
+        job_id = max(self.jobs, default=0) + 1
+        self.jobs[job_id] = {
+            "id": job_id,
+            "type": "CommitAll" if commit_all else "Commit",
+            "enqueued": time.time(),
+            "failed": self.random.random() < self.commit_fail_rate,
+            "devices": devices,
+        }
+        job = ET.Element("job")
+        job.text = str(job_id)
+        line = ET.Element("msg")
+        leaf(line, "line", f"Commit job enqueued with jobid {job_id}")
+        return success(line, job, code="19")
+
+    def job_element(self, job: dict) -> ET.Element:
+        """Describe a job as ``show jobs`` does, according to its age."""
+        elapsed = time.time() - job["enqueued"]
+        seconds = self.commit_seconds if job["type"].startswith("Commit") else 0
+        progress = 100 if elapsed >= seconds else int(100 * elapsed / seconds)
+        finished = progress == 100
+        result = "PEND" if not finished else "FAIL" if job["failed"] else "OK"
+
+        element = ET.Element("job")
+        enqueued = time.localtime(job["enqueued"])
+        leaf(element, "tenq", time.strftime("%Y/%m/%d %H:%M:%S", enqueued))
+        leaf(element, "id", job["id"])
+        leaf(element, "type", job["type"])
+        leaf(element, "status", "FIN" if finished else "ACT")
+        leaf(element, "result", result)
+        leaf(element, "progress", progress)
+        details = ET.SubElement(element, "details")
+        if finished and job["failed"]:
+            leaf(details, "line", "Validation Error: synthetic failure")
+        if job["devices"]:
+            devices = ET.SubElement(element, "devices")
+            for name in job["devices"]:
+                device = ET.SubElement(devices, "entry")
+                leaf(device, "devicename", name)
+                leaf(device, "status", "FIN" if finished else "ACT")
+                leaf(device, "result", result)
+        return element
+
+    # ------------------------------------------------------------------------
+    # Logs
+    # ------------------------------------------------------------------------
+    def log(self, params: Dict[str, str]) -> ET.Element:
+        """Answer a log query, in two steps as the XML API does."""
+        if params.get("action") != "get":
+            job_id = max(self.jobs, default=0) + 1
+            self.jobs[job_id] = {
+                "id": job_id,
+                "type": "Log",
+                "enqueued": time.time(),
+                "failed": False,
+                "devices": [],
+                "query": params,
+            }
+            job = ET.Element("job")
+            job.text = str(job_id)
+            return success(job)
+
+        job = self.jobs.get(int(params.get("job-id", 0)))
+        if job is None or job["type"] != "Log":
+            raise ValueError("Log job not found")
+        query = job["query"]
+        since = RECEIVE_TIME.search(query.get("query") or "")
+        entries = [
+            entry
+            for entry in reversed(self.logs)
+            if since is None or entry["receive_time"] >= since.group(1)
+        ][: int(query.get("nlogs") or 20)]
+
+        status = ET.Element("job")
+        leaf(status, "id", job["id"])
+        leaf(status, "status", "FIN")
+        log = ET.Element("log")
+        logs = ET.SubElement(log, "logs", count=str(len(entries)), progress="100")
+        for number, values in enumerate(entries):
+            entry = ET.SubElement(logs, "entry", logid=str(number))
+            for name, value in values.items():
+                leaf(entry, name, value)
+        return success(status, log)
+
+
+# ----------------------------------------------------------------------------
+# HTTP front end
+# ----------------------------------------------------------------------------
+class Handler(BaseHTTPRequestHandler):
+    """Translate HTTP requests into calls to the `MockPanorama` of the server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            stats = self.server.device.stats
+            if "reset" in parse_qs(url.query):
+                stats = self.server.device.reset_stats()
+            self.reply(200, json.dumps(stats).encode(), "application/json")
+        else:
+            self.api(url.query, 0)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode()
+        self.api(body, length)
+
+    def api(self, query: str, bytes_in: int) -> None:
+        if not urlparse(self.path).path.startswith("/api"):
+            self.reply(404, b"Not Found", "text/plain")
+            return
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        if "key" not in params and self.headers.get("X-PAN-KEY"):
+            params["key"] = self.headers["X-PAN-KEY"]
+        status, body = self.server.device.handle(params)
+        request_type = "/".join(params[n] for n in ("type", "action") if n in params)
+        if request_type == "op" and "<jobs>" in params.get("cmd", ""):
+            request_type = "op/jobs"
+        self.server.device.count(
+            request_type,
+            bytes_in + len(self.path),
+            len(body),
+        )
+        self.reply(status, body, "application/xml; charset=utf-8")
+
+    def reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(format % args)
+
+
+def self_signed_certificate(directory: str) -> Tuple[str, str]:
+    """Create a throwaway certificate for localhost with the openssl CLI."""
+    if shutil.which("openssl") is None:
+        sys.exit("openssl was not found, pass --cert and --key instead")
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-subj",
+            "/CN=localhost",
+            "-days",
+            "7",
+            "-keyout",
+            key,
+            "-out",
+            cert,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def serve(device: MockPanorama, host: str, port: int, cert=None, key=None):
+    """
+    Create an HTTPS server answering requests with `device`.
+
+    Returns:
+        The server; call ``serve_forever`` on it, possibly in a thread, and
+        ``shutdown`` to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.device = device
+    if cert is None:
+        cert, key = self_signed_certificate(tempfile.mkdtemp())
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+# ----------------------------------------------------------------------------
+# Main execution of our script
+# ----------------------------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--cert", help="certificate, a throwaway one by default")
+    parser.add_argument("--key", help="private key of --cert")
+    parser.add_argument("--config", help="configuration file, generated by default")
+    parser.add_argument("--device-groups", type=int, default=10)
+    parser.add_argument("--addresses", type=int, default=1000)
+    parser.add_argument("--address-groups", type=int, default=100)
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--api-key", default="mock-api-key")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="SECONDS")
+    parser.add_argument("--jitter", type=float, default=0.0, metavar="SECONDS")
+    parser.add_argument("--commit-seconds", type=float, default=5.0)
+    parser.add_argument("--commit-fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.config:
+        config = ET.parse(args.config).getroot()
+    else:
+        config = generate_config(
+            args.device_groups,
+            args.addresses,
+            args.address_groups,
+            args.rules,
+            args.seed,
+        )
+    device = MockPanorama(
+        config,
+        api_key=args.api_key,
+        latency=args.latency,
+        jitter=args.jitter,
+        commit_seconds=args.commit_seconds,
+        commit_fail_rate=args.commit_fail_rate,
+        seed=args.seed,
+    )
+    server = serve(device, args.host, args.port, args.cert, args.key)
+    logging.info(f"Serving on https://{args.host}:{args.port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
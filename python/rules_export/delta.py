@@ -0,0 +1,161 @@
+"""Differential rule exports.
+
+Rather than exporting every rule on every run and diffing the exports
+afterwards, this module keeps a small index holding a content hash of each
+rule, keyed by device group, rulebase and rule name. Each export is
+compared against the index of the previous one, and only the rules that
+were added, removed or modified are written out.
+
+The position of a rule and its hit counts change without the rule itself
+changing, so they are left out of the hash.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+# ----------------------------------------------------------------------------
+# Columns identifying a rule, and columns left out of its hash
+# ----------------------------------------------------------------------------
+KEY_COLUMNS = ('DeviceGroup', 'Rulebase', 'RuleName')
+VOLATILE_COLUMNS = ('Position', 'HitCount', 'LastHitTimestamp')
+
+
+# ----------------------------------------------------------------------------
+# Function to load the index of the previous export
+# ----------------------------------------------------------------------------
+def load_index(
+    filename: str, header: List[str], scope: str
+) -> Dict[Tuple[str, str, str], str]:
+    """
+    Load the rule hashes saved by the previous export.
+
+    Args:
+        filename: The name of the index file.
+        header: The columns of the current export. Hashes taken over other
+            columns cannot be compared, so the index is ignored then.
+        scope: The locations of the current export, ``shared`` or ``all``.
+
+    Returns:
+        A dictionary mapping (device group, rulebase, rule name) to the hash
+        of the rule, empty when there is no usable index.
+
+    Raises:
+        ValueError: When the index was saved by an export of other
+            locations, whose rules would all be reported as removed.
+    """
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as indexfile:
+        index = json.load(indexfile)
+    # indexes saved before the scope was recorded are taken as they are
+    if index.get('scope', scope) != scope:
+        raise ValueError(
+            f"{filename} was saved by an export of {index['scope']} locations, "
+            f"not {scope}; pass another index file to --delta"
+        )
+    if index.get('header') != header:
+        logging.warning(
+            f"{filename} was saved with different columns, treating every rule as new"
+        )
+        return {}
+    return {tuple(rule[:3]): rule[3] for rule in index['rules']}
+
+
+# ----------------------------------------------------------------------------
+# Function to save the index of the current export
+# ----------------------------------------------------------------------------
+def save_index(
+    filename: str,
+    header: List[str],
+    index: Dict[Tuple[str, str, str], str],
+    scope: str,
+) -> None:
+    """
+    Save the rule hashes of the current export.
+
+    The file is replaced atomically, so an interrupted run leaves the index
+    of the previous export in place.
+
+    Args:
+        filename: The name of the index file.
+        header: The columns of the current export.
+        index: A dictionary mapping rule keys to rule hashes.
+        scope: The locations of the current export, ``shared`` or ``all``.
+    """
+    temporary = f"{filename}.tmp"
+    with open(temporary, 'w') as indexfile:
+        json.dump(
+            {
+                'header': header,
+                'scope': scope,
+                'rules': [list(key) + [h] for key, h in index.items()],
+            },
+            indexfile,
+        )
+    os.replace(temporary, filename)
+
+
+# ----------------------------------------------------------------------------
+# Function to compare rules against the index of the previous export
+# ----------------------------------------------------------------------------
+def diff_rules(
+    data: Iterable[Tuple],
+    header: List[str],
+    previous: Dict[Tuple[str, str, str], str],
+    index: Dict[Tuple[str, str, str], str],
+) -> Iterator[Tuple]:
+    """
+    Compare rules against the previous export, yielding only the changes.
+
+    Rules are hashed one at a time, so `data` can be a generator. Removed
+    rules can only be known once every rule has been seen, so they come
+    last, with every column but the key left empty.
+
+    Args:
+        data: The rows of the current export, matching `header`.
+        header: The columns of the rows, including those of `KEY_COLUMNS`.
+        previous: The index of the previous export, see `load_index`.
+        index: An empty dictionary, filled with the index of the current
+            export for `save_index`.
+
+    Yields:
+        The row of each change, prefixed with 'added', 'modified' or
+        'removed', matching `['Change'] + header`.
+    """
+    key_positions = [header.index(column) for column in KEY_COLUMNS]
+    hashed_positions = [
+        position
+        for position, column in enumerate(header)
+        if column not in VOLATILE_COLUMNS
+    ]
+
+    for row in data:
+        key = tuple(row[position] for position in key_positions)
+        content = json.dumps([row[position] for position in hashed_positions])
+        index[key] = hashlib.sha256(content.encode()).hexdigest()
+        if key not in previous:
+            yield ('added',) + tuple(row)
+        elif previous[key] != index[key]:
+            yield ('modified',) + tuple(row)
+
+    for key in sorted(previous.keys() - index.keys()):
+        row = [None] * len(header)
+        for position, value in zip(key_positions, key):
+            row[position] = value
+        yield ('removed',) + tuple(row)
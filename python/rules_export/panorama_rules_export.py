@@ -15,25 +15,44 @@ limitations under the License.
 
 (c) 2023 Calvin Remsburg
 """
+from __future__ import annotations
+
 # standard library imports
 import os
-import csv
+import sys
+import argparse
 import datetime
 import logging
-from typing import List, Tuple
+import itertools
+import xml.etree.ElementTree as ET
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.concurrency import DevicePool, map_bounded  # noqa
+from common.hierarchy import get_parents  # noqa
+from common.snapshot import SnapshotStore, changed_locations, latest_change  # noqa
+from common.xpath import entry as entry_xpath  # noqa
 
-# third party library imports
-from dotenv import load_dotenv
+# local imports
+from delta import diff_rules, load_index, save_index
+from shadow import OBJECT_CONTAINERS, SHADOW_HEADER, find_shadowed_rules
+from writers import WRITERS, write_csv, write_rules
 
-# Palo Alto Networks imports
-from panos import panorama
-from panos.policies import PreRulebase, PostRulebase, SecurityRule
+# pan-os-python and requests take longer to import than a cached export
+# takes to run, so they are only imported by the functions that need them
+if TYPE_CHECKING:
+    from panos import panorama
 
 
 # ----------------------------------------------------------------------------
 # Load environment variables from .env file
 # ----------------------------------------------------------------------------
-load_dotenv(".env")
+if os.path.exists(".env"):
+    from dotenv import load_dotenv
+
+    load_dotenv(".env")
 PANURL = os.environ.get("PANURL", "panorama.lab.com")
 PANUSER = os.environ.get("PANUSER", "automation")
 PANPASS = os.environ.get("PANPASS", "mysecretpassword")
@@ -43,28 +62,108 @@ PANPASS = os.environ.get("PANPASS", "mysecretpassword")
 # ----------------------------------------------------------------------------
 TIMESTAMP = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")  # Add this line
 OUTPUT_FILE = f'output/panorama_rules_{TIMESTAMP}.csv'  # Modify this line
+DELTA_FILE = f'output/panorama_rules_delta_{TIMESTAMP}.csv'
+SHADOW_FILE = f'output/panorama_rules_shadow_{TIMESTAMP}.csv'
+# one index per scope, `shared` or `all`, so that they are never compared
+INDEX_FILE = 'output/panorama_rules_index_{scope}.json'
+
+# ----------------------------------------------------------------------------
+# CSV headers and xpaths
+# ----------------------------------------------------------------------------
+HEADER = ['RuleName', 'SecurityProfileGroup']
+DEVICE_GROUP_HEADER = ['DeviceGroup', 'Rulebase', 'Position'] + HEADER
+DEVICE_GROUP_XPATH = "/config/devices/entry[@name='localhost.localdomain']/device-group"
+# rulebases and the names of their pan-os-python classes
+RULEBASES = (('pre-rulebase', 'PreRulebase'), ('post-rulebase', 'PostRulebase'))
+
+# rule fields: column, SecurityRule attribute, path below the XML entry, type
+PROFILES = 'profile-setting/profiles'
+RULE_FIELDS = (
+    ('SecurityProfileGroup', 'group', 'profile-setting/group', 'member'),
+    ('From', 'fromzone', 'from', 'member'),
+    ('To', 'tozone', 'to', 'member'),
+    ('Source', 'source', 'source', 'member'),
+    ('Destination', 'destination', 'destination', 'member'),
+    ('SourceUser', 'source_user', 'source-user', 'member'),
+    ('Application', 'application', 'application', 'member'),
+    ('Service', 'service', 'service', 'member'),
+    ('Category', 'category', 'category', 'member'),
+    ('Action', 'action', 'action', 'text'),
+    ('Disabled', 'disabled', 'disabled', 'yesno'),
+    ('NegateSource', 'negate_source', 'negate-source', 'yesno'),
+    ('NegateDestination', 'negate_destination', 'negate-destination', 'yesno'),
+    ('Virus', 'virus', f'{PROFILES}/virus', 'member'),
+    ('Spyware', 'spyware', f'{PROFILES}/spyware', 'member'),
+    ('Vulnerability', 'vulnerability', f'{PROFILES}/vulnerability', 'member'),
+    ('URLFiltering', 'url_filtering', f'{PROFILES}/url-filtering', 'member'),
+    ('FileBlocking', 'file_blocking', f'{PROFILES}/file-blocking', 'member'),
+    ('WildFireAnalysis', 'wildfire_analysis', f'{PROFILES}/wildfire-analysis', 'member'),
+    ('DataFiltering', 'data_filtering', f'{PROFILES}/data-filtering', 'member'),
+    ('LogSetting', 'log_setting', 'log-setting', 'text'),
+    ('Tags', 'tag', 'tag', 'member'),
+    ('Description', 'description', 'description', 'text'),
+)
+FULL_HEADER = (
+    DEVICE_GROUP_HEADER
+    + [column for column, _, _, _ in RULE_FIELDS[1:]]
+    + ['HitCount', 'LastHitTimestamp']
+)
 
 
 # ----------------------------------------------------------------------------
-# Connect to Panorama
+# Connect to Panorama on first use, caching the API key between runs
 # ----------------------------------------------------------------------------
-pan = panorama.Panorama(PANURL, PANUSER, PANPASS)
+_pan = None
+
+
+def get_pan() -> panorama.Panorama:
+    """
+    Return the Panorama instance, creating it on first use.
+
+    Creating it sends nothing; the API key is read from the cache, or
+    generated, when the first request is sent.
+
+    Returns:
+        A Panorama instance sending its requests through an `ApiClient`.
+    """
+    global _pan
+    if _pan is None:
+        from common.client import ApiClient
+        from panos.panorama import Panorama
+
+        _pan = ApiClient(PANURL, PANUSER, PANPASS).device(Panorama)
+    return _pan
 
 
 # ----------------------------------------------------------------------------
 # Function to retrieve security rules and associated Security Profile Groups
 # ----------------------------------------------------------------------------
-def get_security_rules_and_profiles(pan: panorama.Panorama) -> List[Tuple[str, str]]:
+def get_security_rules_and_profiles(
+    pan: panorama.Panorama, parser: str = 'panos'
+) -> List[Tuple[str, str]]:
     """
     Retrieve security rules and their associated Security Profile Groups.
 
     Args:
         pan: An instance of Panorama.
+        parser: 'panos' to build SecurityRule objects, or 'fast' to read the
+            fields out of the XML entries, see `get_rule_entries`.
 
     Returns:
         A list of tuples, each containing the rule name and its associated
         Security Profile Group (or 'N/A' if no group is associated).
     """
+    if parser == 'fast':
+        return [
+            rule_row('Shared', rulebase, position, entry)[3:]
+            for rulebase, _ in RULEBASES
+            for position, entry in enumerate(
+                get_rule_entries(pan, 'Shared', rulebase), start=1
+            )
+        ]
+
+    from panos.policies import PreRulebase, PostRulebase, SecurityRule
+
     # Create Pre Rulebase and Post Rulebase instances
     pre_rulebase = PreRulebase()
     post_rulebase = PostRulebase()
@@ -89,21 +188,514 @@ def get_security_rules_and_profiles(pan: panorama.Panorama) -> List[Tuple[str, s
     return data
 
 
+# ----------------------------------------------------------------------------
+# Function to read the value of a rule field out of its XML entry
+# ----------------------------------------------------------------------------
+def entry_value(entry, path: str, kind: str):
+    """
+    Read a field out of a rule's XML entry, the way pan-os-python parses it.
+
+    Args:
+        entry: The ``entry`` element of the rule.
+        path: Path of the field below the entry.
+        kind: 'member' for lists of members, 'yesno' for booleans, or 'text'.
+
+    Returns:
+        A list of members, a boolean, a string, or None when not set.
+    """
+    if kind == 'member':
+        members = [member.text for member in entry.findall(f"./{path}/member")]
+        return members if members else None
+    text = entry.findtext(path)
+    if kind == 'yesno' and text is not None:
+        return text == 'yes'
+    return text
+
+
+# ----------------------------------------------------------------------------
+# Function to retrieve rule hit counts
+# ----------------------------------------------------------------------------
+def get_hit_counts(device, location: str, rulebase: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Retrieve the hit counts of the security rules of a device group.
+
+    Panorama reports hit counts per device group, aggregated from the
+    firewalls of that group, so nothing is returned for Shared.
+
+    Args:
+        device: The Panorama instance to send the command through.
+        location: 'Shared' or the name of a device group.
+        rulebase: 'pre-rulebase' or 'post-rulebase'.
+
+    Returns:
+        A dictionary mapping rule names to their hit count and the epoch
+        timestamp of their last hit.
+    """
+    if location == 'Shared':
+        return {}
+    cmd = (
+        f'<show><rule-hit-count><device-group><entry name={quoteattr(location)}>'
+        f'<{rulebase}><entry name="security"><rules><all/></rules></entry>'
+        f'</{rulebase}></entry></device-group></rule-hit-count></show>'
+    )
+    try:
+        response = device.op(cmd, cmd_xml=False)
+    except Exception as e:
+        logging.warning(f"Unable to retrieve hit counts of {location} {rulebase}: {e}")
+        return {}
+
+    hit_counts = {}
+    for entry in response.findall(".//rules/entry"):
+        hit_counts[entry.get("name")] = (
+            int(entry.findtext("hit-count") or 0),
+            int(entry.findtext("last-hit-timestamp") or 0),
+        )
+    return hit_counts
+
+
+# ----------------------------------------------------------------------------
+# Function to build the row of a rule
+# ----------------------------------------------------------------------------
+def rule_row(
+    location: str,
+    rulebase: str,
+    position: int,
+    rule,
+    full: bool = False,
+    hit_counts: Optional[Dict[str, Tuple[int, int]]] = None,
+) -> Tuple:
+    """
+    Build the row of a rule, from a SecurityRule object or an XML entry.
+
+    Args:
+        location: 'Shared' or the name of a device group.
+        rulebase: 'pre-rulebase' or 'post-rulebase'.
+        position: Position of the rule within its rulebase, starting at 1.
+        rule: A SecurityRule instance or the ``entry`` element of the rule.
+        full: Include every column of `FULL_HEADER` rather than only those
+            of `DEVICE_GROUP_HEADER`.
+        hit_counts: The result of `get_hit_counts` for the rulebase.
+
+    Returns:
+        A tuple matching `FULL_HEADER`, or `DEVICE_GROUP_HEADER`.
+    """
+    if not isinstance(rule, ET.Element):
+        name = rule.name
+        values = [getattr(rule, attribute) for _, attribute, _, _ in RULE_FIELDS]
+    else:
+        name = rule.get("name")
+        values = [entry_value(rule, path, kind) for _, _, path, kind in RULE_FIELDS]
+
+    security_profile_group = values.pop(0)
+    row = (
+        location,
+        rulebase,
+        position,
+        name,
+        security_profile_group if security_profile_group else 'N/A',
+    )
+    if full:
+        row += tuple(values) + (hit_counts or {}).get(name, (None, None))
+    return row
+
+
+# ----------------------------------------------------------------------------
+# Function to retrieve the security rules of a single location
+# ----------------------------------------------------------------------------
+def get_rulebase_rules(
+    parent,
+    location: str,
+    full: bool = False,
+    parser: str = 'panos',
+    hit_counts: bool = True,
+) -> List[Tuple]:
+    """
+    Retrieve the Pre and Post security rules of Shared or a device group.
+
+    Args:
+        parent: The Panorama instance for Shared, or a DeviceGroup instance.
+        location: The name to report the rules under.
+        full: Include every rule field and the hit counts.
+        parser: 'panos' to build SecurityRule objects, or 'fast' to read the
+            fields out of the XML entries, see `get_rule_entries`.
+        hit_counts: Fetch the hit counts when `full` is set, rather than
+            leaving their columns empty.
+
+    Returns:
+        A list of tuples, each containing the location, the rulebase, the
+        position of the rule within that rulebase, the rule name and its
+        associated Security Profile Group (or 'N/A'), followed by the rest
+        of `FULL_HEADER` when `full` is set.
+    """
+    from panos import policies
+
+    data = []
+    for rulebase_name, rulebase_class in RULEBASES:
+        if parser == 'fast':
+            rules = get_rule_entries(parent, location, rulebase_name)
+        else:
+            rulebase = getattr(policies, rulebase_class)()
+            parent.add(rulebase)
+            rules = policies.SecurityRule.refreshall(rulebase)
+        counts = None
+        if full and hit_counts:
+            counts = get_hit_counts(parent.nearest_pandevice(), location, rulebase_name)
+        for position, rule in enumerate(rules, start=1):
+            data.append(rule_row(location, rulebase_name, position, rule, full, counts))
+
+    return data
+
+
+# ----------------------------------------------------------------------------
+# Function to retrieve the security rules of every device group
+# ----------------------------------------------------------------------------
+def get_device_group_rules(
+    pan: panorama.Panorama,
+    workers: int = 8,
+    retries: int = 3,
+    full: bool = False,
+    parser: str = 'panos',
+    hit_counts: bool = True,
+) -> List[Tuple]:
+    """
+    Retrieve the Pre and Post security rules of Shared and every device group.
+
+    Device groups are fetched concurrently, each worker thread using its own
+    connection to Panorama, and failed requests are retried.
+
+    Args:
+        pan: An instance of Panorama.
+        workers: Number of device groups to fetch at once.
+        retries: Retries of a device group after a server error or timeout.
+        full: Include every rule field and the hit counts.
+        parser: 'panos' or 'fast', see `get_rulebase_rules`.
+        hit_counts: Fetch the hit counts, see `get_rulebase_rules`.
+
+    Returns:
+        The rows of `get_rulebase_rules`, Shared first and then each device
+        group in configuration order, keeping the position of every rule.
+    """
+    from panos import panorama
+
+    device_groups = panorama.DeviceGroup.refreshall(pan, name_only=True)
+    pool = DevicePool(pan)
+
+    def get_device_group(name: str) -> List[Tuple]:
+        device_group = panorama.DeviceGroup(name)
+        pool.get().add(device_group)
+        return get_rulebase_rules(device_group, name, full, parser, hit_counts)
+
+    data = get_rulebase_rules(pan, 'Shared', full, parser, hit_counts)
+    results = map_bounded(
+        get_device_group,
+        [device_group.name for device_group in device_groups],
+        workers=workers,
+        retries=retries,
+    )
+    for rows in results:
+        data.extend(rows)
+
+    return data
+
+
+# ----------------------------------------------------------------------------
+# Function to build the xpath of a rulebase
+# ----------------------------------------------------------------------------
+def rulebase_xpath(location: str, rulebase: str) -> str:
+    """
+    Build the xpath of the security rules of a rulebase.
+
+    Args:
+        location: 'Shared' or the name of a device group.
+        rulebase: 'pre-rulebase' or 'post-rulebase'.
+
+    Returns:
+        The xpath of the list of security rules.
+    """
+    return f"{location_xpath(location)}/{rulebase}/security/rules"
+
+
+# ----------------------------------------------------------------------------
+# Function to build the xpath of a location
+# ----------------------------------------------------------------------------
+def location_xpath(location: str) -> str:
+    """
+    Build the xpath of Shared or a device group.
+
+    Args:
+        location: 'Shared' or the name of a device group.
+
+    Returns:
+        The xpath of the location.
+    """
+    if location == 'Shared':
+        return "/config/shared"
+    return f"{DEVICE_GROUP_XPATH}/{entry_xpath(location)}"
+
+
+# ----------------------------------------------------------------------------
+# Function to retrieve the XML entries of the security rules of a rulebase
+# ----------------------------------------------------------------------------
+def get_rule_entries(parent, location: str, rulebase: str) -> List:
+    """
+    Retrieve the security rules of a rulebase as XML entries.
+
+    Building a SecurityRule object for every rule costs more CPU and memory
+    than the request itself on large rulebases. `rule_row` reads the fields
+    it needs straight out of the entries instead, giving the same rows.
+
+    Args:
+        parent: The Panorama instance, or a DeviceGroup attached to one, to
+            send the request through.
+        location: 'Shared' or the name of a device group.
+        rulebase: 'pre-rulebase' or 'post-rulebase'.
+
+    Returns:
+        The ``entry`` elements of the rules, in rulebase order.
+    """
+    device = parent.nearest_pandevice()
+    response = device.xapi.get(rulebase_xpath(location, rulebase))
+    return response.findall("./result/rules/entry")
+
+
+# ----------------------------------------------------------------------------
+# Function to find the security rules shadowed by an earlier rule
+# ----------------------------------------------------------------------------
+def get_shadowed_rules(
+    pan: panorama.Panorama,
+    all_device_groups: bool = False,
+    workers: int = 8,
+    retries: int = 3,
+) -> List[Tuple]:
+    """
+    Find the security rules that an earlier rule keeps from matching.
+
+    The rules and the objects they refer to are read as XML entries, see
+    `get_rule_entries`, and handed to `shadow.find_shadowed_rules`.
+
+    Args:
+        pan: An instance of Panorama.
+        all_device_groups: Check the policy of every device group, rather
+            than only the rules of Shared.
+        workers: Number of device groups to fetch at once.
+        retries: Retries of a device group after a server error or timeout.
+
+    Returns:
+        A row matching `SHADOW_HEADER` for each shadowed rule.
+    """
+    locations = ['Shared']
+    parents: Dict[str, str] = {}
+    if all_device_groups:
+        from panos.panorama import DeviceGroup
+
+        device_groups = DeviceGroup.refreshall(pan, name_only=True)
+        locations += [device_group.name for device_group in device_groups]
+        parents = get_parents(pan)
+    pool = DevicePool(pan)
+
+    def get_location(location: str) -> Tuple[List, Dict[str, List]]:
+        device = pool.get()
+        objects = [
+            device.xapi.get(f"{location_xpath(location)}/{container}").find('./result')
+            for container in OBJECT_CONTAINERS
+        ]
+        rules = {
+            rulebase: get_rule_entries(device, location, rulebase)
+            for rulebase, _ in RULEBASES
+        }
+        return objects, rules
+
+    objects = {}
+    rules = {}
+    results = map_bounded(get_location, locations, workers=workers, retries=retries)
+    for location, (location_objects, location_rules) in zip(locations, results):
+        objects[location] = location_objects
+        rules[location] = location_rules
+
+    return find_shadowed_rules(objects, rules, parents)
+
+
+# ----------------------------------------------------------------------------
+# Function to stream security rules and associated Security Profile Groups
+# ----------------------------------------------------------------------------
+def iter_security_rules_and_profiles(
+    pan: panorama.Panorama, location: Optional[str] = None, full: bool = False
+) -> Iterator[Tuple]:
+    """
+    Stream security rules and their associated Security Profile Groups.
+
+    The rules are parsed straight out of the XML API response while it is
+    being downloaded, one entry at a time, instead of being turned into
+    SecurityRule objects first. Memory use stays flat regardless of the
+    size of the rulebase.
+
+    Args:
+        pan: A Panorama instance created by an `ApiClient`, see `get_pan`.
+        location: When given, stream the rules of this location ('Shared' or
+            a device group) as the rows of `get_rulebase_rules`.
+        full: Include every rule field and the hit counts.
+
+    Yields:
+        A tuple for each Pre Rule and then each Post Rule, containing the
+        rule name and its associated Security Profile Group (or 'N/A' if no
+        group is associated).
+    """
+    from common.xmlstream import iter_config_entries
+
+    for rulebase, _ in RULEBASES:
+        xpath = rulebase_xpath(location or 'Shared', rulebase)
+        hit_counts = get_hit_counts(pan, location, rulebase) if full else None
+        entries = iter_config_entries(pan.api_client, xpath)
+        for position, entry in enumerate(entries, start=1):
+            row = rule_row(location, rulebase, position, entry, full, hit_counts)
+            yield row if location else row[3:]
+
+
+# ----------------------------------------------------------------------------
+# Function to fill in the hit counts of cached rows
+# ----------------------------------------------------------------------------
+def add_hit_counts(
+    pan: panorama.Panorama, data: List[Tuple], workers: int = 1, retries: int = 3
+) -> List[Tuple]:
+    """
+    Replace the hit-count columns of rows of `get_rulebase_rules`.
+
+    Args:
+        pan: An instance of Panorama.
+        data: Rows built with `full` set.
+        workers: Number of rulebases to fetch the hit counts of at once.
+        retries: Retries of a rulebase after a server error or timeout.
+
+    Returns:
+        The rows, with the current hit counts of their rules.
+    """
+    rulebases = list(dict.fromkeys((row[0], row[1]) for row in data))
+    pool = DevicePool(pan)
+    counts = dict(
+        zip(
+            rulebases,
+            map_bounded(
+                lambda rulebase: get_hit_counts(pool.get(), *rulebase),
+                rulebases,
+                workers=workers,
+                retries=retries,
+            ),
+        )
+    )
+    return [row[:-2] + counts[row[0], row[1]].get(row[3], (None, None)) for row in data]
+
+
+# ----------------------------------------------------------------------------
+# Function to retrieve security rules through the snapshot cache
+# ----------------------------------------------------------------------------
+def get_security_rules_cached(
+    pan: Optional[panorama.Panorama],
+    store: SnapshotStore,
+    ttl: int,
+    all_device_groups: bool = False,
+    workers: int = 1,
+    retries: int = 3,
+    full: bool = False,
+    detailed: bool = False,
+    parser: str = 'panos',
+) -> List[Tuple]:
+    """
+    Retrieve security rules, reusing an on-disk snapshot when possible.
+
+    The snapshot is used as is while it is younger than `ttl` seconds. Once
+    it is older, only the locations the configuration log shows a change for
+    since the snapshot was taken are fetched again. Hit counts change with
+    traffic rather than with the configuration, so they are not kept in the
+    snapshot and are fetched on every call when `full` is set.
+
+    Args:
+        pan: An instance of Panorama, or None to connect with `get_pan` only
+            once the snapshot turns out to be too old.
+        store: The snapshot store to read from and write to.
+        ttl: Maximum age, in seconds, of a snapshot that may be used as is.
+        all_device_groups: Export every device group rather than only Shared.
+        workers: Number of device groups to fetch at once on a full refresh,
+            and of rulebases to fetch the hit counts of.
+        retries: Retries of a device group after a server error or timeout.
+        full: Include every rule field and the hit counts.
+        detailed: Return the rows of `get_rulebase_rules` even for Shared.
+        parser: 'panos' or 'fast', see `get_rulebase_rules`.
+
+    Returns:
+        The rows of `get_security_rules_and_profiles`, or the rows of
+        `get_rulebase_rules` when `all_device_groups`, `full` or `detailed`
+        is set.
+    """
+    detailed = detailed or all_device_groups or full
+    object_type = 'security-rules'
+    if all_device_groups:
+        object_type = 'device-group-security-rules'
+    elif detailed:
+        object_type = 'shared-security-rules'
+    if full:
+        object_type += '-full'
+    if store.is_fresh(object_type, ttl):
+        data = store.load(object_type)
+        if full:
+            data = add_hit_counts(pan or get_pan(), data, workers, retries)
+        return data
+
+    from panos import panorama
+
+    if pan is None:
+        pan = get_pan()
+    changed = None
+    watermark = store.watermark(object_type)
+    if watermark:
+        changed, watermark = changed_locations(pan, watermark)
+
+    def get_location(location: str) -> List[Tuple]:
+        if not detailed:
+            return get_security_rules_and_profiles(pan, parser)
+        parent = pan
+        if location != 'Shared':
+            parent = panorama.DeviceGroup(location)
+            pan.add(parent)
+        return get_rulebase_rules(parent, location, full, parser, hit_counts=False)
+
+    if changed is None:
+        watermark = latest_change(pan)
+        if all_device_groups:
+            data = get_device_group_rules(
+                pan, workers, retries, full, parser, hit_counts=False
+            )
+            store.replace(object_type, data)
+        else:
+            store.save(object_type, 'Shared', get_location('Shared'))
+    else:
+        for location in sorted(changed):
+            if all_device_groups or location == 'Shared':
+                store.save(object_type, location, get_location(location))
+
+    store.mark_synced(object_type, watermark)
+    data = store.load(object_type)
+    if full:
+        data = add_hit_counts(pan, data, workers, retries)
+    return data
+
+
 # ----------------------------------------------------------------------------
 # Function to save data to a CSV file
 # ----------------------------------------------------------------------------
-def save_to_csv(data: List[Tuple[str, str]], filename: str) -> None:
+def save_to_csv(
+    data: Iterable[Tuple], filename: str, header: List[str] = HEADER
+) -> None:
     """
     Save the given data to a CSV file.
 
+    Rows are written as they are produced, so `data` can be a generator.
+
     Args:
-        data: A list of tuples to save to the CSV file.
+        data: A list, or any other iterable, of tuples to save to the CSV file.
         filename: The name of the CSV file to save the data to.
+        header: The column names written on the first line.
     """
-    with open(filename, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['RuleName', 'SecurityProfileGroup'])
-        writer.writerows(data)
+    write_csv(data, filename, header)
 
 
 # ----------------------------------------------------------------------------
@@ -134,24 +726,241 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(me
 # Main execution of our script
 # ----------------------------------------------------------------------------
 def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="keep a snapshot of the rules in this SQLite file",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=300,
+        metavar="SECONDS",
+        help=(
+            "use the snapshot without contacting Panorama while it is younger, "
+            "except for the hit counts of --fields full"
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="write each rule as it is parsed, keeping memory use flat",
+    )
+    parser.add_argument(
+        "--all-device-groups",
+        action="store_true",
+        help="export the rules of every device group, not only Shared",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="number of device groups to fetch at once",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retries of a device group after a server error or timeout",
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(WRITERS),
+        default="csv",
+        help="output format, optionally compressed",
+    )
+    parser.add_argument(
+        "--fields",
+        choices=("basic", "full"),
+        default="basic",
+        help="export only the profile group, or every rule field and hit counts",
+    )
+    parser.add_argument(
+        "--delta",
+        nargs="?",
+        const=INDEX_FILE,
+        metavar="INDEX",
+        help="only export the rules changed since the export that saved INDEX",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=("panos", "fast"),
+        default="panos",
+        help="build pan-os-python objects, or read the fields from the XML",
+    )
+    parser.add_argument(
+        "--shadow",
+        action="store_true",
+        help="report the rules shadowed by an earlier rule instead of exporting",
+    )
+    args = parser.parse_args()
+
+    scope = 'all' if args.all_device_groups else 'shared'
+    index_file = args.delta
+    if args.delta == INDEX_FILE:
+        index_file = INDEX_FILE.format(scope=scope)
+
+    if args.shadow:
+        output_filepath = get_output_filepath(
+            f"{os.path.splitext(SHADOW_FILE)[0]}.{args.format}"
+        )
+        try:
+            data = get_shadowed_rules(
+                get_pan(), args.all_device_groups, args.workers, args.retries
+            )
+            write_rules(data, output_filepath, SHADOW_HEADER, args.format)
+        except Exception as e:
+            logging.error(f"Error finding shadowed rules: {e}")
+            return
+
+        logging.info(f'Found {len(data)} shadowed rules')
+        logging.info(f'Exported to {output_filepath}')
+        return
+
+    full = args.fields == "full"
+    detailed = args.all_device_groups or full or bool(args.delta)
+    if full:
+        header = FULL_HEADER
+    elif detailed:
+        header = DEVICE_GROUP_HEADER
+    else:
+        header = HEADER
+
+    # The extension of the output file follows the output format
+    output_file = f"{os.path.splitext(OUTPUT_FILE)[0]}.{args.format}"
+    if args.delta:
+        output_file = f"{os.path.splitext(DELTA_FILE)[0]}.{args.format}"
+
+    if args.stream:
+        pan = get_pan()
+        output_filepath = get_output_filepath(output_file)
+        if detailed:
+            # Streaming keeps one location in flight, so they are read in turn
+            locations = ['Shared']
+            if args.all_device_groups:
+                from panos.panorama import DeviceGroup
+
+                device_groups = DeviceGroup.refreshall(pan, name_only=True)
+                locations += [device_group.name for device_group in device_groups]
+            data = itertools.chain.from_iterable(
+                iter_security_rules_and_profiles(pan, location, full)
+                for location in locations
+            )
+        else:
+            data = iter_security_rules_and_profiles(pan)
+        try:
+            # Parse and save the rules one at a time
+            written = True
+            if args.delta:
+                written = export_delta(
+                    data, output_filepath, header, args.format, index_file, scope
+                )
+            else:
+                write_rules(data, output_filepath, header, args.format)
+        except Exception as e:
+            logging.error(f"Error exporting security rules: {e}")
+            return
+
+        if written:
+            logging.info(f'Exported to {output_filepath}')
+        return
+
     try:
         # Get security rules and associated Security Profile Groups
-        data = get_security_rules_and_profiles(pan)
+        if args.cache:
+            store = SnapshotStore(args.cache, PANURL)
+            try:
+                data = get_security_rules_cached(
+                    None,
+                    store,
+                    args.cache_ttl,
+                    args.all_device_groups,
+                    args.workers,
+                    args.retries,
+                    full,
+                    detailed,
+                    args.parser,
+                )
+            finally:
+                store.close()
+        elif args.all_device_groups:
+            data = get_device_group_rules(
+                get_pan(), args.workers, args.retries, full, args.parser
+            )
+        elif detailed:
+            data = get_rulebase_rules(get_pan(), 'Shared', full, args.parser)
+        else:
+            data = get_security_rules_and_profiles(get_pan(), args.parser)
     except Exception as e:
         logging.error(f"Error retrieving security rules: {e}")
         return
 
     # Get the output filepath
-    output_filepath = get_output_filepath(OUTPUT_FILE)
+    output_filepath = get_output_filepath(output_file)
 
     try:
-        # Save the data to a CSV file
-        save_to_csv(data, output_filepath)
+        # Save the data, or only what changed, in the requested format
+        written = True
+        if args.delta:
+            written = export_delta(
+                data, output_filepath, header, args.format, index_file, scope
+            )
+        else:
+            write_rules(data, output_filepath, header, args.format)
     except Exception as e:
-        logging.error(f"Error saving data to CSV file: {e}")
+        logging.error(f"Error saving data to {args.format} file: {e}")
         return
 
-    logging.info(f'Exported to {output_filepath}')
+    if written:
+        logging.info(f'Exported to {output_filepath}')
+
+
+# ----------------------------------------------------------------------------
+# Function to export only the rules changed since the previous export
+# ----------------------------------------------------------------------------
+def export_delta(
+    data: Iterable[Tuple],
+    filename: str,
+    header: List[str],
+    output_format: str,
+    index_file: str,
+    scope: str,
+) -> bool:
+    """
+    Write the rules added, modified or removed since the previous export.
+
+    Nothing is written when no rule changed. The index is only replaced once
+    the changes have been saved, so a failed run is picked up again by the
+    next one.
+
+    Args:
+        data: The rows of the current export, matching `header`.
+        filename: The name of the file to write the changes to.
+        header: The columns of the rows.
+        output_format: One of the keys of `WRITERS`.
+        index_file: The index saved by the previous export.
+        scope: The locations of the export, ``shared`` or ``all``.
+
+    Returns:
+        Whether `filename` was written.
+    """
+    index: Dict[Tuple[str, str, str], str] = {}
+    previous = load_index(index_file, header, scope)
+    changes = diff_rules(data, header, previous, index)
+
+    first = next(changes, None)
+    if first is None:
+        logging.info('No rule changed since the previous export')
+    else:
+        write_rules(
+            itertools.chain([first], changes),
+            filename,
+            ['Change'] + header,
+            output_format,
+        )
+    save_index(index_file, header, index, scope)
+    return first is not None
 
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,666 @@
+"""Find security rules shadowed by an earlier rule.
+
+A rule is shadowed when an earlier rule of the same policy matches every
+packet it would match: the later rule never sees any traffic. It is reported
+as 'redundant' when both rules allow, or both block, the traffic, and as
+'shadowed' when their actions differ.
+
+The address, service and application members of each rule are resolved,
+through nested groups and following the device group hierarchy, into:
+
+- sorted, merged integer intervals for addresses and ports, IPv6 addresses
+  placed after the IPv4 space and the ports of each protocol after those of
+  the previous one
+- sets of names for zones, applications, users, categories and the rest,
+  with anything that cannot be expanded kept as an opaque token, which only
+  a rule holding the same token, or 'any', covers
+- the rule type, where a universal rule covers intrazone and interzone
+  rules, which only cover rules of their own type
+
+Rather than comparing every pair of rules, every field gets an index
+answering "which rules cover this value" as a bitmask over rule positions,
+in the spirit of the bit vector packet classifiers. The masks of a rule's
+fields are ANDed together with the mask of the rules before it; the lowest
+bit left, if any, is the first rule shadowing it. The intervals of a field
+are split into layers holding at most one interval per rule, sorted by start
+and by end, with the OR of every `STEP` rules precomputed, so that the rules
+holding an interval around a range are found with two bisections.
+
+Only a single earlier rule is considered: a rule shadowed by the union of
+several rules is not reported. Disabled rules and rules negating their source
+or destination are skipped.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import ipaddress
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.hierarchy import scope_chain  # noqa
+
+
+# ----------------------------------------------------------------------------
+# Report columns, object containers and value spaces
+# ----------------------------------------------------------------------------
+SHADOW_HEADER = [
+    'DeviceGroup',
+    'Rulebase',
+    'Position',
+    'RuleName',
+    'Action',
+    'Finding',
+    'ShadowedByDeviceGroup',
+    'ShadowedByRulebase',
+    'ShadowedByPosition',
+    'ShadowedByRule',
+    'ShadowedByAction',
+]
+
+# containers holding the objects rules refer to, in each location
+OBJECT_CONTAINERS = (
+    'address',
+    'address-group',
+    'service',
+    'service-group',
+    'application-group',
+    'application-filter',
+)
+
+# the IPv6 space follows the IPv4 space
+IPV6_OFFSET = 1 << 32
+
+# the ports of each protocol follow those of the previous one
+PROTOCOLS = ('tcp', 'udp', 'sctp')
+
+# services PAN-OS defines without a configuration entry
+PREDEFINED_SERVICES = {
+    'service-http': (('tcp', '80,8080'),),
+    'service-https': (('tcp', '443'),),
+}
+
+# fields compared as sets of names, with the path of their members
+SET_FIELDS = (
+    ('from', 'from'),
+    ('to', 'to'),
+    ('source-user', 'source-user'),
+    ('category', 'category'),
+    ('source-hip', 'source-hip'),
+    ('destination-hip', 'destination-hip'),
+)
+
+# fields compared as intervals and tokens
+INTERVAL_FIELDS = ('source', 'destination', 'service')
+
+# bits of the rules whose prefix and suffix ORs are precomputed
+STEP = 32
+
+Intervals = Tuple[Tuple[int, int], ...]
+
+
+class MatchSet(NamedTuple):
+    """The values a field matches: intervals, and tokens for the rest."""
+
+    intervals: Intervals
+    tokens: FrozenSet[str]
+
+
+class RuleMatch(NamedTuple):
+    """A security rule, with the values of its fields resolved."""
+
+    location: str
+    rulebase: str
+    position: int
+    name: str
+    action: str
+    # False for disabled rules and rules negating an address field
+    comparable: bool
+    # field name to a frozenset of names or a MatchSet, None meaning any
+    fields: Dict[str, object]
+
+
+# ----------------------------------------------------------------------------
+# Functions to turn values into intervals
+# ----------------------------------------------------------------------------
+def merge_intervals(intervals: Iterable[Tuple[int, int]]) -> Intervals:
+    """
+    Sort intervals, merging those that overlap or touch.
+
+    Adjacent intervals must be merged for a single interval to be found
+    around a range, for instance two /25 networks around their /24.
+
+    Args:
+        intervals: Pairs of first and last values, both included.
+
+    Returns:
+        The merged intervals, in ascending order.
+    """
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple((start, end) for start, end in merged)
+
+
+def address_interval(value: str) -> Optional[Tuple[int, int]]:
+    """
+    Convert an IP address, network or range into an interval.
+
+    Args:
+        value: An address, a network such as ``10.0.0.0/8``, or a range such
+            as ``10.0.0.1-10.0.0.9``.
+
+    Returns:
+        The interval, or None when `value` is none of those.
+    """
+    try:
+        if '-' in value:
+            first, last = (ipaddress.ip_address(v.strip()) for v in value.split('-'))
+            if first.version != last.version:
+                return None
+        else:
+            network = ipaddress.ip_network(value.strip(), strict=False)
+            first, last = network.network_address, network.broadcast_address
+    except ValueError:
+        return None
+    offset = IPV6_OFFSET if first.version == 6 else 0
+    return offset + int(first), offset + int(last)
+
+
+def port_intervals(protocol: str, ports: str) -> Optional[List[Tuple[int, int]]]:
+    """
+    Convert the destination ports of a service into intervals.
+
+    Args:
+        protocol: 'tcp', 'udp' or 'sctp'.
+        ports: Ports and port ranges, separated by commas.
+
+    Returns:
+        The intervals, or None when the ports cannot be read.
+    """
+    if protocol not in PROTOCOLS or not ports:
+        return None
+    offset = PROTOCOLS.index(protocol) << 16
+    intervals = []
+    for port in ports.split(','):
+        first, _, last = port.strip().partition('-')
+        if not first.isdigit() or not (last or first).isdigit():
+            return None
+        intervals.append((offset + int(first), offset + int(last or first)))
+    return intervals
+
+
+# ----------------------------------------------------------------------------
+# Resolution of object names
+# ----------------------------------------------------------------------------
+class ObjectResolver:
+    """
+    Resolve the members of rule fields through objects and nested groups.
+
+    Args:
+        objects: For each location, the elements holding its object
+            containers, such as the ``result`` of a ``get`` of a container.
+        parents: The device group hierarchy, see `common.hierarchy`.
+    """
+
+    def __init__(self, objects: Dict[str, Sequence], parents: Dict[str, str]) -> None:
+        self.parents = parents
+        self.entries: Dict[Tuple[str, str], Dict[str, object]] = {}
+        for location, elements in objects.items():
+            for element in elements:
+                if element is None:
+                    continue
+                for container in OBJECT_CONTAINERS:
+                    entries = self.entries.setdefault((container, location), {})
+                    for entry in element.findall(f"./{container}/entry"):
+                        entries[entry.get('name')] = entry
+        self.chains: Dict[str, List[str]] = {}
+        self.cache: Dict[Tuple[str, str, str], MatchSet] = {}
+
+    def find(self, container: str, location: str, name: str):
+        """Return the location and entry `name` refers to, or None."""
+        chain = self.chains.get(location)
+        if chain is None:
+            chain = self.chains[location] = scope_chain(location, self.parents)
+        for scope in chain:
+            entry = self.entries.get((container, scope), {}).get(name)
+            if entry is not None:
+                return scope, entry
+        return None
+
+    def expand(
+        self, kind: str, location: str, names: Iterable[str], seen: Set = None
+    ) -> Optional[MatchSet]:
+        """
+        Resolve the members of a field into intervals and tokens.
+
+        Args:
+            kind: 'address', 'service' or 'application'.
+            location: The location of the rule or group holding the members.
+            names: The members.
+            seen: The groups being expanded, to stop at cycles.
+
+        Returns:
+            A MatchSet, or None when a member is 'any'.
+        """
+        intervals: List[Tuple[int, int]] = []
+        tokens: Set[str] = set()
+        for name in names:
+            if name == 'any':
+                return None
+            key = (kind, location, name)
+            resolved = self.cache.get(key)
+            if resolved is None:
+                resolved = self.resolve(kind, location, name, seen or set())
+                self.cache[key] = resolved
+            if resolved is None:
+                return None
+            intervals.extend(resolved.intervals)
+            tokens.update(resolved.tokens)
+        return MatchSet(merge_intervals(intervals), frozenset(tokens))
+
+    def resolve(
+        self, kind: str, location: str, name: str, seen: Set
+    ) -> Optional[MatchSet]:
+        """Resolve a single member, see `expand`."""
+        group = self.find(f"{kind}-group", location, name)
+        if group is not None:
+            scope, entry = group
+            if (kind, scope, name) in seen:
+                return MatchSet((), frozenset())
+            members = entry.findall('./static/member')
+            if kind != 'address':
+                members = entry.findall('./members/member')
+            if kind == 'address' and not members:
+                # dynamic groups change with the tags of the objects
+                return MatchSet((), frozenset([f"dynamic:{scope}/{name}"]))
+            return self.expand(
+                kind, scope, [m.text for m in members], seen | {(kind, scope, name)}
+            )
+
+        if kind == 'address':
+            return self.resolve_address(location, name)
+        if kind == 'service':
+            return self.resolve_service(location, name)
+        if self.find('application-filter', location, name) is not None:
+            return MatchSet((), frozenset([f"filter:{name}"]))
+        return MatchSet((), frozenset([name]))
+
+    def resolve_address(self, location: str, name: str) -> MatchSet:
+        """Resolve an address object, or an address written in the rule."""
+        found = self.find('address', location, name)
+        if found is None:
+            interval = address_interval(name)
+            if interval is not None:
+                return MatchSet((interval,), frozenset())
+            # regions, external dynamic lists and unknown names
+            return MatchSet((), frozenset([f"name:{name}"]))
+        entry = found[1]
+        for address_type in ('ip-netmask', 'ip-range'):
+            value = entry.findtext(address_type)
+            if value:
+                interval = address_interval(value)
+                if interval is not None:
+                    return MatchSet((interval,), frozenset())
+        for address_type in ('fqdn', 'ip-wildcard'):
+            value = entry.findtext(address_type)
+            if value:
+                return MatchSet((), frozenset([f"{address_type}:{value.lower()}"]))
+        return MatchSet((), frozenset([f"name:{found[0]}/{name}"]))
+
+    def resolve_service(self, location: str, name: str) -> MatchSet:
+        """Resolve a service object, or a predefined service."""
+        found = self.find('service', location, name)
+        if found is None:
+            intervals = []
+            for protocol, ports in PREDEFINED_SERVICES.get(name, ()):
+                intervals.extend(port_intervals(protocol, ports))
+            if intervals:
+                return MatchSet(tuple(intervals), frozenset())
+            # application-default and unknown names
+            return MatchSet((), frozenset([f"name:{name}"]))
+        scope, entry = found
+        for protocol in PROTOCOLS:
+            element = entry.find(f"./protocol/{protocol}")
+            if element is None:
+                continue
+            intervals = port_intervals(protocol, element.findtext('port'))
+            # a source port narrows the service, only the same one covers it
+            if intervals is None or element.findtext('source-port'):
+                break
+            return MatchSet(tuple(intervals), frozenset())
+        return MatchSet((), frozenset([f"service:{scope}/{name}"]))
+
+
+# ----------------------------------------------------------------------------
+# Function to resolve the fields of a rule
+# ----------------------------------------------------------------------------
+def members(entry, path: str) -> Optional[FrozenSet[str]]:
+    """Return the members of a field, None when it is 'any' or not set."""
+    values = [member.text for member in entry.findall(f"./{path}/member")]
+    if not values or 'any' in values:
+        return None
+    return frozenset(values)
+
+
+def rule_match(
+    resolver: ObjectResolver, location: str, rulebase: str, position: int, entry
+) -> RuleMatch:
+    """
+    Resolve the fields of a rule out of its XML entry.
+
+    Args:
+        resolver: The objects of every location.
+        location: 'Shared' or the name of a device group.
+        rulebase: 'pre-rulebase' or 'post-rulebase'.
+        position: Position of the rule within its rulebase, starting at 1.
+        entry: The ``entry`` element of the rule.
+
+    Returns:
+        The RuleMatch of the rule.
+    """
+    fields: Dict[str, object] = {
+        name: members(entry, path) for name, path in SET_FIELDS
+    }
+    for name in ('source', 'destination'):
+        fields[name] = resolver.expand(
+            'address', location, [m.text for m in entry.findall(f"./{name}/member")]
+        )
+    fields['service'] = resolver.expand(
+        'service', location, [m.text for m in entry.findall('./service/member')]
+    )
+    applications = resolver.expand(
+        'application',
+        location,
+        [m.text for m in entry.findall('./application/member')],
+    )
+    fields['application'] = applications.tokens if applications else None
+
+    # a universal rule matches intrazone and interzone traffic alike, the
+    # other types only their own
+    rule_type = entry.findtext('rule-type') or 'universal'
+    fields['rule-type'] = None if rule_type == 'universal' else frozenset([rule_type])
+
+    # a schedule or a target narrows the rule, only the same one covers it
+    schedule = entry.findtext('schedule')
+    fields['schedule'] = frozenset([schedule]) if schedule else None
+    targets = sorted(e.get('name') for e in entry.findall('./target/devices/entry'))
+    if entry.findtext('./target/negate') == 'yes' and targets:
+        fields['target'] = frozenset(['!' + ','.join(targets)])
+    else:
+        fields['target'] = frozenset(targets) if targets else None
+
+    comparable = not any(
+        entry.findtext(flag) == 'yes'
+        for flag in ('disabled', 'negate-source', 'negate-destination')
+    )
+    return RuleMatch(
+        location,
+        rulebase,
+        position,
+        entry.get('name'),
+        entry.findtext('action') or 'allow',
+        comparable,
+        fields,
+    )
+
+
+# ----------------------------------------------------------------------------
+# Indexes answering which rules cover a value
+# ----------------------------------------------------------------------------
+class SetIndex:
+    """
+    Find the rules whose field holds every name of a set, as a bitmask.
+
+    Args:
+        values: The value of the field for each rule, in policy order,
+            None meaning any.
+    """
+
+    def __init__(self, values: Sequence[Optional[Iterable[str]]]) -> None:
+        self.everything = (1 << len(values)) - 1
+        self.any = 0
+        self.holding: Dict[str, int] = {}
+        for position, names in enumerate(values):
+            bit = 1 << position
+            if names is None:
+                self.any |= bit
+                continue
+            for name in names:
+                self.holding[name] = self.holding.get(name, 0) | bit
+
+    def covering(self, names: Optional[Iterable[str]]) -> int:
+        """Return the rules holding every name, or any."""
+        if names is None:
+            return self.any
+        mask = self.everything
+        for name in names:
+            mask &= self.holding.get(name, 0)
+            if not mask:
+                break
+        return self.any | mask
+
+
+class IntervalLayer:
+    """
+    Find the rules with an interval around a range, at most one per rule.
+
+    Args:
+        intervals: (start, end, position) of each interval.
+    """
+
+    def __init__(self, intervals: List[Tuple[int, int, int]]) -> None:
+        by_start = sorted(intervals)
+        self.starts = [start for start, _, _ in by_start]
+        self.start_positions = [position for _, _, position in by_start]
+        by_end = sorted(intervals, key=lambda interval: interval[1])
+        self.ends = [end for _, end, _ in by_end]
+        self.end_positions = [position for _, _, position in by_end]
+
+        # prefix[k]: rules among the first k * STEP starts
+        self.prefix = [0]
+        for first in range(0, len(by_start), STEP):
+            mask = self.prefix[-1]
+            for position in self.start_positions[first : first + STEP]:
+                mask |= 1 << position
+            self.prefix.append(mask)
+        # suffix[k]: rules from the k * STEP-th end on
+        blocks = -(-len(by_end) // STEP)
+        self.suffix = [0] * (blocks + 1)
+        for block in range(blocks - 1, -1, -1):
+            mask = self.suffix[block + 1]
+            for position in self.end_positions[block * STEP : (block + 1) * STEP]:
+                mask |= 1 << position
+            self.suffix[block] = mask
+
+    def around(self, low: int, high: int) -> int:
+        """Return the rules with an interval starting at or before `low` and
+        ending at or after `high`."""
+        if not self.starts or self.starts[0] > low or self.ends[-1] < high:
+            return 0
+        count = bisect_right(self.starts, low)
+        block = count // STEP
+        started = self.prefix[block]
+        for position in self.start_positions[block * STEP : count]:
+            started |= 1 << position
+        if not started:
+            return 0
+        first = bisect_left(self.ends, high)
+        block = -(-first // STEP)
+        ended = self.suffix[block]
+        for position in self.end_positions[first : block * STEP]:
+            ended |= 1 << position
+        return started & ended
+
+
+class IntervalIndex:
+    """
+    Find the rules whose field covers a MatchSet, as a bitmask.
+
+    Args:
+        values: The value of the field for each rule, in policy order,
+            None meaning any.
+    """
+
+    def __init__(self, values: Sequence[Optional[MatchSet]]) -> None:
+        self.tokens = SetIndex([None if v is None else v.tokens for v in values])
+        self.any = self.tokens.any
+        layers: List[List[Tuple[int, int, int]]] = []
+        for position, value in enumerate(values):
+            if value is None:
+                continue
+            for layer, (start, end) in enumerate(value.intervals):
+                if layer == len(layers):
+                    layers.append([])
+                layers[layer].append((start, end, position))
+        self.layers = [IntervalLayer(intervals) for intervals in layers]
+
+    def covering(self, value: Optional[MatchSet]) -> int:
+        """Return the rules holding every interval and token, or any."""
+        if value is None:
+            return self.any
+        # rules holding the tokens, which holds the 'any' rules too
+        mask = self.tokens.covering(value.tokens)
+        for low, high in value.intervals:
+            if mask == self.any:
+                break
+            around = 0
+            for layer in self.layers:
+                around |= layer.around(low, high)
+            mask &= around | self.any
+        return mask
+
+
+# ----------------------------------------------------------------------------
+# Function to find the rules shadowed in a policy
+# ----------------------------------------------------------------------------
+def shadowed_rules(
+    policy: Sequence[RuleMatch],
+) -> Iterator[Tuple[RuleMatch, RuleMatch]]:
+    """
+    Find the rules of a policy fully covered by an earlier rule.
+
+    Args:
+        policy: The rules, in the order the firewall evaluates them.
+
+    Yields:
+        Each shadowed rule, with the first earlier rule covering it.
+    """
+    indexes = []
+    # cheap set fields first, they usually leave few candidates
+    for name in sorted(policy[0].fields if policy else (), key=INTERVAL_FIELDS.count):
+        values = [rule.fields[name] for rule in policy]
+        if name in INTERVAL_FIELDS:
+            indexes.append((name, IntervalIndex(values)))
+        else:
+            indexes.append((name, SetIndex(values)))
+    comparable = 0
+    for position, rule in enumerate(policy):
+        if rule.comparable:
+            comparable |= 1 << position
+
+    for position, rule in enumerate(policy):
+        if not rule.comparable:
+            continue
+        mask = comparable & ((1 << position) - 1)
+        for name, index in indexes:
+            if not mask:
+                break
+            mask &= index.covering(rule.fields[name])
+        if mask:
+            yield rule, policy[(mask & -mask).bit_length() - 1]
+
+
+# ----------------------------------------------------------------------------
+# Function to find the rules shadowed in every policy
+# ----------------------------------------------------------------------------
+def find_shadowed_rules(
+    objects: Dict[str, Sequence],
+    rules: Dict[str, Dict[str, Sequence]],
+    parents: Dict[str, str],
+) -> List[Tuple]:
+    """
+    Find the rules shadowed in the policy of Shared and each device group.
+
+    The policy of a device group is made of the pre-rules of Shared, of its
+    ancestors and its own, then its own post-rules, those of its ancestors
+    and those of Shared. A rule shadowed in several policies by the same
+    rule is reported once.
+
+    Args:
+        objects: For each location, the elements holding its objects, see
+            `ObjectResolver`.
+        rules: For each location, the ``entry`` elements of the security
+            rules of each rulebase, in rulebase order.
+        parents: The device group hierarchy, see `common.hierarchy`.
+
+    Returns:
+        A row matching `SHADOW_HEADER` for each shadowed rule.
+    """
+    resolver = ObjectResolver(objects, parents)
+    matches = {
+        location: {
+            rulebase: [
+                rule_match(resolver, location, rulebase, position, entry)
+                for position, entry in enumerate(entries, start=1)
+            ]
+            for rulebase, entries in rulebases.items()
+        }
+        for location, rulebases in rules.items()
+    }
+
+    def rulebase(location: str, name: str) -> List[RuleMatch]:
+        return matches.get(location, {}).get(name, [])
+
+    # the rules of Shared are checked on their own, then in each device group
+    policies = [['Shared']] + [
+        scope_chain(location, parents) for location in rules if location != 'Shared'
+    ]
+
+    rows = []
+    seen = set()
+    for chain in policies:
+        policy = [
+            rule
+            for location in reversed(chain)
+            for rule in rulebase(location, 'pre-rulebase')
+        ] + [rule for location in chain for rule in rulebase(location, 'post-rulebase')]
+        for rule, cover in shadowed_rules(policy):
+            key = (rule[:4], cover[:4])
+            if key in seen:
+                continue
+            seen.add(key)
+            same = (rule.action == 'allow') == (cover.action == 'allow')
+            rows.append(
+                rule[:4]
+                + (rule.action, 'redundant' if same else 'shadowed')
+                + cover[:5]
+            )
+    return rows
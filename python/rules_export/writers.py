@@ -0,0 +1,169 @@
+"""Output writers for the Panorama rules export.
+
+Each writer takes the rows produced by `panorama_rules_export.py` together
+with their column names, and saves them in one output format. CSV and
+newline-delimited JSON are written one row at a time, optionally through a
+gzip or zstd compressor, so they work with streamed rows. Parquet is a
+columnar format and is written in one go through pandas.
+
+zstd compression needs the `zstandard` package and Parquet output needs
+`pyarrow` (or `fastparquet`); both are only imported when used.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import csv
+import gzip
+import io
+import json
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+
+# ----------------------------------------------------------------------------
+# Function to open an output file, compressed or not
+# ----------------------------------------------------------------------------
+def open_output(filename: str, compression: Optional[str] = None) -> TextIO:
+    """
+    Open a text file for writing, compressing its content if requested.
+
+    Args:
+        filename: The name of the file to write.
+        compression: None, 'gzip' or 'zstd'.
+
+    Returns:
+        A text file object; closing it finishes the compressed stream.
+    """
+    if compression == 'gzip':
+        return gzip.open(filename, 'wt', newline='', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        stream = zstandard.ZstdCompressor().stream_writer(open(filename, 'wb'))
+        return io.TextIOWrapper(stream, newline='', encoding='utf-8')
+    return open(filename, 'w', newline='', encoding='utf-8')
+
+
+# ----------------------------------------------------------------------------
+# Function to write rows to a CSV file
+# ----------------------------------------------------------------------------
+def write_csv(
+    data: Iterable[Tuple],
+    filename: str,
+    header: List[str],
+    compression: Optional[str] = None,
+) -> None:
+    """
+    Write rows to a CSV file, one row at a time.
+
+    Args:
+        data: A list, or any other iterable, of tuples.
+        filename: The name of the file to write.
+        header: The column names written on the first line.
+        compression: None, 'gzip' or 'zstd'.
+    """
+    with open_output(filename, compression) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows(data)
+
+
+# ----------------------------------------------------------------------------
+# Function to write rows to a newline-delimited JSON file
+# ----------------------------------------------------------------------------
+def write_ndjson(
+    data: Iterable[Tuple],
+    filename: str,
+    header: List[str],
+    compression: Optional[str] = None,
+) -> None:
+    """
+    Write rows to a newline-delimited JSON file, one object per row.
+
+    Lists, such as the members of a rule's source, are kept as JSON arrays.
+
+    Args:
+        data: A list, or any other iterable, of tuples.
+        filename: The name of the file to write.
+        header: The keys of each JSON object.
+        compression: None, 'gzip' or 'zstd'.
+    """
+    with open_output(filename, compression) as jsonfile:
+        for row in data:
+            jsonfile.write(json.dumps(dict(zip(header, row))))
+            jsonfile.write('\n')
+
+
+# ----------------------------------------------------------------------------
+# Function to write rows to a Parquet file
+# ----------------------------------------------------------------------------
+def write_parquet(data: Iterable[Tuple], filename: str, header: List[str]) -> None:
+    """
+    Write rows to a Parquet file through pandas.
+
+    Columns holding member lists are stored as list columns. In those
+    columns the 'N/A' placeholder used by the CSV output becomes a null.
+
+    Args:
+        data: A list, or any other iterable, of tuples.
+        filename: The name of the file to write.
+        header: The column names.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(list(data), columns=header)
+    for column in df.columns:
+        if df[column].map(lambda value: isinstance(value, list)).any():
+            df[column] = df[column].map(as_list)
+    df.to_parquet(filename, index=False)
+
+
+def as_list(value):
+    """Coerce a value of a list column to a list, or None when it is empty."""
+    if isinstance(value, list) or value is None:
+        return value
+    return None if value == 'N/A' else [value]
+
+
+# ----------------------------------------------------------------------------
+# Registry of output formats, the format name doubles as the file extension
+# ----------------------------------------------------------------------------
+WRITERS: Dict[str, Callable[[Iterable[Tuple], str, List[str]], None]] = {
+    'csv': write_csv,
+    'csv.gz': partial(write_csv, compression='gzip'),
+    'csv.zst': partial(write_csv, compression='zstd'),
+    'ndjson': write_ndjson,
+    'ndjson.gz': partial(write_ndjson, compression='gzip'),
+    'ndjson.zst': partial(write_ndjson, compression='zstd'),
+    'parquet': write_parquet,
+}
+
+
+# ----------------------------------------------------------------------------
+# Function to write rows in the requested format
+# ----------------------------------------------------------------------------
+def write_rules(
+    data: Iterable[Tuple], filename: str, header: List[str], output_format: str = 'csv'
+) -> None:
+    """
+    Write rows using the writer registered for an output format.
+
+    Args:
+        data: A list, or any other iterable, of tuples.
+        filename: The name of the file to write.
+        header: The column names.
+        output_format: One of the keys of `WRITERS`.
+    """
+    WRITERS[output_format](data, filename, header)
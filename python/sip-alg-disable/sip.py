@@ -1,5 +1,23 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from typing import List, Optional
+
 from panos.firewall import Firewall
 
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.client import ApiClient  # noqa
+from common.commit_queue import COMMIT_QUEUE, CommitQueue  # noqa
+from common.commit_scope import CommitScope, add_scope_argument  # noqa
+from common.commit_scope import scope_from_args  # noqa
+from common.concurrency import call_with_retry, map_bounded  # noqa
+from common.jobs import JobWatcher, start_job  # noqa
+from common.xmldiff import is_compliant  # noqa
+
 """
 CLI command: set shared alg-override application sip alg-disabled yes
 XML payload:
@@ -14,6 +32,23 @@ XML payload:
             </alg-override>
         </shared>
     </config>
+
+The change is rolled out in two phases. First every firewall gets the
+change and a commit is started on it, without waiting for the commit to
+finish, `--workers` firewalls at a time. Then the commits, which run on the
+firewalls in parallel, are waited for. A slow firewall therefore only delays
+its own result, and the whole rollout takes about as long as the slowest
+commit rather than the sum of all of them.
+
+Firewalls that already have the SIP ALG disabled are left alone: neither
+the change nor a commit is sent to them, unless `--force` is passed.
+
+The commit is a full commit, unless `--commit-scope` limits it, for
+instance to the changes of `PAN_USER` with ``--commit-scope admin``.
+
+With `--queue`, the change is added to a commit queue instead, for
+`commit_scheduler.py` to apply and commit along with the other changes
+queued for the same firewall.
 """
 
 
@@ -21,11 +56,215 @@ INVENTORY = ["hdq-vfw-01", "aus-vfw-01"]
 PAN_USER = "myusername"
 PAN_PASS = "my-super-secret-password"
 
+XPATH = "/config/shared/alg-override/application"
+PAYLOAD = '<entry name="sip"><alg-disabled>yes</alg-disabled></entry>'
+REPORT_HEADER = [
+    "Hostname",
+    "Success",
+    "Changed",
+    "ChangeId",
+    "JobId",
+    "ApplySeconds",
+    "CommitSeconds",
+    "TotalSeconds",
+    "Error",
+]
+
+
+def load_inventory(filename: str) -> List[str]:
+    """
+    Read the firewalls to update from a file, one hostname per line.
+
+    Blank lines and lines starting with `#` are ignored.
+
+    Args:
+        filename: The name of the inventory file.
+
+    Returns:
+        The hostnames, in the order of the file.
+    """
+    with open(filename) as inventory:
+        lines = (line.split("#", 1)[0].strip() for line in inventory)
+        return [line for line in lines if line]
+
+
+def apply_change(
+    hostname: str,
+    retries: int = 3,
+    force: bool = False,
+    queue: Optional[CommitQueue] = None,
+    scope: CommitScope = CommitScope(),
+) -> dict:
+    """
+    Apply the alg-override change to a firewall and start a commit.
+
+    The current alg-override configuration is read first, and the firewall
+    is skipped when it already has the change.
+
+    Args:
+        hostname: Hostname or IP address of the firewall.
+        retries: Retries of each request after a server error or timeout,
+            except for the commit, which is sent once, see `start_job`.
+        force: Apply the change and commit even when the firewall already
+            has it.
+        queue: Add the change to this commit queue instead of applying it
+            and committing.
+        scope: The part of the candidate configuration to commit.
+
+    Returns:
+        The result of the firewall, see `REPORT_HEADER`. Errors are recorded
+        in the result rather than raised, so that one firewall cannot stop
+        the rollout.
+    """
+    result = {
+        "Hostname": hostname,
+        "Success": False,
+        "Changed": False,
+        "ChangeId": None,
+        "JobId": None,
+        "Error": "",
+    }
+    started = time.monotonic()
+    try:
+        fw = ApiClient(hostname, PAN_USER, PAN_PASS).device(Firewall)
+        current = call_with_retry(fw.xapi.get, XPATH, retries=retries)
+        if not force and is_compliant(current, PAYLOAD):
+            logging.info(f"{hostname}: already compliant, skipping")
+        elif queue is not None:
+            result["ChangeId"] = queue.enqueue(
+                hostname,
+                [[("set", XPATH, PAYLOAD)]],
+                source="sip",
+                device_type="firewall",
+            )[0]
+            result["Changed"] = True
+        else:
+            call_with_retry(fw.xapi.set, XPATH, PAYLOAD, retries=retries)
+            command = scope.command("firewall", "Disable the SIP ALG")
+            result["JobId"] = start_job(
+                fw, lambda: fw.commit(sync=False, cmd=command), "Commit", retries
+            )
+            result["Firewall"] = fw
+            result["Changed"] = True
+        result["Success"] = True
+    except Exception as e:
+        result["Error"] = str(e)
+        logging.error(f"{hostname}: {e}")
+    result["ApplySeconds"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def wait_for_commit(result: dict, timeout: Optional[float] = None) -> dict:
+    """
+    Wait for the commit started by `apply_change` to finish.
+
+    Args:
+        result: The result returned by `apply_change`.
+        timeout: Seconds the commit may take.
+
+    Returns:
+        The same result, updated with the outcome of the commit.
+    """
+    fw = result.pop("Firewall", None)
+    started = time.monotonic()
+    if fw is not None and result["JobId"] is not None:
+        try:
+            JobWatcher(fw, timeout=timeout or 1800.0).wait([result["JobId"]])
+        except Exception as e:
+            result["Success"] = False
+            result["Error"] = str(e)
+            logging.error(f"{result['Hostname']}: {e}")
+    result["CommitSeconds"] = round(time.monotonic() - started, 3)
+    result["TotalSeconds"] = round(result["ApplySeconds"] + result["CommitSeconds"], 3)
+    return result
+
+
+def save_report(results: List[dict], filename: str) -> None:
+    """
+    Write the result of every firewall to a CSV file.
+
+    Args:
+        results: The results returned by `wait_for_commit`.
+        filename: The name of the report file.
+    """
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=REPORT_HEADER)
+        writer.writeheader()
+        writer.writerows(results)
+
+
 if __name__ == "__main__":
-    pan_user = PAN_USER
-    pan_pass = PAN_PASS
-    payload = '<entry name="sip"><alg-disabled>yes</alg-disabled></entry>'
-    for each in INVENTORY:
-        fw = Firewall(each, pan_user, pan_pass)
-        fw.xapi.set("/config/shared/alg-override/application", payload)
-        fw.commit()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--inventory",
+        metavar="FILE",
+        help="file listing the firewalls to update, one per line",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="number of firewalls to update at once",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retries of a request after a server error or timeout",
+    )
+    parser.add_argument(
+        "--commit-timeout",
+        type=float,
+        default=1800,
+        metavar="SECONDS",
+        help="time a commit may take before it is reported as failed",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="apply the change and commit even on firewalls that already have it",
+    )
+    add_scope_argument(parser, "full")
+    parser.add_argument(
+        "--queue",
+        metavar="FILE",
+        nargs="?",
+        const=COMMIT_QUEUE,
+        help="add the change to a commit queue instead of committing it",
+    )
+    parser.add_argument(
+        "--report",
+        default="sip_report.csv",
+        metavar="FILE",
+        help="CSV file receiving the result of every firewall",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    scope = scope_from_args(parser, args, PAN_USER, ["firewall"])
+
+    inventory = load_inventory(args.inventory) if args.inventory else INVENTORY
+    queue = CommitQueue(args.queue) if args.queue else None
+    results = map_bounded(
+        lambda hostname: apply_change(hostname, args.retries, args.force, queue, scope),
+        inventory,
+        workers=args.workers,
+        retries=0,
+    )
+    results = map_bounded(
+        lambda result: wait_for_commit(result, args.commit_timeout),
+        results,
+        workers=args.workers,
+        retries=0,
+    )
+    save_report(results, args.report)
+
+    failed = [result["Hostname"] for result in results if not result["Success"]]
+    changed = sum(1 for result in results if result["Changed"])
+    logging.info(
+        f"{len(results) - len(failed)} of {len(results)} firewalls compliant, "
+        f"{changed} {'queued' if args.queue else 'changed'}, "
+        f"report saved to {args.report}"
+    )
+    if failed:
+        logging.error(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
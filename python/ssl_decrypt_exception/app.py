@@ -1,17 +1,127 @@
-import requests
+import argparse
+import os
+import sys
+import xml.etree.ElementTree as ET
+from typing import Iterator, List
+
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.client import ApiClient  # noqa
+from common.xmldiff import is_subset  # noqa
+
+"""
+Add SSL decryption exclusions to a Panorama template.
+
+Each exclusion is an `entry` below the xpath. Rather than sending one
+request per domain, the entries are packed into as few `set` requests as
+the size limits allow, all sent over one keep-alive session. Domains that
+are already excluded are read up front with a single `get` and left out.
+"""
 
 hostname = "panorama.redtail.com"
 new_entry = "<entry name='*.asdf.com'><exclude>yes</exclude><description>This is a test</description></entry>"
 xpath = "/config/devices/entry[@name='localhost.localdomain']/template/entry[@name='Network']/config/shared/ssl-decrypt/ssl-exclude-cert"
 
-endpoint = (
-    f"https://{hostname}/api/?type=config&action=set&xpath={xpath}&element={new_entry}"
-)
+api_key = "MYSUPERSECRETAPITOKEN"
+
+# stay well below the size of a request the XML API accepts
+MAX_BATCH_ENTRIES = 500
+MAX_BATCH_BYTES = 512 * 1024
+
+
+def load_domains(filename: str) -> List[str]:
+    """
+    Read the domains to exclude from a file, one per line.
+
+    Blank lines, `#` comments and repeated domains are ignored.
+    """
+    with open(filename) as domains:
+        lines = (line.split("#", 1)[0].strip() for line in domains)
+        return list(dict.fromkeys(line for line in lines if line))
+
+
+def build_entry(domain: str, description: str) -> ET.Element:
+    """Build the exclusion entry of a domain."""
+    entry = ET.Element("entry", name=domain)
+    ET.SubElement(entry, "exclude").text = "yes"
+    if description:
+        ET.SubElement(entry, "description").text = description
+    return entry
+
+
+def missing_entries(client: ApiClient, entries: List[ET.Element]) -> List[ET.Element]:
+    """Drop the entries the configuration already holds."""
+    root = client.request({"type": "config", "action": "get", "xpath": xpath})
+    current = {entry.get("name"): entry for entry in root.iterfind("./result/*/entry")}
+    return [
+        entry
+        for entry in entries
+        if entry.get("name") not in current
+        or not is_subset(entry, current[entry.get("name")])
+    ]
+
+
+def batches(entries: List[ET.Element]) -> Iterator[str]:
+    """
+    Pack entries into elements for as few `set` requests as possible.
+
+    Yields:
+        The serialized entries of each request, at most `MAX_BATCH_ENTRIES`
+        entries and `MAX_BATCH_BYTES` bytes each.
+    """
+    batch: List[str] = []
+    size = 0
+    for entry in entries:
+        element = ET.tostring(entry, encoding="unicode")
+        if batch and (
+            len(batch) >= MAX_BATCH_ENTRIES
+            or size + len(element.encode()) > MAX_BATCH_BYTES
+        ):
+            yield "".join(batch)
+            batch, size = [], 0
+        batch.append(element)
+        size += len(element.encode())
+    if batch:
+        yield "".join(batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--domains",
+        metavar="FILE",
+        help="file listing the domains to exclude, one per line",
+    )
+    parser.add_argument(
+        "--description",
+        default="",
+        help="description of the exclusions added from --domains",
+    )
+    args = parser.parse_args()
+
+    if args.domains:
+        entries = [
+            build_entry(domain, args.description)
+            for domain in load_domains(args.domains)
+        ]
+    else:
+        entries = [ET.fromstring(new_entry)]
+
+    # requests are sent as POSTs over one pooled keep-alive session, so the
+    # elements are not part of the URL and every request reuses a connection
+    client = ApiClient(hostname, api_key=api_key, key_cache=None)
 
-headers = {
-    "X-PAN-KEY": "MYSUPERSECRETAPITOKEN",
-}
+    # read the current exclusions first, there is nothing to do for the
+    # entries that are already there
+    entries = missing_entries(client, entries)
+    if not entries:
+        print(f"{hostname} already excludes every entry, nothing to do")
+        sys.exit(0)
 
-response = requests.request("GET", endpoint, headers=headers, verify=False)
+    for number, element in enumerate(batches(entries), start=1):
+        client.request(
+            {"type": "config", "action": "set", "xpath": xpath, "element": element}
+        )
+        print(f"Batch {number} added")
 
-print(response.text)
+    print(f"Added {len(entries)} exclusions to {hostname}")
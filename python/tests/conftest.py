@@ -0,0 +1,51 @@
+"""Make the shared helpers and the script modules importable by the tests.
+
+The scripts import their neighbours by module name, as they are run from
+their own directory, so those directories go on the path as well.
+"""
+# standard library imports
+import os
+import sys
+import threading
+
+# third party library imports
+import pytest
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT_DIRS = (
+    "rules_export",
+    "address_object_search",
+    "update_bgp_peer",
+    "mock_panorama",
+)
+for directory in ("",) + SCRIPT_DIRS:
+    sys.path.insert(0, os.path.normpath(os.path.join(PYTHON_DIR, directory)))
+
+
+# ----------------------------------------------------------------------------
+# Fixture serving a mock Panorama
+# ----------------------------------------------------------------------------
+@pytest.fixture
+def mock_panorama():
+    """
+    Serve a small generated configuration on a free local port.
+
+    Yields:
+        The `MockPanorama`, to inspect its configuration, and an `ApiClient`
+        connected to it.
+    """
+    from common.client import ApiClient
+    from generator import generate_config
+    from server import MockPanorama, serve
+
+    config = generate_config(device_groups=3, addresses=60, address_groups=6, rules=30)
+    device = MockPanorama(config, commit_seconds=0.2)
+    server = serve(device, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ApiClient(
+        f"127.0.0.1:{server.server_address[1]}",
+        api_key=device.api_key,
+        key_cache=None,
+    )
+    yield device, client
+    server.shutdown()
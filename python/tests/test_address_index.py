@@ -0,0 +1,50 @@
+"""Tests of the lookup of address objects and of the groups holding them."""
+# local imports
+from address_index import AddressIndex
+
+OBJECTS = [
+    ("Shared", "web-1", "10.0.0.1", "ip-netmask"),
+    ("dg-1", "web-1", "10.0.0.1", "ip-netmask"),
+    ("dg-1", "10.0.0.2", "10.0.0.2", "ip-netmask"),
+    ("dg-1", "lonely", "10.0.0.9", "ip-netmask"),
+]
+GROUPS = [
+    ("Shared", "web", "", ["web-1", "10.0.0.2"]),
+    ("Shared", "servers", "", ["web", "db"]),
+    ("dg-1", "all", "", ["servers"]),
+    # cycles are broken, each group being reported once
+    ("dg-1", "loop-a", "", ["loop-b", "web-1"]),
+    ("dg-1", "loop-b", "", ["loop-a"]),
+]
+
+
+def group_names(associations):
+    """Return the names of address group tuples."""
+    return [group[1] for group in associations]
+
+
+def test_objects_are_found_by_value_or_name():
+    index = AddressIndex(GROUPS, OBJECTS)
+    assert index.lookup("10.0.0.1") == OBJECTS[:2]
+    assert index.lookup("web-1") == OBJECTS[:2]
+    # an object named after its value is listed once
+    assert index.lookup("10.0.0.2") == [OBJECTS[2]]
+    assert index.lookup("10.9.9.9") == []
+
+
+def test_search_walks_up_every_level_of_nested_groups():
+    index = AddressIndex(GROUPS, OBJECTS)
+    assert group_names(index.search("10.0.0.1")) == [
+        "web",
+        "loop-a",
+        "servers",
+        "loop-b",
+        "all",
+    ]
+    assert group_names(index.search("10.0.0.2")) == ["web", "servers", "all"]
+
+
+def test_search_tells_unknown_objects_from_objects_without_groups():
+    index = AddressIndex(GROUPS, OBJECTS)
+    assert index.search("10.0.0.9") == []
+    assert index.search("10.9.9.9") is None
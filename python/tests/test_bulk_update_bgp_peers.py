@@ -0,0 +1,116 @@
+"""Tests of the planning and reporting of bulk BGP peer updates."""
+# standard library imports
+import xml.etree.ElementTree as ET
+
+# third party library imports
+import pytest
+
+# local imports
+from bulk_update_bgp_peers import PushFailed, plan_change, report_failed_commit
+from common.xpath import entry, find_entry, literal
+
+VIRTUAL_ROUTERS = ET.fromstring(
+    '<virtual-router><entry name="vr\'1"><protocol><bgp><peer-group>'
+    "<entry name='WAN'><peer>"
+    "<entry name='ISP1'><peer-as>65001</peer-as>"
+    "<peer-address><fqdn>isp1.example.com</fqdn></peer-address></entry>"
+    "<entry name='ISP2'><peer-as>65002</peer-as></entry>"
+    "</peer></entry>"
+    "</peer-group></bgp></protocol></entry></virtual-router>"
+)
+
+
+def row(**values):
+    """Return a spec row for the ISP1 peer, the other columns empty."""
+    columns = dict(
+        Template="Net'work",
+        VirtualRouter="vr'1",
+        PeerGroup="WAN",
+        Peer="ISP1",
+        NewName="",
+        PeerAS="",
+        PeerAddress="",
+        LocalInterface="",
+        LocalAddress="",
+        Enable="",
+    )
+    columns.update(values)
+    return columns
+
+
+# ----------------------------------------------------------------------------
+# Xpaths
+# ----------------------------------------------------------------------------
+def test_literal_quotes_any_name():
+    assert literal("dg-1") == "'dg-1'"
+    assert literal("Net'work") == '"Net\'work"'
+    assert literal('say "hi"') == "'say \"hi\"'"
+    assert literal('it\'s "x"') == "concat('it', \"'\", 's \"x\"')"
+    assert entry("a'b") == 'entry[@name="a\'b"]'
+
+
+def test_find_entry_compares_names():
+    assert find_entry(VIRTUAL_ROUTERS, "vr'1") is VIRTUAL_ROUTERS[0]
+    assert find_entry(VIRTUAL_ROUTERS, "vr") is None
+
+
+# ----------------------------------------------------------------------------
+# Planning
+# ----------------------------------------------------------------------------
+def test_matching_peer_needs_no_operation():
+    assert plan_change(row(PeerAS="65001"), VIRTUAL_ROUTERS) == ([], "")
+
+
+def test_changes_are_set_and_the_address_replaced_before_a_rename():
+    operations, detail = plan_change(
+        row(PeerAS="65010", PeerAddress="192.0.2.1", NewName="ATT"), VIRTUAL_ROUTERS
+    )
+    assert [operation[0] for operation in operations] == ["set", "edit", "rename"]
+    xpath = operations[0][1]
+    assert xpath.startswith(
+        "/config/devices/entry[@name='localhost.localdomain']/template"
+        '/entry[@name="Net\'work"]/'
+    )
+    assert xpath.endswith(
+        '/virtual-router/entry[@name="vr\'1"]/protocol/bgp'
+        "/peer-group/entry[@name='WAN']/peer/entry[@name='ISP1']"
+    )
+    assert operations[0][2] == "<peer-as>65010</peer-as>"
+    assert operations[1] == (
+        "edit",
+        f"{xpath}/peer-address",
+        "<peer-address><ip>192.0.2.1</ip></peer-address>",
+    )
+    assert operations[2] == ("rename", xpath, "ATT")
+    assert detail == "peer-as=65010, peer-address/ip=192.0.2.1, name=ATT"
+
+
+def test_peer_renamed_by_an_earlier_run_is_found_under_its_new_name():
+    operations, _ = plan_change(
+        row(Peer="OLD", NewName="ISP2", PeerAS="65002"), VIRTUAL_ROUTERS
+    )
+    assert operations == []
+
+
+def test_missing_peers_and_taken_names_are_refused():
+    with pytest.raises(LookupError):
+        plan_change(row(VirtualRouter="default"), VIRTUAL_ROUTERS)
+    with pytest.raises(LookupError):
+        plan_change(row(Peer="ISP3"), VIRTUAL_ROUTERS)
+    with pytest.raises(LookupError):
+        plan_change(row(), None)
+    with pytest.raises(LookupError, match="already exists"):
+        plan_change(row(NewName="ISP2"), VIRTUAL_ROUTERS)
+
+
+# ----------------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------------
+def test_failed_commit_or_push_is_reported_on_every_changed_peer():
+    results = [{"Status": "changed", "Detail": "peer-as=1"}]
+    report_failed_commit(ValueError("commit failed"), results)
+    assert results == [{"Status": "applied", "Detail": "not committed: peer-as=1"}]
+
+    results = [{"Status": "changed", "Detail": "peer-as=1"}]
+    report_failed_commit(PushFailed(ValueError("push failed")), results)
+    assert results == [{"Status": "committed", "Detail": "not pushed: peer-as=1"}]
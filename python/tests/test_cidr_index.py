@@ -0,0 +1,114 @@
+"""Tests of the index of the address space covered by address objects."""
+# standard library imports
+import ipaddress
+import random
+
+# local imports
+from cidr_index import CidrIndex, parse_interval
+
+OBJECTS = [
+    ("Shared", "ten", "10.0.0.0/8", "ip-netmask"),
+    ("Shared", "ten-one", "10.1.0.0/16", "ip-netmask"),
+    ("dg-1", "host", "10.1.2.3", "ip-netmask"),
+    ("dg-1", "host-bits", "10.1.2.3/24", "ip-netmask"),
+    ("dg-1", "range", "10.1.2.100-10.1.3.20", "ip-range"),
+    ("dg-2", "v6", "2001:db8::/32", "ip-netmask"),
+    ("dg-2", "web", "www.example.com", "fqdn"),
+    ("dg-2", "typo", "10.1.2", "ip-netmask"),
+]
+
+
+def names(objects):
+    """Return the names of address object tuples."""
+    return [each[1] for each in objects]
+
+
+def test_parse_interval():
+    assert parse_interval("10.0.0.0/30") == (4, 0x0A000000, 0x0A000003)
+    assert parse_interval("10.0.0.9/30") == (4, 0x0A000008, 0x0A00000B)
+    assert parse_interval("10.0.0.1-10.0.0.5", "ip-range") == (
+        4,
+        0x0A000001,
+        0x0A000005,
+    )
+    assert parse_interval("10.0.0.1-10.0.0.5", None) == (4, 0x0A000001, 0x0A000005)
+    assert parse_interval("10.0.0.5-10.0.0.1", "ip-range") is None
+    assert parse_interval("10.0.0.1-::1", "ip-range") is None
+    assert parse_interval("www.example.com") is None
+    assert parse_interval(None) is None
+
+
+def test_covering_lists_the_most_specific_object_first():
+    index = CidrIndex(OBJECTS)
+    assert names(index.covering("10.1.2.3")) == [
+        "host",
+        "host-bits",
+        "ten-one",
+        "ten",
+    ]
+    assert names(index.covering("10.1.2.0/24")) == ["host-bits", "ten-one", "ten"]
+    assert names(index.covering("10.2.0.0/16")) == ["ten"]
+    assert index.covering("192.168.0.1") == []
+
+
+def test_ranges_cover_addresses_across_their_blocks():
+    index = CidrIndex(OBJECTS)
+    assert "range" in names(index.covering("10.1.3.7"))
+    assert "range" in names(index.covering("10.1.2.128/25"))
+    assert "range" not in names(index.covering("10.1.2.0/25"))
+    assert "range" not in names(index.covering("10.1.3.21"))
+
+
+def test_overlapping_finds_objects_starting_inside_the_search():
+    index = CidrIndex(OBJECTS)
+    assert names(index.overlapping("10.1.2.0/25")) == [
+        "host",
+        "range",
+        "host-bits",
+        "ten-one",
+        "ten",
+    ]
+    assert names(index.overlapping("10.1.3.0/24")) == ["range", "ten-one", "ten"]
+
+
+def test_ipv6_and_non_ip_values():
+    index = CidrIndex(OBJECTS)
+    assert names(index.covering("2001:db8::1")) == ["v6"]
+    assert names(index.overlapping("2001::/16")) == ["v6"]
+    assert index.covering("www.example.com") == []
+    assert "typo" not in names(index.overlapping("0.0.0.0/0"))
+
+
+def test_index_agrees_with_comparing_every_object():
+    rng = random.Random(7)
+    objects = []
+    for number in range(300):
+        base = rng.randrange(1 << 24) << 8
+        if number % 3:
+            length = rng.randrange(8, 33)
+            network = ipaddress.ip_network((base, length), strict=False)
+            objects.append(("Shared", f"net-{number}", str(network), "ip-netmask"))
+        else:
+            first = ipaddress.IPv4Address(base)
+            last = first + rng.randrange(1, 5000)
+            objects.append(("Shared", f"range-{number}", f"{first}-{last}", "ip-range"))
+    index = CidrIndex(objects)
+    intervals = {each[1]: parse_interval(each[2], each[3]) for each in objects}
+
+    for _ in range(300):
+        search = ipaddress.ip_network(
+            (rng.randrange(1 << 32), rng.randrange(12, 33)), strict=False
+        )
+        _, first, last = parse_interval(str(search))
+        covering = {
+            name
+            for name, (_, start, end) in intervals.items()
+            if start <= first and last <= end
+        }
+        overlapping = {
+            name
+            for name, (_, start, end) in intervals.items()
+            if start <= last and first <= end
+        }
+        assert set(names(index.covering(str(search)))) == covering
+        assert set(names(index.overlapping(str(search)))) == overlapping
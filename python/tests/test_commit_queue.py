@@ -0,0 +1,161 @@
+"""Tests of the commit queue and of the scheduler committing its changes."""
+# standard library imports
+import sqlite3
+import xml.etree.ElementTree as ET
+
+# local imports
+from common.commit_queue import CommitQueue, CommitScheduler, push_command
+
+DG_XPATH = "/config/devices/entry[@name='localhost.localdomain']/device-group"
+
+
+def address(device_group, name, value):
+    """Return the operation setting an address object in a device group."""
+    return (
+        "set",
+        f"{DG_XPATH}/entry[@name='{device_group}']/address",
+        f"<entry name='{name}'><ip-netmask>{value}</ip-netmask></entry>",
+    )
+
+
+# ----------------------------------------------------------------------------
+# Queue
+# ----------------------------------------------------------------------------
+def test_claimed_changes_keep_their_operations_and_targets(tmp_path):
+    queue = CommitQueue(str(tmp_path / "queue.db"))
+    ids = queue.enqueue(
+        "panorama.lab",
+        [[address("dg-0001", "a", "10.0.0.1")], [("delete", "/config/x", None)]],
+        device_groups=["dg-0001"],
+        templates=["Network"],
+        source="test",
+    )
+    assert queue.due(0) == [("panorama.lab", "panorama")]
+
+    batch, changes = queue.claim("panorama.lab", "panorama")
+    assert [change.id for change in changes] == ids
+    assert changes[0].operations == [address("dg-0001", "a", "10.0.0.1")]
+    assert changes[1].operations == [("delete", "/config/x", None)]
+    assert changes[0].device_groups == ["dg-0001"]
+    assert changes[0].templates == ["Network"]
+    assert [row[3] for row in queue.status(ids)] == ["applying", "applying"]
+
+    # claimed changes are no longer due, nor claimed by another scheduler
+    assert queue.due(0) == []
+    assert queue.claim("panorama.lab", "panorama") == (batch + 1, [])
+
+
+def test_changes_are_due_once_the_window_passed(tmp_path):
+    queue = CommitQueue(str(tmp_path / "queue.db"))
+    queue.enqueue("panorama.lab", [[]])
+    assert queue.due(3600) == []
+    assert queue.due(0) == [("panorama.lab", "panorama")]
+
+
+def test_outcomes_are_recorded(tmp_path):
+    queue = CommitQueue(str(tmp_path / "queue.db"))
+    (change_id,) = queue.enqueue("panorama.lab", [[]])
+    batch, _ = queue.claim("panorama.lab", "panorama")
+    queue.record(
+        [
+            {
+                "id": change_id,
+                "batch": batch,
+                "status": "pushed",
+                "commit_job": "7",
+                "push_jobs": ["8", "9"],
+            }
+        ]
+    )
+    row = queue.status([change_id])[0]
+    assert row[3:7] == ["pushed", batch, "7", "8, 9"]
+
+
+def test_requeued_changes_drop_the_outcome_of_their_old_batch(tmp_path):
+    queue = CommitQueue(str(tmp_path / "queue.db"))
+    (change_id,) = queue.enqueue("panorama.lab", [[]])
+    old_batch, _ = queue.claim("panorama.lab", "panorama")
+
+    # a batch claimed less than an hour ago is left alone
+    assert queue.requeue(3600) == []
+    assert queue.requeue() == [change_id]
+    new_batch, changes = queue.claim("panorama.lab", "panorama")
+    assert [change.id for change in changes] == [change_id]
+
+    queue.record([{"id": change_id, "batch": old_batch, "status": "failed"}])
+    assert queue.status([change_id])[0][3:5] == ["applying", new_batch]
+    queue.record([{"id": change_id, "batch": new_batch, "status": "committed"}])
+    assert queue.status([change_id])[0][3] == "committed"
+
+
+def test_queue_of_the_first_layout_gets_the_added_columns(tmp_path):
+    path = str(tmp_path / "queue.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE changes (id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " hostname TEXT NOT NULL, device_type TEXT NOT NULL, source TEXT NOT NULL,"
+        " operations TEXT NOT NULL, device_groups TEXT NOT NULL,"
+        " templates TEXT NOT NULL, queued_at REAL NOT NULL, status TEXT NOT NULL,"
+        " batch INTEGER, commit_job TEXT, push_jobs TEXT, detail TEXT,"
+        " finished_at REAL)"
+    )
+    connection.close()
+
+    queue = CommitQueue(path)
+    queue.enqueue("panorama.lab", [[]])
+    assert queue.claim("panorama.lab", "panorama")[1]
+    assert queue.requeue()
+
+
+def test_push_command_escapes_names():
+    device_group = ET.fromstring(push_command('a"b<c', include_template=True))
+    assert device_group.find(".//device-group/entry").get("name") == 'a"b<c'
+    assert device_group.findtext(".//include-template") == "yes"
+    template = ET.fromstring(push_command(template="T&1"))
+    assert template.findtext("./template/name") == "T&1"
+
+
+# ----------------------------------------------------------------------------
+# Scheduler
+# ----------------------------------------------------------------------------
+def test_scheduler_commits_and_pushes_a_batch_once(tmp_path, mock_panorama):
+    from panos.panorama import Panorama
+
+    device, client = mock_panorama
+    queue = CommitQueue(str(tmp_path / "queue.db"))
+    ids = queue.enqueue(
+        client.hostname,
+        [
+            [address("dg-0001", "queued-1", "10.9.0.1")],
+            [address("dg-0001", "queued-2", "10.9.0.2")],
+            [
+                (
+                    "rename",
+                    f"{DG_XPATH}/entry[@name='dg-0001']/address/entry"
+                    "[@name='missing']",
+                    "renamed",
+                )
+            ],
+        ],
+        device_groups=["dg-0001"],
+        source="test",
+    )
+    scheduler = CommitScheduler(
+        queue, lambda hostname, device_type: client.device(Panorama), window=0
+    )
+
+    outcomes = {outcome["id"]: outcome for outcome in scheduler.run_once()}
+    assert [outcomes[change_id]["status"] for change_id in ids] == [
+        "pushed",
+        "pushed",
+        "failed",
+    ]
+    assert outcomes[ids[2]]["detail"].startswith("not applied")
+    assert [job["type"] for job in device.jobs.values()] == ["Commit", "CommitAll"]
+
+    names = {
+        entry.get("name") for entry in device.find(f"{DG_XPATH}/entry/address/entry")
+    }
+    assert {"queued-1", "queued-2"} <= names
+    assert [row[3] for row in queue.status(ids)] == ["pushed", "pushed", "failed"]
+    assert scheduler.run_once() == []
@@ -0,0 +1,86 @@
+"""Tests of the differential rule export."""
+# standard library imports
+import json
+
+# third party library imports
+import pytest
+
+# local imports
+from delta import diff_rules, load_index, save_index
+
+HEADER = ["DeviceGroup", "Rulebase", "Position", "RuleName", "Action", "HitCount"]
+
+
+def diff(rows, previous):
+    """Return the changes of `rows` and the index of the current export."""
+    index = {}
+    changes = list(diff_rules(iter(rows), HEADER, previous, index))
+    return changes, index
+
+
+def test_first_export_adds_every_rule():
+    rows = [("Shared", "pre-rulebase", 1, "a", "allow", 0)]
+    changes, index = diff(rows, {})
+    assert changes == [("added",) + rows[0]]
+    assert list(index) == [("Shared", "pre-rulebase", "a")]
+
+
+def test_unchanged_rules_are_left_out_whatever_their_position_and_hits():
+    _, previous = diff([("Shared", "pre-rulebase", 1, "a", "allow", 0)], {})
+    changes, _ = diff([("Shared", "pre-rulebase", 4, "a", "allow", 12)], previous)
+    assert changes == []
+
+
+def test_modified_added_and_removed_rules_are_reported():
+    _, previous = diff(
+        [
+            ("Shared", "pre-rulebase", 1, "a", "allow", 0),
+            ("Shared", "pre-rulebase", 2, "b", "allow", 0),
+            ("branch", "post-rulebase", 1, "c", "deny", 0),
+        ],
+        {},
+    )
+    rows = [
+        ("Shared", "pre-rulebase", 1, "a", "deny", 0),
+        ("Shared", "pre-rulebase", 2, "b", "allow", 0),
+        ("Shared", "pre-rulebase", 3, "d", "allow", 0),
+    ]
+    changes, _ = diff(rows, previous)
+    assert changes == [
+        ("modified",) + rows[0],
+        ("added",) + rows[2],
+        ("removed", "branch", "post-rulebase", None, "c", None, None),
+    ]
+
+
+def test_index_round_trips_through_its_file(tmp_path):
+    filename = str(tmp_path / "index.json")
+    _, index = diff([("Shared", "pre-rulebase", 1, "a", "allow", 0)], {})
+    save_index(filename, HEADER, index, "all")
+    assert load_index(filename, HEADER, "all") == index
+    assert not (tmp_path / "index.json.tmp").exists()
+
+
+def test_missing_index_or_other_columns_start_afresh(tmp_path):
+    filename = str(tmp_path / "index.json")
+    assert load_index(filename, HEADER, "all") == {}
+    _, index = diff([("Shared", "pre-rulebase", 1, "a", "allow", 0)], {})
+    save_index(filename, HEADER, index, "all")
+    assert load_index(filename, HEADER[:-1], "all") == {}
+
+
+def test_index_of_other_locations_is_refused(tmp_path):
+    filename = str(tmp_path / "index.json")
+    save_index(filename, HEADER, {}, "shared")
+    with pytest.raises(ValueError):
+        load_index(filename, HEADER, "all")
+
+
+def test_index_saved_without_a_scope_is_accepted(tmp_path):
+    filename = tmp_path / "index.json"
+    filename.write_text(
+        json.dumps({"header": HEADER, "rules": [["Shared", "pre-rulebase", "a", "0"]]})
+    )
+    assert load_index(str(filename), HEADER, "all") == {
+        ("Shared", "pre-rulebase", "a"): "0"
+    }
@@ -0,0 +1,137 @@
+"""Tests of the report of unused, duplicate and shadowed address objects."""
+# standard library imports
+import xml.etree.ElementTree as ET
+
+# local imports
+from object_analysis import ObjectAnalysis, normalize_value, parse_rule_references
+
+PARENTS = {"parent": "Shared", "child": "parent", "other": "Shared"}
+
+
+def analysis(objects, groups=(), references=()):
+    """Build the analysis of objects, groups and rule references."""
+    return ObjectAnalysis(list(groups), list(objects), list(references), PARENTS)
+
+
+def rule(location, *names):
+    """Return the references of a pre-rulebase security rule."""
+    return (location, "pre-rulebase", "security", "rule", list(names))
+
+
+def rows(findings):
+    """Return the finding, location, name and detail of report rows."""
+    return [(row[0], row[1], row[2], row[6]) for row in findings]
+
+
+def test_parse_rule_references_reads_security_and_nat_rules():
+    element = ET.fromstring(
+        "<entry name='dg'><pre-rulebase>"
+        "<security><rules><entry name='allow'>"
+        "<source><member>a</member></source>"
+        "<destination><member>b</member><member>c</member></destination>"
+        "</entry></rules></security>"
+        "<nat><rules><entry name='snat'>"
+        "<source><member>d</member></source><destination><member>any</member>"
+        "</destination><source-translation><dynamic-ip-and-port>"
+        "<translated-address><member>e</member></translated-address>"
+        "</dynamic-ip-and-port></source-translation>"
+        "<destination-translation><translated-address>f</translated-address>"
+        "</destination-translation>"
+        "</entry></rules></nat>"
+        "</pre-rulebase></entry>"
+    )
+    references = []
+    parse_rule_references(element, "dg", references)
+    assert references == [
+        ("dg", "pre-rulebase", "security", "allow", ["a", "b", "c"]),
+        ("dg", "pre-rulebase", "nat", "snat", ["d", "any", "e", "f"]),
+    ]
+    parse_rule_references(None, "dg", references)
+    assert len(references) == 2
+
+
+def test_normalize_value():
+    assert normalize_value("10.0.0.1", "ip-netmask") == "10.0.0.1/32"
+    assert normalize_value(" 10.0.0.1/32 ", "ip-netmask") == "10.0.0.1/32"
+    assert normalize_value("WWW.Example.com.", "fqdn") == "www.example.com"
+    assert normalize_value(None, "fqdn") is None
+
+
+def test_objects_reached_through_groups_are_used():
+    objects = [
+        ("Shared", "a", "10.0.0.1", "ip-netmask"),
+        ("Shared", "b", "10.0.0.2", "ip-netmask"),
+        ("Shared", "c", "10.0.0.3", "ip-netmask"),
+    ]
+    groups = [
+        ("Shared", "inner", "", ["a"]),
+        ("Shared", "outer", "", ["inner"]),
+        ("Shared", "idle", "", ["b"]),
+    ]
+    findings = analysis(objects, groups, [rule("other", "outer")]).unused()
+    assert rows(findings) == [
+        (
+            "unused",
+            "Shared",
+            "b",
+            "only in unused groups, dynamic group filters not checked",
+        ),
+        ("unused", "Shared", "c", "not referenced, dynamic group filters not checked"),
+        ("unused", "Shared", "idle", "not referenced"),
+    ]
+
+
+def test_names_resolve_to_the_nearest_location():
+    objects = [
+        ("Shared", "web", "10.0.0.1", "ip-netmask"),
+        ("parent", "web", "10.0.0.2", "ip-netmask"),
+    ]
+    findings = analysis(objects, references=[rule("child", "web")]).unused()
+    assert [(row[1], row[2]) for row in findings] == [("Shared", "web")]
+
+
+def test_objects_overriding_those_of_an_ancestor_rule_are_used():
+    objects = [
+        ("Shared", "web", "10.0.0.1", "ip-netmask"),
+        ("child", "web", "10.0.0.2", "ip-netmask"),
+        ("other", "web", "10.0.0.3", "ip-netmask"),
+        ("Shared", "db", "10.0.1.1", "ip-netmask"),
+        ("child", "db", "10.0.1.2", "ip-netmask"),
+        ("other", "db", "10.0.1.3", "ip-netmask"),
+    ]
+    groups = [("parent", "servers", "", ["db"])]
+    references = [rule("Shared", "web"), rule("parent", "servers")]
+    findings = analysis(objects, groups, references).unused()
+    # the group of parent does not apply to other, a sibling
+    assert [(row[1], row[2]) for row in findings] == [("other", "db")]
+
+
+def test_duplicates_compare_normalized_values():
+    objects = [
+        ("Shared", "a", "10.0.0.1", "ip-netmask"),
+        ("child", "b", "10.0.0.1/32", "ip-netmask"),
+        ("other", "c", "Example.com", "fqdn"),
+        ("other", "d", "example.com", "fqdn"),
+        ("other", "e", "10.0.0.2", "ip-netmask"),
+    ]
+    findings = analysis(objects).duplicates()
+    assert [(row[1], row[2], row[5]) for row in findings] == [
+        ("Shared", "a", "child/b"),
+        ("child", "b", "Shared/a"),
+        ("other", "c", "other/d"),
+        ("other", "d", "other/c"),
+    ]
+
+
+def test_shadowed_reports_the_nearest_ancestor_defining_the_name():
+    objects = [
+        ("Shared", "web", "10.0.0.1", "ip-netmask"),
+        ("parent", "web", "10.0.0.1", "ip-netmask"),
+        ("child", "web", "10.0.0.9", "ip-netmask"),
+        ("other", "db", "10.0.0.5", "ip-netmask"),
+    ]
+    findings = analysis(objects).shadowed()
+    assert rows(findings) == [
+        ("shadowed", "parent", "web", "same value"),
+        ("shadowed", "child", "web", "parent has ip-netmask 10.0.0.1"),
+    ]
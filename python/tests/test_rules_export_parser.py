@@ -0,0 +1,40 @@
+"""Tests that the fast parser of the rules export matches pan-os-python."""
+# local imports
+from panorama_rules_export import (
+    get_device_group_rules,
+    get_security_rules_and_profiles,
+)
+
+
+def test_fast_parser_gives_the_rows_of_pan_os_python(mock_panorama):
+    from panos.panorama import Panorama
+
+    _, client = mock_panorama
+    rows = {
+        parser: get_device_group_rules(
+            client.device(Panorama),
+            workers=2,
+            full=True,
+            parser=parser,
+            hit_counts=False,
+        )
+        for parser in ("panos", "fast")
+    }
+    assert len(rows["panos"]) == 30
+    assert {row[0] for row in rows["panos"]} == {
+        "Shared",
+        "dg-0001",
+        "dg-0002",
+        "dg-0003",
+    }
+    assert rows["fast"] == rows["panos"]
+
+
+def test_fast_parser_gives_the_shared_rules_of_pan_os_python(mock_panorama):
+    from panos.panorama import Panorama
+
+    _, client = mock_panorama
+    panos_rows = get_security_rules_and_profiles(client.device(Panorama))
+    fast_rows = get_security_rules_and_profiles(client.device(Panorama), "fast")
+    assert panos_rows
+    assert fast_rows == panos_rows
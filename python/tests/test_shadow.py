@@ -0,0 +1,181 @@
+"""Tests of the detection of shadowed security rules."""
+# standard library imports
+import xml.etree.ElementTree as ET
+
+# local imports
+from shadow import (
+    IPV6_OFFSET,
+    address_interval,
+    find_shadowed_rules,
+    merge_intervals,
+    port_intervals,
+)
+
+FIELDS = ("from", "to", "source", "destination", "service", "application")
+
+
+def rule(name, action="allow", **values):
+    """Build the entry of a security rule, every field 'any' unless given."""
+    entry = ET.Element("entry", name=name)
+    for field in FIELDS:
+        members = values.pop(field, ["any"])
+        element = ET.SubElement(entry, field)
+        for member in [members] if isinstance(members, str) else members:
+            ET.SubElement(element, "member").text = member
+    ET.SubElement(entry, "action").text = action
+    for tag, text in values.items():
+        ET.SubElement(entry, tag.replace("_", "-")).text = text
+    return entry
+
+
+def objects(xml):
+    """Parse the object containers of a location."""
+    return [ET.fromstring(f"<result>{xml}</result>")]
+
+
+def shadowed(rules, objects_by_location=None, parents=None):
+    """Return (rule, finding, covering rule) for each shadowed rule."""
+    if not isinstance(rules, dict):
+        rules = {"Shared": {"pre-rulebase": rules}}
+    rows = find_shadowed_rules(objects_by_location or {}, rules, parents or {})
+    return [(row[3], row[5], row[9]) for row in rows]
+
+
+# ----------------------------------------------------------------------------
+# Intervals
+# ----------------------------------------------------------------------------
+def test_merge_intervals_joins_overlapping_and_adjacent_intervals():
+    assert merge_intervals([(10, 20), (0, 4), (5, 8), (15, 30), (40, 41)]) == (
+        (0, 8),
+        (10, 30),
+        (40, 41),
+    )
+
+
+def test_address_interval_reads_networks_ranges_and_ipv6():
+    assert address_interval("10.0.0.0/24") == (0x0A000000, 0x0A0000FF)
+    assert address_interval("10.0.0.5") == (0x0A000005, 0x0A000005)
+    assert address_interval("10.0.0.1-10.0.0.9") == (0x0A000001, 0x0A000009)
+    assert address_interval("::1") == (IPV6_OFFSET + 1, IPV6_OFFSET + 1)
+    assert address_interval("10.0.0.1-::1") is None
+    assert address_interval("web.example.com") is None
+
+
+def test_port_intervals_place_each_protocol_after_the_previous_one():
+    assert port_intervals("tcp", "80,8000-8080") == [(80, 80), (8000, 8080)]
+    assert port_intervals("udp", "53") == [(65536 + 53, 65536 + 53)]
+    assert port_intervals("icmp", "1") is None
+    assert port_intervals("tcp", "http") is None
+
+
+# ----------------------------------------------------------------------------
+# Shadowed rules
+# ----------------------------------------------------------------------------
+def test_broader_earlier_rule_makes_a_later_rule_redundant_or_shadowed():
+    assert shadowed([rule("all"), rule("web", destination="10.0.0.1")]) == [
+        ("web", "redundant", "all")
+    ]
+    assert shadowed(
+        [rule("block", action="deny"), rule("web", destination="10.0.0.1")]
+    ) == [("web", "shadowed", "block")]
+
+
+def test_narrower_earlier_rule_shadows_nothing():
+    assert shadowed([rule("web", destination="10.0.0.1"), rule("all")]) == []
+    assert shadowed([rule("a", **{"from": "trust"}), rule("b")]) == []
+
+
+def test_first_covering_rule_is_reported():
+    rules = [
+        rule("net", destination="10.0.0.0/8"),
+        rule("all"),
+        rule("host", destination="10.1.2.3"),
+    ]
+    assert shadowed(rules) == [("host", "redundant", "net")]
+
+
+def test_adjacent_address_objects_cover_their_supernet():
+    config = objects(
+        "<address>"
+        "<entry name='low'><ip-netmask>10.0.0.0/25</ip-netmask></entry>"
+        "<entry name='high'><ip-netmask>10.0.0.128/25</ip-netmask></entry>"
+        "</address>"
+        "<address-group><entry name='both'><static>"
+        "<member>low</member><member>high</member>"
+        "</static></entry></address-group>"
+    )
+    rules = [rule("halves", source="both"), rule("net", source="10.0.0.0/24")]
+    assert shadowed(rules, {"Shared": config}) == [("net", "redundant", "halves")]
+
+
+def test_service_port_range_covers_a_service_inside_it():
+    config = objects(
+        "<service>"
+        "<entry name='low'><protocol><tcp><port>1-1024</port></tcp></protocol></entry>"
+        "<entry name='ssh'><protocol><tcp><port>22</port></tcp></protocol></entry>"
+        "<entry name='dns'><protocol><udp><port>53</port></udp></protocol></entry>"
+        "</service>"
+    )
+    rules = [rule("low", service="low"), rule("ssh", service="ssh")]
+    assert shadowed(rules, {"Shared": config}) == [("ssh", "redundant", "low")]
+    rules = [rule("low", service="low"), rule("dns", service="dns")]
+    assert shadowed(rules, {"Shared": config}) == []
+
+
+def test_unresolved_names_are_only_covered_by_the_same_name():
+    rules = [rule("region", source="US"), rule("again", source="US")]
+    assert shadowed(rules) == [("again", "redundant", "region")]
+    rules = [rule("region", source="US"), rule("other", source="CA")]
+    assert shadowed(rules) == []
+
+
+def test_disabled_and_negated_rules_are_skipped():
+    assert shadowed([rule("off", disabled="yes"), rule("web")]) == []
+    assert shadowed([rule("all"), rule("off", disabled="yes")]) == []
+    assert shadowed([rule("all"), rule("not", negate_source="yes")]) == []
+
+
+def test_rule_type_is_compared():
+    intrazone = {"rule_type": "intrazone"}
+    assert shadowed([rule("intra", **intrazone), rule("universal")]) == []
+    assert shadowed([rule("universal"), rule("intra", **intrazone)]) == [
+        ("intra", "redundant", "universal")
+    ]
+    assert shadowed([rule("a", **intrazone), rule("b", **intrazone)]) == [
+        ("b", "redundant", "a")
+    ]
+
+
+def test_shared_pre_rules_come_first_and_post_rules_last_in_device_groups():
+    rules = {
+        "Shared": {"pre-rulebase": [rule("shared-pre", destination="10.0.0.0/8")]},
+        "branch": {
+            "pre-rulebase": [rule("branch-pre", destination="10.1.0.0/16")],
+            "post-rulebase": [rule("branch-post", destination="10.1.2.0/24")],
+        },
+    }
+    assert shadowed(rules, parents={"branch": "Shared"}) == [
+        ("branch-pre", "redundant", "shared-pre"),
+        ("branch-post", "redundant", "shared-pre"),
+    ]
+
+
+def test_device_group_objects_override_shared_ones():
+    shared = objects(
+        "<address><entry name='servers'><ip-netmask>10.0.0.0/8</ip-netmask>"
+        "</entry></address>"
+    )
+    branch = objects(
+        "<address><entry name='servers'><ip-netmask>192.168.0.0/16</ip-netmask>"
+        "</entry></address>"
+    )
+    rules = {
+        "branch": {
+            "pre-rulebase": [
+                rule("servers", destination="servers"),
+                rule("host", destination="10.1.2.3"),
+            ]
+        }
+    }
+    assert shadowed(rules, {"Shared": shared, "branch": branch}) == []
+    assert shadowed(rules, {"Shared": shared}) == [("host", "redundant", "servers")]
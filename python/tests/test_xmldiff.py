@@ -0,0 +1,71 @@
+"""Tests of the check skipping a set that would change nothing."""
+# standard library imports
+import xml.etree.ElementTree as ET
+
+# local imports
+from common.xmldiff import is_compliant, is_subset
+
+CURRENT = (
+    "<entry name='web'>"
+    "<ip-netmask>10.0.0.1/32</ip-netmask>"
+    "<tag><member>prod</member><member>web</member></tag>"
+    "<description>web server</description>"
+    "</entry>"
+)
+
+
+def response(result):
+    """Return the response of a get whose result holds `result`."""
+    return ET.fromstring(
+        f"<response status='success'><result>{result}</result></response>"
+    )
+
+
+def test_subset_ignores_order_and_extra_children():
+    desired = ET.fromstring(
+        "<entry name='web'><tag><member>web</member></tag>"
+        "<ip-netmask>10.0.0.1/32</ip-netmask></entry>"
+    )
+    assert is_subset(desired, ET.fromstring(CURRENT))
+
+
+def test_subset_compares_tags_attributes_and_text():
+    current = ET.fromstring(CURRENT)
+    assert not is_subset(ET.fromstring("<entry name='db'/>"), current)
+    assert not is_subset(ET.fromstring("<address name='web'/>"), current)
+    assert not is_subset(
+        ET.fromstring("<entry name='web'><ip-netmask>10.0.0.2/32</ip-netmask></entry>"),
+        current,
+    )
+    assert not is_subset(
+        ET.fromstring("<entry name='web'><tag><member>dev</member></tag></entry>"),
+        current,
+    )
+    # surrounding whitespace is not a difference
+    assert is_subset(
+        ET.fromstring(
+            "<entry name='web'><description> web server\n</description></entry>"
+        ),
+        current,
+    )
+
+
+def test_compliant_when_every_entry_of_the_set_is_present():
+    result = response(
+        f"<address>{CURRENT}<entry name='db'><fqdn>db</fqdn></entry></address>"
+    )
+    assert is_compliant(result, "<entry name='db'><fqdn>db</fqdn></entry>")
+    assert is_compliant(
+        result,
+        "<entry name='db'><fqdn>db</fqdn></entry>"
+        "<entry name='web'><ip-netmask>10.0.0.1/32</ip-netmask></entry>",
+    )
+    assert not is_compliant(
+        result,
+        "<entry name='db'><fqdn>db</fqdn></entry><entry name='new'><fqdn>x</fqdn></entry>",
+    )
+    assert is_compliant(result, ET.fromstring("<entry name='db'/>"))
+
+
+def test_not_compliant_when_the_xpath_does_not_exist():
+    assert not is_compliant(response(""), "<entry name='db'/>")
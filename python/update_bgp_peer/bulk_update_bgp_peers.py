@@ -0,0 +1,625 @@
+"""Update BGP peers across many templates and virtual routers at once.
+
+Walking Template → VirtualRouter → Bgp → BgpPeerGroup → BgpPeer with a
+`refresh()` on every level, then calling `apply()` on each peer, costs
+several round trips per peer and a commit per change. This script reads a
+spec file of peer changes instead, and:
+
+1. reads the virtual routers of each template once, BGP included, fetching
+   up to `--workers` templates at once
+2. compares every peer with its spec row, and leaves peers that already
+   match alone
+3. applies every change with ``multi-config`` requests, up to `--batch`
+   operations per request, each request applied in full or not at all
+4. commits once, then pushes once: to the device groups given with
+   `--device-group`, templates included, or with `--push-templates` to every
+   template that changed
+
+The commit is limited to the changes of `PANUSER` by default; see
+`--commit-scope` to limit it further, for instance to the changed templates.
+
+With `--queue`, the changes are added to a commit queue instead of being
+applied, for `commit_scheduler.py` to commit along with those of other
+scripts.
+
+The spec is a CSV file with the columns `SPEC_HEADER`. Template,
+VirtualRouter, PeerGroup and Peer locate the peer; any other column left
+empty keeps its current value.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+  http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+(c) 2023 Calvin Remsburg
+"""
+# standard library imports
+import argparse
+import csv
+import logging
+import os
+import sys
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+# make the shared helpers in `python/common` importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.commit_queue import COMMIT_QUEUE  # noqa
+from common.commit_scope import CommitScope, add_scope_argument  # noqa
+from common.commit_scope import scope_from_args  # noqa
+from common.concurrency import DevicePool, map_bounded  # noqa
+from common.jobs import JobWatcher, start_job  # noqa
+from common.multiconfig import BatchFailed, apply_operations  # noqa
+from common.xpath import entry, find_entry  # noqa
+
+# ----------------------------------------------------------------------------
+# Load environment variables from .env file
+# ----------------------------------------------------------------------------
+if os.path.exists(".env"):
+    from dotenv import load_dotenv
+
+    load_dotenv(".env")
+PANURL = os.environ.get("PANURL", "panorama.lab")
+PANUSER = os.environ.get("PANUSER", "automation")
+PANPASS = os.environ.get("PANPASS", "mysecretpassword")
+
+# ----------------------------------------------------------------------------
+# Spec and report columns, and xpaths
+# ----------------------------------------------------------------------------
+KEY_COLUMNS = ["Template", "VirtualRouter", "PeerGroup", "Peer"]
+# columns that change a peer, with the path of their element below the peer
+FIELD_COLUMNS = [
+    ("PeerAS", "peer-as"),
+    ("PeerAddress", "peer-address/ip"),
+    ("LocalInterface", "local-address/interface"),
+    ("LocalAddress", "local-address/ip"),
+    ("Enable", "enable"),
+]
+SPEC_HEADER = KEY_COLUMNS + ["NewName"] + [column for column, _ in FIELD_COLUMNS]
+REPORT_HEADER = KEY_COLUMNS + ["Status", "Detail"]
+
+TEMPLATE_XPATH = "/config/devices/entry[@name='localhost.localdomain']/template"
+VR_XPATH = "config/devices/entry[@name='localhost.localdomain']/network/virtual-router"
+
+
+# ----------------------------------------------------------------------------
+# Functions to build xpaths and elements
+# ----------------------------------------------------------------------------
+def virtual_routers_xpath(template: str) -> str:
+    """Return the xpath of the virtual routers of a template."""
+    return f"{TEMPLATE_XPATH}/{entry(template)}/{VR_XPATH}"
+
+
+def peer_xpath(row: dict) -> str:
+    """Return the xpath of the peer a spec row is about."""
+    return (
+        f"{virtual_routers_xpath(row['Template'])}"
+        f"/{entry(row['VirtualRouter'])}/protocol/bgp"
+        f"/peer-group/{entry(row['PeerGroup'])}"
+        f"/peer/{entry(row['Peer'])}"
+    )
+
+
+def leaves(values: Dict[str, str]) -> str:
+    """
+    Build the XML of elements given by their path, nesting shared parents.
+
+    Args:
+        values: Element paths, such as ``local-address/ip``, and their text.
+
+    Returns:
+        The elements, serialized without a root.
+    """
+    root = ET.Element("root")
+    for path, value in values.items():
+        node = root
+        for tag in path.split("/"):
+            child = node.find(tag)
+            node = child if child is not None else ET.SubElement(node, tag)
+        node.text = value
+    return "".join(ET.tostring(child, encoding="unicode") for child in root)
+
+
+# ----------------------------------------------------------------------------
+# Function to read the spec file
+# ----------------------------------------------------------------------------
+def load_spec(filename: str) -> List[dict]:
+    """
+    Read the peer changes from a CSV file.
+
+    Args:
+        filename: The name of the spec file, with a header line.
+
+    Returns:
+        A dictionary per row, with every column of `SPEC_HEADER`, empty
+        when missing.
+
+    Raises:
+        ValueError: When a row lacks a key column, or a peer is listed twice.
+    """
+    with open(filename, newline="") as specfile:
+        reader = csv.DictReader(specfile)
+        unknown = set(reader.fieldnames or []) - set(SPEC_HEADER)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        rows = [
+            {column: (row.get(column) or "").strip() for column in SPEC_HEADER}
+            for row in reader
+        ]
+
+    seen = set()
+    for line, row in enumerate(rows, start=2):
+        key = tuple(row[column] for column in KEY_COLUMNS)
+        if not all(key):
+            raise ValueError(f"Line {line}: {', '.join(KEY_COLUMNS)} are required")
+        if key in seen:
+            raise ValueError(f"Line {line}: peer {'/'.join(key)} listed twice")
+        seen.add(key)
+    return rows
+
+
+# ----------------------------------------------------------------------------
+# Function to read the virtual routers of a template
+# ----------------------------------------------------------------------------
+def read_template(device, template: str):
+    """
+    Read the virtual routers of a template, with their BGP configuration.
+
+    Args:
+        device: The Panorama instance to send the request through.
+        template: The name of the template.
+
+    Returns:
+        The ``virtual-router`` element, or None when the template has none.
+    """
+    response = device.xapi.get(virtual_routers_xpath(template))
+    return response.find("./result/virtual-router")
+
+
+# ----------------------------------------------------------------------------
+# Function to plan the operations of a spec row
+# ----------------------------------------------------------------------------
+def plan_change(row: dict, virtual_routers) -> Tuple[List[Tuple], str]:
+    """
+    Compare a peer with its spec row and list the operations to apply.
+
+    Values are set with ``set``, which keeps the other elements of the
+    peer, except the peer address, which is replaced with ``edit`` so that
+    an FQDN address does not survive next to the new IP. A rename comes
+    last, as it changes the xpath of the peer.
+
+    Args:
+        row: The spec row.
+        virtual_routers: The ``virtual-router`` element of the template.
+
+    Returns:
+        The operations, as (action, xpath, element or new name) tuples,
+        empty when the peer already matches, and a description of the
+        change.
+
+    Raises:
+        LookupError: When the peer or the new name cannot be used.
+    """
+    # names come from the spec, so entries are compared by name rather than
+    # put into a path
+    router = peers = peer = None
+    if virtual_routers is not None:
+        router = find_entry(virtual_routers, row["VirtualRouter"])
+    groups = None if router is None else router.find("./protocol/bgp/peer-group")
+    group = None if groups is None else find_entry(groups, row["PeerGroup"])
+    if group is not None:
+        peers = group.find("./peer")
+    if peers is not None:
+        peer = find_entry(peers, row["Peer"])
+        # a peer renamed by an earlier run is found under its new name
+        if peer is None and row["NewName"]:
+            peer = find_entry(peers, row["NewName"])
+            row = dict(row, Peer=row["NewName"])
+    if peer is None:
+        raise LookupError("peer not found")
+
+    xpath = peer_xpath(row)
+    changes = {}
+    for column, path in FIELD_COLUMNS:
+        value = row[column]
+        if column == "Enable" and value:
+            value = "yes" if value.lower() in ("yes", "true", "1") else "no"
+        if value and (peer.findtext(path) or "") != value:
+            changes[path] = value
+
+    operations = []
+    address = changes.pop("peer-address/ip", None)
+    if changes:
+        operations.append(("set", xpath, leaves(changes)))
+    if address is not None:
+        operations.append(
+            ("edit", f"{xpath}/peer-address", leaves({"peer-address/ip": address}))
+        )
+        changes["peer-address/ip"] = address
+    if row["NewName"] and row["NewName"] != row["Peer"]:
+        if find_entry(peers, row["NewName"]) is not None:
+            raise LookupError(f"a peer named {row['NewName']} already exists")
+        operations.append(("rename", xpath, row["NewName"]))
+        changes["name"] = row["NewName"]
+
+    detail = ", ".join(f"{path}={value}" for path, value in changes.items())
+    return operations, detail
+
+
+# ----------------------------------------------------------------------------
+# Functions to commit and push
+# ----------------------------------------------------------------------------
+class PushFailed(Exception):
+    """
+    Raised when the changes were committed but a push failed.
+
+    Args:
+        error: The error of the push.
+    """
+
+    def __init__(self, error: Exception):
+        super().__init__(f"committed, but the push failed: {error}")
+        self.error = error
+
+
+def push_commands(device_groups: List[str], templates: List[str]) -> List[str]:
+    """
+    Build the commit-all commands pushing the changes to the firewalls.
+
+    Args:
+        device_groups: Device groups to push, templates included, in a
+            single commit-all.
+        templates: Templates to push, one commit-all each, when no device
+            group is given.
+
+    Returns:
+        The ``commit-all`` commands.
+    """
+    if device_groups:
+        entries = "".join(f"<entry name={quoteattr(name)}/>" for name in device_groups)
+        return [
+            "<commit-all><shared-policy>"
+            f"<device-group>{entries}</device-group>"
+            "<include-template>yes</include-template>"
+            "</shared-policy></commit-all>"
+        ]
+    return [
+        f"<commit-all><template><name>{escape(name)}</name></template></commit-all>"
+        for name in templates
+    ]
+
+
+def commit_and_push(
+    pan,
+    description: str,
+    device_groups: List[str],
+    templates: List[str],
+    timeout: float = 1800.0,
+    scope: CommitScope = CommitScope(),
+) -> List[dict]:
+    """
+    Commit the changes on Panorama, then push them to the firewalls.
+
+    Args:
+        pan: An instance of Panorama.
+        description: Description of the commit.
+        device_groups: See `push_commands`.
+        templates: See `push_commands`; nothing is pushed when both are empty.
+        timeout: Seconds the commit, and then the pushes, may take.
+        scope: The part of the candidate configuration to commit.
+
+    Returns:
+        The finished jobs, the commit first.
+
+    Raises:
+        JobFailed: When the commit failed.
+        PushFailed: When the commit finished but a push failed.
+    """
+    watcher = JobWatcher(pan, timeout=timeout)
+    logging.info(f"Starting a {scope.describe()}")
+    job_id = start_job(
+        pan, lambda: pan.commit(cmd=scope.command("panorama", description)), "Commit"
+    )
+    if job_id is None:
+        logging.info("Nothing to commit")
+        return []
+    logging.info(f"Commit job {job_id} started")
+    jobs = watcher.wait([job_id])
+
+    push_ids = []
+    try:
+        for cmd in push_commands(device_groups, templates):
+            push_ids.append(
+                start_job(
+                    pan,
+                    lambda: pan.xapi.commit(cmd=cmd, action="all").findtext(
+                        "./result/job"
+                    ),
+                    "CommitAll",
+                )
+            )
+        if push_ids:
+            logging.info(f"Push jobs {', '.join(push_ids)} started")
+            jobs += watcher.wait(push_ids)
+    except Exception as e:
+        raise PushFailed(e) from e
+    return jobs
+
+
+# ----------------------------------------------------------------------------
+# Function to queue the changes instead of applying them
+# ----------------------------------------------------------------------------
+def queue_changes(
+    args: argparse.Namespace, operations: List[List[Tuple]], results: List[dict]
+) -> None:
+    """
+    Add the change of every peer to the commit queue.
+
+    The changes are pushed the way they would be without `--queue`: to the
+    device groups given with `--device-group`, templates included, else to
+    their template with `--push-templates`, else not at all.
+
+    Args:
+        args: The parsed arguments.
+        operations: The operations of every changed peer.
+        results: The results of the same peers, updated with their change id.
+    """
+    from common.commit_queue import CommitQueue
+
+    queue = CommitQueue(args.queue)
+    push = bool(args.device_group or args.push_templates)
+    for peer_operations, result in zip(operations, results):
+        change_id = queue.enqueue(
+            PANURL,
+            [peer_operations],
+            device_groups=args.device_group,
+            templates=[result["Template"]] if push else [],
+            source="bulk_update_bgp_peers",
+        )[0]
+        result["Status"] = "queued"
+        result["Detail"] = f"change {change_id}: {result['Detail']}"
+    queue.close()
+    logging.info(f"Queued {len(operations)} peer changes in {args.queue}")
+
+
+# ----------------------------------------------------------------------------
+# Function to report a failed multi-config request
+# ----------------------------------------------------------------------------
+def report_failed_batch(error: BatchFailed, results: List[dict]) -> None:
+    """
+    Record which peers were changed when a ``multi-config`` request failed.
+
+    Nothing is committed: the peers of the earlier requests are left changed
+    in the candidate configuration, for an administrator to commit or revert.
+
+    Args:
+        error: The error raised by `apply_operations`.
+        results: The results of the changed peers, in the order of their
+            operations, updated in place.
+    """
+    applied = set(error.applied)
+    failed = set(error.batches[error.batch - 1])
+    for position, result in enumerate(results):
+        if position in applied:
+            result["Status"] = "applied"
+            result["Detail"] = f"not committed: {result['Detail']}"
+        elif position in failed:
+            result.update(Status="failed", Detail=str(error.error))
+        else:
+            result.update(Status="failed", Detail="not sent, an earlier batch failed")
+
+    logging.error(f"Applying the changes failed, {error}")
+    if applied:
+        logging.error(
+            f"Requests 1 to {error.batch - 1} were applied: {len(applied)} peers "
+            "are changed in the candidate configuration, but not committed"
+        )
+
+
+# ----------------------------------------------------------------------------
+# Function to report a failed commit or push
+# ----------------------------------------------------------------------------
+def report_failed_commit(error: Exception, results: List[dict]) -> None:
+    """
+    Record that the changed peers were not committed, or not pushed.
+
+    Args:
+        error: The error raised by `commit_and_push`.
+        results: The results of the changed peers, updated in place.
+    """
+    if isinstance(error, PushFailed):
+        status, detail = "committed", "not pushed"
+    else:
+        status, detail = "applied", "not committed"
+    for result in results:
+        result["Status"] = status
+        result["Detail"] = f"{detail}: {result['Detail']}"
+    logging.error(f"Commit or push failed: {error}")
+
+
+# ----------------------------------------------------------------------------
+# Function to save the report
+# ----------------------------------------------------------------------------
+def save_report(results: List[dict], filename: str) -> None:
+    """
+    Write the outcome of every spec row to a CSV file.
+
+    Args:
+        results: One dictionary per spec row, see `REPORT_HEADER`.
+        filename: The name of the report file.
+    """
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.DictWriter(
+            csvfile, fieldnames=REPORT_HEADER, extrasaction="ignore"
+        )
+        writer.writeheader()
+        writer.writerows(results)
+
+
+# ----------------------------------------------------------------------------
+# Main execution of our script
+# ----------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("spec", help="CSV file listing the peer changes")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="number of templates to read at once",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retries of a template read after a server error or timeout",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=500,
+        help="most operations sent in one multi-config request",
+    )
+    parser.add_argument(
+        "--device-group",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="push to this device group, templates included, in a single push",
+    )
+    parser.add_argument(
+        "--push-templates",
+        action="store_true",
+        help="push every changed template instead, one push each",
+    )
+    parser.add_argument(
+        "--description",
+        default="BGP peer updates",
+        help="description of the commit",
+    )
+    add_scope_argument(parser, "admin")
+    parser.add_argument(
+        "--commit-timeout",
+        type=float,
+        default=1800,
+        metavar="SECONDS",
+        help="time the commit and the push may each take",
+    )
+    parser.add_argument(
+        "--queue",
+        metavar="FILE",
+        nargs="?",
+        const=COMMIT_QUEUE,
+        help="add the changes to a commit queue instead of committing them",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="report the changes without applying them",
+    )
+    parser.add_argument(
+        "--report",
+        default="bgp_peer_report.csv",
+        metavar="FILE",
+        help="CSV file receiving the outcome of every spec row",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    scope = scope_from_args(parser, args, PANUSER, ["panorama"])
+
+    from common.client import ApiClient
+    from panos.panorama import Panorama
+
+    rows = load_spec(args.spec)
+    client = ApiClient(PANURL, PANUSER, PANPASS)
+    pan = client.device(Panorama)
+
+    # read the BGP configuration of each template once
+    templates = list(dict.fromkeys(row["Template"] for row in rows))
+    pool = DevicePool(pan)
+    virtual_routers = dict(
+        zip(
+            templates,
+            map_bounded(
+                lambda template: read_template(pool.get(), template),
+                templates,
+                workers=args.workers,
+                retries=args.retries,
+            ),
+        )
+    )
+    logging.info(f"Read {len(templates)} templates for {len(rows)} peers")
+
+    results = []
+    operations = []
+    changed_results = []
+    for row in rows:
+        result = dict(row)
+        try:
+            peer_operations, detail = plan_change(row, virtual_routers[row["Template"]])
+        except LookupError as e:
+            result.update(Status="failed", Detail=str(e))
+        else:
+            result.update(Status="changed" if peer_operations else "unchanged")
+            result["Detail"] = detail
+            if peer_operations:
+                operations.append(peer_operations)
+                changed_results.append(result)
+        results.append(result)
+
+    failed = [result for result in results if result["Status"] == "failed"]
+    exit_code = 1 if failed else 0
+    if args.dry_run:
+        for result in results:
+            result["Status"] = f"would be {result['Status']}"
+        logging.info(f"Dry run: {len(operations)} peers would change")
+    elif failed:
+        logging.error(f"{len(failed)} peers cannot be changed, nothing was applied")
+    elif operations and args.queue:
+        queue_changes(args, operations, changed_results)
+    elif operations:
+        try:
+            requests = apply_operations(client, operations, args.batch)
+        except BatchFailed as e:
+            report_failed_batch(e, changed_results)
+            save_report(results, args.report)
+            logging.info(f"Report saved to {args.report}")
+            return 1
+        logging.info(f"Changed {len(operations)} peers in {requests} requests")
+        templates = list(
+            dict.fromkeys(result["Template"] for result in changed_results)
+        )
+        if not args.device_group and not args.push_templates:
+            logging.info("No --device-group or --push-templates, nothing pushed")
+            templates = []
+        try:
+            commit_and_push(
+                pan,
+                args.description,
+                args.device_group,
+                templates,
+                args.commit_timeout,
+                scope,
+            )
+        except Exception as e:
+            report_failed_commit(e, changed_results)
+            exit_code = 1
+    else:
+        logging.info("Every peer already matches the spec")
+
+    save_report(results, args.report)
+    logging.info(f"Report saved to {args.report}")
+    return exit_code
+
+
+# ----------------------------------------------------------------------------
+# Execute main function
+# ----------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
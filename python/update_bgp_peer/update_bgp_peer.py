@@ -40,9 +40,41 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import argparse
+import os
+import sys
+
 from panos.panorama import Panorama, Template, PanoramaCommit, PanoramaCommitAll
 from panos.network import VirtualRouter, Bgp, BgpPeerGroup, BgpPeer
 
+# make the helpers in the `python/common` directory importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.commit_queue import COMMIT_QUEUE, CommitQueue  # noqa
+from common.commit_scope import parse_scope  # noqa
+from common.jobs import JobWatcher  # noqa
+
+# read our credentials from the `.env` file, or from the environment
+if os.path.exists(".env"):
+    from dotenv import load_dotenv
+
+    load_dotenv(".env")
+PANURL = os.environ.get("PANURL", "panorama.lab")
+PANUSER = os.environ.get("PANUSER", "automation")
+PANPASS = os.environ.get("PANPASS", "mysecretpassword")
+
+# when other scripts are changing Panorama too, pass `--queue` to hand the
+# change to the commit queue instead of applying, committing and pushing it
+# ourselves; unknown arguments are ignored, so that the lines below can also
+# be pasted into a REPL
+parser = argparse.ArgumentParser(description="Rename the ISP1 BGP peer")
+parser.add_argument(
+    "--queue",
+    metavar="FILE",
+    nargs="?",
+    const=COMMIT_QUEUE,
+    help="add the change to a commit queue instead of committing it",
+)
+args, _ = parser.parse_known_args()
 
 pan = Panorama(PANURL, PANUSER, PANPASS)
 
@@ -70,195 +102,82 @@ peer = BgpPeer("ISP1")
 pg.add(peer)
 peer.refresh()
 peer.about()
+old_xpath = peer.xpath()
 peer.name = "ATT MPLS"
-peer.apply()
-
-pan_commit = PanoramaCommit("updated fron pan-os-docker", ["automation"])
-commit_job = pan.commit(cmd=pan_commit)
-
-# create a object called 'job_complete' and set it to False for now
-job_complete = False
-
-# while the job_complete object is set to False (default), perform this task
-while not job_complete:
-    # check in on the status of our job, storing the XML byte response
-    response = pan.op(cmd=f'show jobs id "{commit_job}"', xml=True)
-    # convert the XML byte response object to a Python dictionary
-    job_as_dict = xmltodict.parse(response)
-    job = job_as_dict["response"]["result"]["job"]
-    # check in on status of commit job, report back to screen
-    if job["id"] == str(commit_job):
-        if job["type"] == "Commit":
-            if job["progress"] == "100":
-                if job["status"] == "FIN":
-                    if job["result"] == "OK":
-                        print("[DEBUG] Job Finished, 100 Percent and Results are OK")
-                        job_complete = True
-                        break
-                    else:
-                        print(
-                            "[DEBUG] Job Finished, 100 Percent and Results are not OK: %s "
-                            % job["result"]
-                        )
-                else:
-                    print(
-                        "[DEBUG] Job progress is 100 Percent but status is not FIN: %s "
-                        % job["status"]
-                    )
-            else:
-                print(
-                    "[DEBUG] Job progress is not 100 Percent yet ... %s "
-                    % job["progress"]
-                )
-        else:
-            print("[DEBUG] Job is not a COMMIT job : %s " % job["type"])
-    if not job_complete:
-        time.sleep(5)
-
-    job = job_as_dict["result"]["job"]
-
-old_peer = BgpPeer("ISP1")
-pg.add(old_peer)
-old_peer.delete()
-
-# create a commit object with our description and admin user as a list
-pan_commit = PanoramaCommit("pushed from pan-os-docker", ["automation"])
-
-# pass our commit object into the commit method of our panorama instance
-commit_job = pan.commit(cmd=pan_commit)
-
-# create a object called 'job_complete' and set it to False for now
-job_complete = False
-
-# while the job_complete object is set to False (default), perform this task
-while not job_complete:
-    # check in on the status of our job, storing the XML byte response
-    response = pan.op(cmd=f'show jobs id "{commit_job}"', xml=True)
-    # convert the XML byte response object to a Python dictionary
-    job_as_dict = xmltodict.parse(response)
-    job = job_as_dict["response"]["result"]["job"]
-    # check in on status of commit job, report back to screen
-    if job["id"] == str(commit_job):
-        if job["type"] == "Commit":
-            if job["progress"] == "100":
-                if job["status"] == "FIN":
-                    if job["result"] == "OK":
-                        print("[DEBUG] Job Finished, 100 Percent and Results are OK")
-                        job_complete = True
-                        break
-                    else:
-                        print(
-                            "[DEBUG] Job Finished, 100 Percent and Results are not OK: %s "
-                            % job["result"]
-                        )
-                else:
-                    print(
-                        "[DEBUG] Job progress is 100 Percent but status is not FIN: %s "
-                        % job["status"]
-                    )
-            else:
-                print(
-                    "[DEBUG] Job progress is not 100 Percent yet ... %s "
-                    % job["progress"]
-                )
-        else:
-            print("[DEBUG] Job is not a COMMIT job : %s " % job["type"])
-    if not job_complete:
-        time.sleep(5)
-
-    job = job_as_dict["result"]["job"]
-
-# create an empty list and beging to iterate over our device groups
-jobs = []
-for dg in ["branch", "headquarters"]:
-    # create a commit object, passing in the style and device group name
-    dg_commit = PanoramaCommitAll("device group", dg)
-    # send our commit operation to Panorama and store the job id
-    job_id = pan.commit(cmd=dg_commit)
-    # append our job id to the `jobs` list created above.
-    jobs.append(job_id)
-
-print(jobs)
-
-# create a commit object with our description and admin user as a list
-pan_commit = PanoramaCommit("pushed from pan-os-docker", ["automation"])
-
-# pass our commit object into the commit method of our panorama instance
-commit_job = pan.commit(cmd=pan_commit)
-
-# create a object called 'job_complete' and set it to False for now
-job_complete = False
-
-# while the job_complete object is set to False (default), perform this task
-while not job_complete:
-    # check in on the status of our job, storing the XML byte response
-    response = pan.op(cmd=f'show jobs id "{commit_job}"', xml=True)
-    # convert the XML byte response object to a Python dictionary
-    job_as_dict = xmltodict.parse(response)
-    job = job_as_dict["response"]["result"]["job"]
-    # check in on status of commit job, report back to screen
-    if job["id"] == str(commit_job):
-        if job["type"] == "Commit":
-            if job["progress"] == "100":
-                if job["status"] == "FIN":
-                    if job["result"] == "OK":
-                        print("[DEBUG] Job Finished, 100 Percent and Results are OK")
-                        job_complete = True
-                        break
-                    else:
-                        print(
-                            "[DEBUG] Job Finished, 100 Percent and Results are not OK: %s "
-                            % job["result"]
-                        )
-                else:
-                    print(
-                        "[DEBUG] Job progress is 100 Percent but status is not FIN: %s "
-                        % job["status"]
-                    )
-            else:
-                print(
-                    "[DEBUG] Job progress is not 100 Percent yet ... %s "
-                    % job["progress"]
-                )
-        else:
-            print("[DEBUG] Job is not a COMMIT job : %s " % job["type"])
-    if not job_complete:
-        time.sleep(5)
-
-    job = job_as_dict["result"]["job"]
-
-# create an empty list and beging to iterate over our device groups
-jobs = []
-for dg in ["branch", "headquarters"]:
-    # create a commit object, passing in the style and device group name
-    dg_commit = PanoramaCommitAll("device group", dg)
-    # send our commit operation to Panorama and store the job id
-    job_id = pan.commit(cmd=dg_commit)
-    # append our job id to the `jobs` list created above.
-    jobs.append(job_id)
-
-print(jobs)
-
-# create an empty list and beging to iterate over our device groups
-jobs = []
-for dg in ["branch", "headquarters"]:
-    # create a commit object, passing in the style and device group name
-    dg_commit = PanoramaCommitAll("device group", dg)
-    # send our commit operation to Panorama and store the job id
-    job_id = pan.commit(cmd=dg_commit)
-    # append our job id to the `jobs` list created above.
-    jobs.append(job_id)
 
-print(jobs)
-response = pan.op(cmd=f'show jobs id "{jobs[0]}"', xml=True)
-job_as_dict = xmltodict.parse(response)
-job = job_as_dict["response"]["result"]["job"]
-job
-response = pan.op(cmd=f'show jobs id "{jobs[0]}"', xml=True)
-job_as_dict = xmltodict.parse(response)
-job = job_as_dict["response"]["result"]["job"]
-job
-response = pan.op(cmd=f'show jobs id "{jobs[1]}"', xml=True)
-job_as_dict = xmltodict.parse(response)
-job = job_as_dict["response"]["result"]["job"]
-job
+if args.queue:
+    # the `commit_scheduler.py` script commits every queued change at once,
+    # and pushes each device group once; the change renames the peer by
+    # adding the new entry and deleting the old one, in the same batch
+    queue = CommitQueue(args.queue)
+    change_ids = queue.enqueue(
+        PANURL,
+        [
+            [
+                ("edit", peer.xpath(), peer.element_str().decode()),
+                ("delete", old_xpath, None),
+            ]
+        ],
+        device_groups=["branch", "headquarters"],
+        templates=["BaseTemplate"],
+        source="update_bgp_peer",
+    )
+
+    # the outcome of the change is recorded in the queue once it was pushed
+    print(queue.status(change_ids))
+else:
+    peer.apply()
+
+    # commit only the changes of the `automation` admin to our template; the
+    # pending edits of other admins and locations are left alone, and a partial
+    # commit finishes much faster than a full one on a large Panorama
+    pan_commit = PanoramaCommit(
+        "updated fron pan-os-docker", ["automation"], templates=["BaseTemplate"]
+    )
+    commit_job = pan.commit(cmd=pan_commit)
+
+    # create a watcher to track our jobs; it polls Panorama with a single
+    # `show jobs all` request no matter how many jobs it is tracking, and waits
+    # longer between polls while a job is not making any progress
+    watcher = JobWatcher(pan)
+
+    # block until the commit has finished; a failed commit raises `JobFailed`
+    # with the job details, and a commit that takes too long raises `JobTimeout`
+    job = watcher.wait([commit_job])[0]
+    print(f"[DEBUG] Job {job['id']} finished with result {job['result']}")
+
+    old_peer = BgpPeer("ISP1")
+    pg.add(old_peer)
+    old_peer.delete()
+
+    # create a commit object with our description, limited to the changes of our
+    # admin user; `parse_scope` builds it from the terms the scripts of this
+    # repository accept with `--commit-scope`
+    pan_commit = parse_scope(["admin=automation"]).command(
+        "panorama", "pushed from pan-os-docker"
+    )
+
+    # pass our commit object into the commit method of our panorama instance
+    commit_job = pan.commit(cmd=pan_commit)
+
+    # wait for the commit; we can also be called back once it is done
+    watcher.watch(commit_job, callback=lambda future: print(future.result()["result"]))
+    watcher.wait([commit_job])
+
+    # create an empty list and beging to iterate over our device groups
+    jobs = []
+    for dg in ["branch", "headquarters"]:
+        # create a commit object, passing in the style and device group name
+        dg_commit = PanoramaCommitAll("device group", dg)
+        # send our commit operation to Panorama and store the job id
+        job_id = pan.commit(cmd=dg_commit)
+        # append our job id to the `jobs` list created above.
+        jobs.append(job_id)
+
+    print(jobs)
+
+    # wait for both pushes at once; the jobs are polled together, so this takes
+    # as long as the slowest push rather than the sum of both
+    for job in watcher.wait(jobs):
+        for device in job["devices"]:
+            print(f"[DEBUG] {device.get('devicename')}: {device.get('result')}")